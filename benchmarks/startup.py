@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measures how long it takes to import py_cgad.githubapp and construct a GitHubApp
+
+The import is timed in a fresh interpreter with python -X importtime, the
+modules with the largest cumulative import time are listed. Construction is
+timed in this process once the module has been imported.
+
+python benchmarks/startup.py --top 10 --repeat 1000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importTimes(module):
+    """Returns a list of (cumulative us, self us, module) of a fresh import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE,
+        check=True,
+        cwd=REPO_DIR,
+    )
+    times = []
+    for line in result.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        try:
+            times.append((int(cumulative_us), int(self_us), name.strip()))
+        except ValueError:
+            # The header line
+            continue
+    return times
+
+
+def constructTime(repeat):
+    """Returns the mean number of seconds taken to construct a GitHubApp."""
+    sys.path.insert(0, REPO_DIR)
+    from py_cgad.githubapp import GitHubApp
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        total = timeit.timeit(
+            lambda: GitHubApp(1, "bench", "lanl", "Py-CGAD", config_dir=config_dir),
+            number=repeat,
+        )
+    return total / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="py_cgad.githubapp")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    times = importTimes(args.module)
+    total = [entry for entry in times if entry[2] == args.module][0][0]
+    print("import %s: %.1f ms" % (args.module, total / 1000.0))
+    for cumulative_us, self_us, name in sorted(times, reverse=True)[1 : args.top + 1]:
+        print(
+            "  %-40s %8.1f ms %8.1f ms self"
+            % (name, cumulative_us / 1000.0, self_us / 1000.0)
+        )
+    print("GitHubApp(): %.1f us" % (constructTime(args.repeat) * 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
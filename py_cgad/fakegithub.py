@@ -0,0 +1,913 @@
+#!/usr/bin/env python3
+
+import base64
+import collections
+import datetime
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+
+from .instrumentation import endpointTemplate
+from .transport import Transport
+
+_STATES = ["pending", "failure", "error", "success"]
+_ANNOTATION_LEVELS = ["notice", "warning", "failure"]
+_MAX_ANNOTATIONS = 50
+
+_CONTENT_TYPES = {
+    "100644": "file",
+    "100755": "file",
+    "120000": "symlink",
+    "040000": "dir",
+    "160000": "submodule",
+}
+
+
+def _gitSha(object_type, data):
+    header = ("%s %d\0" % (object_type, len(data))).encode("utf-8")
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def _requestHeader(header, name):
+    """Returns the value of a header in a list of "Name: value" strings."""
+    for line in header:
+        key, _, value = line.partition(":")
+        if key.strip().lower() == name:
+            return value.strip()
+    return ""
+
+
+class _FakeResponse(Exception):
+    """Raised by a route to return an error response."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class FakeRepo:
+    """
+    An in memory github repository
+
+    Git objects are stored using the same shas git would give them, so blob
+    shas can be compared with those of local files. The contents of the repo
+    can be seeded with commitFiles.
+    """
+
+    def __init__(self, github, user, name, default_branch="master"):
+        self._github = github
+        self.user = user
+        self.name = name
+        self.default_branch = default_branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        self.pulls = []
+        self.statuses = {}
+        self.check_runs = {}
+        self.releases = []
+        self._asset_count = 0
+        self._commit_count = 0
+        self._status_count = 0
+        tree_sha = self._storeTree({})
+        self.refs[default_branch] = self._storeCommit(tree_sha, [], "Initial commit")
+
+    # Object store
+
+    def _storeBlob(self, data):
+        sha = _gitSha("blob", data)
+        self.blobs[sha] = data
+        return sha
+
+    def _storeTree(self, entries):
+        def sortKey(name):
+            return name + "/" if entries[name][1] == "tree" else name
+
+        data = b""
+        for name in sorted(entries, key=sortKey):
+            mode, _, sha = entries[name]
+            data += (mode.lstrip("0") + " " + name).encode("utf-8") + b"\0"
+            data += bytes.fromhex(sha)
+        sha = _gitSha("tree", data)
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def _storeCommit(self, tree_sha, parents, message):
+        # A counter is included so identical commits still get unique shas
+        self._commit_count += 1
+        data = "tree %s\n%s\ncount %d\n\n%s" % (
+            tree_sha,
+            "".join("parent %s\n" % parent for parent in parents),
+            self._commit_count,
+            message,
+        )
+        sha = _gitSha("commit", data.encode("utf-8"))
+        self.commits[sha] = {
+            "sha": sha,
+            "tree": tree_sha,
+            "parents": list(parents),
+            "message": message,
+        }
+        return sha
+
+    def _applyChanges(self, tree_sha, changes):
+        """
+        Returns the sha of tree_sha with changes applied
+
+        changes maps paths to a (mode, type, sha) entry or None to remove the
+        path, directories left empty are removed.
+        """
+        entries = dict(self.trees[tree_sha]) if tree_sha is not None else {}
+        nested = {}
+        for path, entry in changes.items():
+            name, sep, rest = path.partition("/")
+            if sep:
+                nested.setdefault(name, {})[rest] = entry
+            elif entry is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = entry
+        for name, sub_changes in nested.items():
+            current = entries.get(name)
+            sub_tree = (
+                current[2] if current is not None and current[1] == "tree" else None
+            )
+            new_sha = self._applyChanges(sub_tree, sub_changes)
+            if self.trees[new_sha]:
+                entries[name] = ("040000", "tree", new_sha)
+            else:
+                entries.pop(name, None)
+        return self._storeTree(entries)
+
+    def _resolveRef(self, ref):
+        """Returns the commit sha of a branch name or commit sha."""
+        if ref is None:
+            ref = self.default_branch
+        if ref in self.refs:
+            return self.refs[ref]
+        if ref in self.commits:
+            return ref
+        raise _FakeResponse(404, "No commit found for the ref " + ref)
+
+    def _entry(self, commit_sha, path):
+        """Returns the (mode, type, sha) of path or None if it does not exist."""
+        entry = ("040000", "tree", self.commits[commit_sha]["tree"])
+        for comp in [comp for comp in path.split("/") if comp != ""]:
+            if entry[1] != "tree":
+                return None
+            entry = self.trees[entry[2]].get(comp)
+            if entry is None:
+                return None
+        return entry
+
+    def _isAncestor(self, ancestor, commit_sha):
+        pending = [commit_sha]
+        seen = set()
+        while pending:
+            sha = pending.pop()
+            if sha == ancestor:
+                return True
+            if sha in seen:
+                continue
+            seen.add(sha)
+            pending.extend(self.commits[sha]["parents"])
+        return False
+
+    def _commitChanges(self, branch, changes, message):
+        parent = self._resolveRef(branch)
+        tree_sha = self._applyChanges(self.commits[parent]["tree"], changes)
+        commit_sha = self._storeCommit(tree_sha, [parent], message)
+        self.refs[branch] = commit_sha
+        return commit_sha
+
+    # Helpers used to set up and inspect the repository
+
+    def commitFiles(self, files, branch=None, message="Adding files"):
+        """
+        Commit files to branch and return the commit sha
+
+        files maps paths to their contents as str or bytes, a value of None
+        removes the path. The branch is created from the default branch if it
+        does not exist.
+        """
+        if branch is None:
+            branch = self.default_branch
+        with self._github._lock:
+            if branch not in self.refs:
+                self.refs[branch] = self.refs[self.default_branch]
+            changes = {}
+            for path, content in files.items():
+                if content is None:
+                    changes[path] = None
+                    continue
+                if isinstance(content, str):
+                    content = content.encode("utf-8")
+                changes[path] = ("100644", "blob", self._storeBlob(content))
+            return self._commitChanges(branch, changes, message)
+
+    def readFile(self, path, ref=None):
+        """Returns the contents of the file at path or None if it is missing."""
+        with self._github._lock:
+            entry = self._entry(self._resolveRef(ref), path)
+        if entry is None or entry[1] != "blob":
+            return None
+        return self.blobs[entry[2]]
+
+    def files(self, ref=None):
+        """Returns a dict mapping the path of every file to its blob sha."""
+        with self._github._lock:
+            commit_sha = self._resolveRef(ref)
+            found = {}
+            pending = [("", self.commits[commit_sha]["tree"])]
+            while pending:
+                prefix, tree_sha = pending.pop()
+                for name, (_, object_type, sha) in self.trees[tree_sha].items():
+                    if object_type == "tree":
+                        pending.append((prefix + name + "/", sha))
+                    else:
+                        found[prefix + name] = sha
+        return found
+
+    def createPullRequest(self, head, base=None, title=""):
+        """Open a pull request merging head into base and return it."""
+        with self._github._lock:
+            return self._createPull(head, base, title)
+
+    def _createPull(self, head, base, title):
+        if base is None:
+            base = self.default_branch
+        if head not in self.refs or base not in self.refs:
+            raise _FakeResponse(422, "Validation Failed")
+        pull = {
+            "number": len(self.pulls) + 1,
+            "state": "open",
+            "title": title,
+            "head": {
+                "label": self.user + ":" + head,
+                "ref": head,
+                "sha": self.refs[head],
+            },
+            "base": {
+                "label": self.user + ":" + base,
+                "ref": base,
+                "sha": self.refs[base],
+            },
+        }
+        self.pulls.append(pull)
+        return pull
+
+    # Json representations
+
+    def _commitJson(self, sha):
+        commit = self.commits[sha]
+        return {
+            "sha": sha,
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"]},
+            "parents": [{"sha": parent} for parent in commit["parents"]],
+        }
+
+    def _contentJson(self, path, entry, include_content=False):
+        mode, object_type, sha = entry
+        js_obj = {
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": sha,
+            "size": len(self.blobs[sha]) if object_type == "blob" else 0,
+            "type": _CONTENT_TYPES.get(mode, "file"),
+        }
+        if include_content and object_type == "blob":
+            js_obj["encoding"] = "base64"
+            js_obj["content"] = base64.b64encode(self.blobs[sha]).decode("ascii")
+        return js_obj
+
+    def _branchJson(self, branch):
+        return {"name": branch, "commit": {"sha": self.refs[branch]}}
+
+    def _refJson(self, branch):
+        return {
+            "ref": "refs/heads/" + branch,
+            "object": {"sha": self.refs[branch], "type": "commit"},
+        }
+
+    # Routes
+
+    def handle(self, method, path, query, data):
+        """Returns the status and json response of a request to the repo api."""
+        if path == "":
+            if method == "GET":
+                return 200, {
+                    "name": self.name,
+                    "full_name": self.user + "/" + self.name,
+                    "default_branch": self.default_branch,
+                }
+        elif path == "branches":
+            if method == "GET":
+                return 200, self._listBranches(query)
+        elif path.startswith("branches/"):
+            branch = path[len("branches/") :]
+            if method == "GET" and branch in self.refs:
+                return 200, self._branchJson(branch)
+        elif path == "pulls":
+            if method == "GET":
+                state = query.get("state", "open")
+                return 200, [
+                    pull for pull in self.pulls if state in ["all", pull["state"]]
+                ]
+            if method == "POST":
+                return 201, self._createPull(
+                    data.get("head"), data.get("base"), data.get("title", "")
+                )
+        elif path == "contents" or path.startswith("contents/"):
+            file_path = path[len("contents/") :] if "/" in path else ""
+            if method == "GET":
+                return self._getContents(file_path, query.get("ref"))
+            if method == "PUT":
+                return self._putContents(file_path, data)
+            if method == "DELETE":
+                return self._deleteContents(file_path, data)
+        elif path.startswith("git/"):
+            return self._handleGit(method, path[len("git/") :], query, data)
+        elif path.startswith("statuses/"):
+            if method == "POST":
+                return self._postStatus(path[len("statuses/") :], data)
+        elif path.startswith("commits/") and path.endswith("/statuses"):
+            if method == "GET":
+                sha = self._resolveRef(path[len("commits/") : -len("/statuses")])
+                return 200, list(self.statuses.get(sha, []))
+        elif path.startswith("commits/") and path.endswith("/status"):
+            if method == "GET":
+                sha = self._resolveRef(path[len("commits/") : -len("/status")])
+                return 200, self._combinedStatus(sha, query)
+        elif path == "releases" or path.startswith("releases/"):
+            return self._handleReleases(method, path[len("releases/") :], query, data)
+        elif path == "check-runs":
+            if method == "POST":
+                return self._createCheckRun(data)
+        elif path.startswith("check-runs/"):
+            check_run_id, _, sub_path = path[len("check-runs/") :].partition("/")
+            check_run = self.check_runs.get(int(check_run_id))
+            if check_run is not None and sub_path == "":
+                if method == "GET":
+                    return 200, self._checkRunJson(check_run)
+                if method == "PATCH":
+                    return self._updateCheckRun(check_run, data)
+            if check_run is not None and sub_path == "annotations":
+                if method == "GET":
+                    per_page = int(query.get("per_page", 30))
+                    start = (int(query.get("page", 1)) - 1) * per_page
+                    return 200, check_run["annotations"][start : start + per_page]
+        raise _FakeResponse(404, "Not Found")
+
+    def _listBranches(self, query):
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        branches = sorted(self.refs)
+        start = (page - 1) * per_page
+        return [
+            self._branchJson(branch) for branch in branches[start : start + per_page]
+        ]
+
+    def _getContents(self, path, ref):
+        commit_sha = self._resolveRef(ref)
+        path = path.strip("/")
+        entry = self._entry(commit_sha, path)
+        if entry is None:
+            raise _FakeResponse(404, "Not Found")
+        if entry[1] == "tree":
+            prefix = path + "/" if path else ""
+            return 200, [
+                self._contentJson(prefix + name, sub_entry)
+                for name, sub_entry in sorted(self.trees[entry[2]].items())
+            ]
+        return 200, self._contentJson(path, entry, include_content=True)
+
+    def _contentsCommitResponse(self, branch, path, commit_sha):
+        entry = self._entry(commit_sha, path)
+        return {
+            "content": self._contentJson(path, entry) if entry is not None else None,
+            "commit": self._commitJson(commit_sha),
+        }
+
+    def _putContents(self, path, data):
+        branch = data.get("branch", self.default_branch)
+        if branch not in self.refs:
+            raise _FakeResponse(404, "Branch " + branch + " not found")
+        if "content" not in data or "message" not in data:
+            raise _FakeResponse(
+                422, "Invalid request, content and message are required"
+            )
+        current = self._entry(self.refs[branch], path)
+        if current is not None:
+            if current[1] == "tree":
+                raise _FakeResponse(422, "Path is a directory")
+            if "sha" not in data:
+                raise _FakeResponse(422, 'Invalid request, "sha" wasn\'t supplied.')
+            if data["sha"] != current[2]:
+                raise _FakeResponse(409, path + " does not match " + data["sha"])
+        blob_sha = self._storeBlob(base64.b64decode(data["content"]))
+        commit_sha = self._commitChanges(
+            branch, {path: ("100644", "blob", blob_sha)}, data["message"]
+        )
+        status = 200 if current is not None else 201
+        return status, self._contentsCommitResponse(branch, path, commit_sha)
+
+    def _deleteContents(self, path, data):
+        branch = data.get("branch", self.default_branch)
+        if branch not in self.refs:
+            raise _FakeResponse(404, "Branch " + branch + " not found")
+        current = self._entry(self.refs[branch], path)
+        if current is None or current[1] == "tree":
+            raise _FakeResponse(404, "Not Found")
+        if "sha" not in data:
+            raise _FakeResponse(422, 'Invalid request, "sha" wasn\'t supplied.')
+        if data["sha"] != current[2]:
+            raise _FakeResponse(409, path + " does not match " + data["sha"])
+        commit_sha = self._commitChanges(branch, {path: None}, data.get("message", ""))
+        return 200, self._contentsCommitResponse(branch, path, commit_sha)
+
+    def _handleGit(self, method, path, query, data):
+        if path.startswith("ref/heads/") or (
+            path.startswith("refs/heads/") and method == "GET"
+        ):
+            branch = path.split("/", 2)[2]
+            if method == "GET" and branch in self.refs:
+                return 200, self._refJson(branch)
+        elif path.startswith("refs/heads/") and method == "PATCH":
+            return self._updateRef(path[len("refs/heads/") :], data)
+        elif path == "refs" and method == "POST":
+            ref = data.get("ref", "")
+            if not ref.startswith("refs/heads/"):
+                raise _FakeResponse(422, "Reference name must start with refs/heads")
+            branch = ref[len("refs/heads/") :]
+            if branch in self.refs:
+                raise _FakeResponse(422, "Reference already exists")
+            if data.get("sha") not in self.commits:
+                raise _FakeResponse(422, "Object does not exist")
+            self.refs[branch] = data["sha"]
+            return 201, self._refJson(branch)
+        elif path == "blobs" and method == "POST":
+            if data.get("encoding", "utf-8") == "base64":
+                content = base64.b64decode(data["content"])
+            else:
+                content = data["content"].encode("utf-8")
+            return 201, {"sha": self._storeBlob(content), "size": len(content)}
+        elif path.startswith("blobs/") and method == "GET":
+            sha = path[len("blobs/") :]
+            if sha in self.blobs:
+                return 200, {
+                    "sha": sha,
+                    "size": len(self.blobs[sha]),
+                    "encoding": "base64",
+                    "content": base64.b64encode(self.blobs[sha]).decode("ascii"),
+                }
+        elif path == "trees" and method == "POST":
+            return 201, self._createTree(data)
+        elif path.startswith("trees/") and method == "GET":
+            sha = path[len("trees/") :]
+            if sha in self.trees:
+                return 200, self._treeJson(sha, query.get("recursive") is not None)
+        elif path == "commits" and method == "POST":
+            if data.get("tree") not in self.trees:
+                raise _FakeResponse(422, "Tree does not exist")
+            for parent in data.get("parents", []):
+                if parent not in self.commits:
+                    raise _FakeResponse(422, "Parent does not exist")
+            sha = self._storeCommit(
+                data["tree"], data.get("parents", []), data.get("message", "")
+            )
+            return 201, self._commitJson(sha)
+        elif path.startswith("commits/") and method == "GET":
+            sha = path[len("commits/") :]
+            if sha in self.commits:
+                return 200, self._commitJson(sha)
+        raise _FakeResponse(404, "Not Found")
+
+    def _updateRef(self, branch, data):
+        if branch not in self.refs:
+            raise _FakeResponse(422, "Reference does not exist")
+        sha = data.get("sha")
+        if sha not in self.commits:
+            raise _FakeResponse(422, "Object does not exist")
+        if not data.get("force", False) and not self._isAncestor(
+            self.refs[branch], sha
+        ):
+            raise _FakeResponse(422, "Update is not a fast forward")
+        self.refs[branch] = sha
+        return 200, self._refJson(branch)
+
+    def _createTree(self, data):
+        base_tree = data.get("base_tree")
+        if base_tree is not None and base_tree not in self.trees:
+            raise _FakeResponse(422, "Base tree does not exist")
+        changes = {}
+        for entry in data.get("tree", []):
+            object_type = entry.get("type", "blob")
+            if "content" in entry:
+                sha = self._storeBlob(entry["content"].encode("utf-8"))
+            else:
+                sha = entry.get("sha")
+            if sha is None:
+                changes[entry["path"]] = None
+                continue
+            if sha not in self.blobs and sha not in self.trees:
+                raise _FakeResponse(422, "Object " + sha + " does not exist")
+            changes[entry["path"]] = (entry.get("mode", "100644"), object_type, sha)
+        return self._treeJson(self._applyChanges(base_tree, changes), False)
+
+    def _treeJson(self, sha, recursive):
+        entries = []
+        pending = [("", sha)]
+        while pending:
+            prefix, tree_sha = pending.pop(0)
+            for name, (mode, object_type, entry_sha) in sorted(
+                self.trees[tree_sha].items()
+            ):
+                entries.append(
+                    {
+                        "path": prefix + name,
+                        "mode": mode,
+                        "type": object_type,
+                        "sha": entry_sha,
+                    }
+                )
+                if recursive and object_type == "tree":
+                    pending.append((prefix + name + "/", entry_sha))
+        limit = self._github.max_tree_entries
+        if recursive and limit is not None and len(entries) > limit:
+            # Like github, large recursive listings are cut short
+            return {"sha": sha, "tree": entries[:limit], "truncated": True}
+        return {"sha": sha, "tree": entries, "truncated": False}
+
+    def _postStatus(self, ref, data):
+        if ref not in self.commits:
+            raise _FakeResponse(422, "No commit found for SHA: " + ref)
+        if data.get("state") not in _STATES:
+            raise _FakeResponse(422, "Validation Failed")
+        self._status_count += 1
+        timestamp = self._github._timestamp()
+        status = {
+            "id": self._status_count,
+            "state": data["state"],
+            "context": data.get("context", "default"),
+            "description": data.get("description"),
+            "target_url": data.get("target_url"),
+            "created_at": timestamp,
+            "updated_at": timestamp,
+        }
+        # Statuses are listed newest first
+        self.statuses.setdefault(ref, []).insert(0, status)
+        return 201, status
+
+    def _handleReleases(self, method, path, query, data):
+        if path == "":
+            if method == "GET":
+                return 200, [self._releaseJson(release) for release in self.releases]
+            if method == "POST":
+                return self._createRelease(data)
+        elif path.startswith("tags/") and method == "GET":
+            for release in self.releases:
+                if release["tag_name"] == path[len("tags/") :]:
+                    return 200, self._releaseJson(release)
+        elif path.startswith("assets/"):
+            asset_id = int(path[len("assets/") :])
+            for release in self.releases:
+                for asset in release["assets"]:
+                    if asset["id"] == asset_id and method == "GET":
+                        return 200, self._assetJson(asset)
+                    if asset["id"] == asset_id and method == "DELETE":
+                        release["assets"].remove(asset)
+                        return 204, None
+                    if asset["id"] == asset_id and method == "PATCH":
+                        return self._updateAsset(release, asset, data)
+        else:
+            release_id, _, sub_path = path.partition("/")
+            for release in self.releases:
+                if str(release["id"]) != release_id:
+                    continue
+                if sub_path == "" and method == "GET":
+                    return 200, self._releaseJson(release)
+                if sub_path == "assets" and method == "GET":
+                    per_page = int(query.get("per_page", 30))
+                    start = (int(query.get("page", 1)) - 1) * per_page
+                    assets = release["assets"][start : start + per_page]
+                    return 200, [self._assetJson(asset) for asset in assets]
+                if sub_path == "assets" and method == "POST":
+                    return self._uploadAsset(release, query, data)
+        raise _FakeResponse(404, "Not Found")
+
+    def _createRelease(self, data):
+        tag = data.get("tag_name")
+        if not tag or any(r["tag_name"] == tag for r in self.releases):
+            raise _FakeResponse(422, "Validation Failed")
+        release = {
+            "id": len(self.releases) + 1,
+            "tag_name": tag,
+            "name": data.get("name", tag),
+            "body": data.get("body"),
+            "target_commitish": data.get("target_commitish", self.default_branch),
+            "draft": data.get("draft", False),
+            "prerelease": data.get("prerelease", False),
+            "created_at": self._github._timestamp(),
+            "assets": [],
+        }
+        self.releases.append(release)
+        return 201, self._releaseJson(release)
+
+    def _uploadAsset(self, release, query, data):
+        """Uploads are sent to the uploads host with the raw file as the body."""
+        name = query.get("name")
+        if not name or not isinstance(data, bytes):
+            raise _FakeResponse(422, "Validation Failed")
+        if any(asset["name"] == name for asset in release["assets"]):
+            raise _FakeResponse(422, "Asset with the same name already exists")
+        self._asset_count += 1
+        asset = {
+            "id": self._asset_count,
+            "name": name,
+            "label": query.get("label", ""),
+            "state": "uploaded",
+            "content": data,
+            "created_at": self._github._timestamp(),
+        }
+        asset["updated_at"] = asset["created_at"]
+        release["assets"].append(asset)
+        return 201, self._assetJson(asset)
+
+    def _updateAsset(self, release, asset, data):
+        name = data.get("name", asset["name"])
+        if any(a["name"] == name and a is not asset for a in release["assets"]):
+            raise _FakeResponse(422, "Asset with the same name already exists")
+        asset["name"] = name
+        asset["label"] = data.get("label", asset["label"])
+        asset["updated_at"] = self._github._timestamp()
+        return 200, self._assetJson(asset)
+
+    def _assetJson(self, asset):
+        js_obj = {key: value for key, value in asset.items() if key != "content"}
+        js_obj["size"] = len(asset["content"])
+        if self._github.asset_digests:
+            digest = hashlib.sha256(asset["content"]).hexdigest()
+            js_obj["digest"] = "sha256:" + digest
+        js_obj["browser_download_url"] = "%s/%s/%s/releases/download/%s/%s" % (
+            self._github._web_url,
+            self.user,
+            self.name,
+            self._assetRelease(asset)["tag_name"],
+            asset["name"],
+        )
+        return js_obj
+
+    def _assetRelease(self, asset):
+        for release in self.releases:
+            if asset in release["assets"]:
+                return release
+
+    def _releaseJson(self, release):
+        js_obj = {key: value for key, value in release.items() if key != "assets"}
+        js_obj["assets"] = [self._assetJson(asset) for asset in release["assets"]]
+        js_obj["upload_url"] = "%s/repos/%s/%s/releases/%d/assets{?name,label}" % (
+            self._github._uploads_url,
+            self.user,
+            self.name,
+            release["id"],
+        )
+        return js_obj
+
+    def _createCheckRun(self, data):
+        if data.get("head_sha") not in self.commits or not data.get("name"):
+            raise _FakeResponse(422, "Validation Failed")
+        check_run = {
+            "id": len(self.check_runs) + 1,
+            "name": data["name"],
+            "head_sha": data["head_sha"],
+            "status": "queued",
+            "conclusion": None,
+            "started_at": self._github._timestamp(),
+            "completed_at": None,
+            "output": {"title": None, "summary": None, "text": None},
+            "annotations": [],
+        }
+        self.check_runs[check_run["id"]] = check_run
+        return self._updateCheckRun(check_run, data, 201)
+
+    def _updateCheckRun(self, check_run, data, status=200):
+        output = data.get("output", {})
+        annotations = output.get("annotations", [])
+        if len(annotations) > _MAX_ANNOTATIONS:
+            raise _FakeResponse(422, "Only 50 annotations can be sent per request")
+        for annotation in annotations:
+            if annotation.get("annotation_level") not in _ANNOTATION_LEVELS or any(
+                key not in annotation
+                for key in ["path", "start_line", "end_line", "message"]
+            ):
+                raise _FakeResponse(422, "Validation Failed")
+        if annotations and not (output.get("title") and output.get("summary")):
+            raise _FakeResponse(422, "Output requires a title and summary")
+        # Annotations are appended, the rest of the output is replaced
+        check_run["annotations"].extend(annotations)
+        for key in ["title", "summary", "text"]:
+            if key in output:
+                check_run["output"][key] = output[key]
+        for key in ["details_url", "external_id"]:
+            if key in data:
+                check_run[key] = data[key]
+        if "status" in data:
+            check_run["status"] = data["status"]
+        if "conclusion" in data:
+            check_run["status"] = "completed"
+            check_run["conclusion"] = data["conclusion"]
+        if check_run["status"] == "completed" and check_run["completed_at"] is None:
+            check_run["completed_at"] = self._github._timestamp()
+        return status, self._checkRunJson(check_run)
+
+    def _checkRunJson(self, check_run):
+        js_obj = {
+            key: value for key, value in check_run.items() if key != "annotations"
+        }
+        js_obj["output"] = dict(
+            check_run["output"], annotations_count=len(check_run["annotations"])
+        )
+        return js_obj
+
+    def _combinedStatus(self, sha, query):
+        latest = {}
+        for status in self.statuses.get(sha, []):
+            latest.setdefault(status["context"], status)
+        states = [status["state"] for status in latest.values()]
+        if any(state in ["failure", "error"] for state in states):
+            state = "failure"
+        elif not states or "pending" in states:
+            state = "pending"
+        else:
+            state = "success"
+        per_page = int(query.get("per_page", 30))
+        start = (int(query.get("page", 1)) - 1) * per_page
+        return {
+            "state": state,
+            "sha": sha,
+            "total_count": len(latest),
+            "statuses": list(latest.values())[start : start + per_page],
+        }
+
+
+class FakeGitHub(Transport):
+    """
+    An in process stand in for the github api
+
+    FakeGitHub is a transport, so passing it to a GitHubApp makes the app
+    talk to in memory repositories instead of the network. It models
+    branches, git objects, the contents api, statuses, check runs, releases
+    and pull requests well enough to test bots and benchmark them without rate limits.
+
+    github = FakeGitHub()
+    repo = github.createRepo("lanl", "Py-CGAD")
+    repo.commitFiles({"README.md": "# Py-CGAD"})
+    app = GitHubApp(app_id, "bot", "lanl", "Py-CGAD", transport=github)
+
+    GET responses carry an ETag and conditional requests that match it get
+    an empty 304 response. Blobs and file contents are returned raw when
+    requested with the application/vnd.github.raw media type. Recursive tree
+    listings are truncated beyond max_tree_entries. failNext can be used to
+    make requests fail, and a latency can be added to every request to
+    approximate a real server.
+    """
+
+    def __init__(self, base_url="https://api.github.com", latency=0.0):
+        split_url = urllib.parse.urlsplit(base_url)
+        self._base_path = split_url.path.rstrip("/")
+        if self._base_path:
+            # Enterprise servers take uploads and serve pages on the same host
+            self._web_url = split_url.scheme + "://" + split_url.netloc
+            self._uploads_url = self._web_url + "/api/uploads"
+        else:
+            self._web_url = "https://github.com"
+            self._uploads_url = "https://uploads.github.com"
+        self._latency = latency
+        self._lock = threading.RLock()
+        self._repos = {}
+        self._failures = collections.deque()
+        self._clock = datetime.datetime(2021, 1, 1)
+        self.requests = collections.Counter()
+        self.rate_limit = 5000
+        self.rate_limit_reset = 0
+        # Recursive tree listings with more entries are truncated
+        self.max_tree_entries = None
+        # Older servers do not report the sha256 of release assets
+        self.asset_digests = True
+        self._used = 0
+
+    def createRepo(self, user, name, default_branch="master"):
+        with self._lock:
+            repo = FakeRepo(self, user, name, default_branch)
+            self._repos[(user, name)] = repo
+            return repo
+
+    def repo(self, user, name):
+        return self._repos[(user, name)]
+
+    def failNext(self, count=1, status=502):
+        """Make the next count requests fail with status."""
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def _timestamp(self):
+        self._clock += datetime.timedelta(seconds=1)
+        return self._clock.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def _rateLimitHeaders(self):
+        self._used += 1
+        return {
+            "x-ratelimit-limit": str(self.rate_limit),
+            "x-ratelimit-remaining": str(max(self.rate_limit - self._used, 0)),
+            "x-ratelimit-used": str(self._used),
+            "x-ratelimit-reset": str(int(self.rate_limit_reset)),
+            "x-ratelimit-resource": "core",
+        }
+
+    def _route(self, method, path, query, data):
+        if path == "/app/installations" and method == "GET":
+            return 200, [
+                {"id": 1, "html_url": "https://github.com/settings/installations/1"}
+            ]
+        if path.startswith("/app/installations/") and path.endswith("/access_tokens"):
+            if method == "POST":
+                return 201, {"token": "fake-token", "expires_at": self._timestamp()}
+        if path.startswith("/repos/"):
+            components = path[len("/repos/") :].split("/", 2)
+            if len(components) >= 2:
+                repo = self._repos.get((components[0], components[1]))
+                if repo is not None:
+                    sub_path = components[2] if len(components) == 3 else ""
+                    return repo.handle(method, sub_path, query, data)
+        raise _FakeResponse(404, "Not Found")
+
+    def request(
+        self,
+        method,
+        url,
+        header,
+        custom_data,
+        record,
+        connect_timeout=None,
+        total_timeout=None,
+        sink=None,
+        source=None,
+    ):
+        start = time.perf_counter()
+        if self._latency:
+            time.sleep(self._latency)
+        split_url = urllib.parse.urlsplit(url)
+        path = split_url.path
+        if self._base_path and path.startswith("/api/uploads/"):
+            path = path[len("/api/uploads") :]
+        elif path.startswith(self._base_path):
+            path = path[len(self._base_path) :]
+        query = dict(urllib.parse.parse_qsl(split_url.query))
+        if source is not None:
+            # Uploads are sent raw
+            data_out = data = source.read()
+        else:
+            # Data is serialized as it would be when sent over the network
+            data_out = json.dumps(custom_data) if custom_data is not None else ""
+            data = json.loads(data_out) if custom_data is not None else {}
+
+        with self._lock:
+            self.requests[(method, endpointTemplate(path))] += 1
+            headers = self._rateLimitHeaders()
+            if self._failures:
+                status = self._failures.popleft()
+                js_obj = {"message": "Server Error"}
+            else:
+                try:
+                    status, js_obj = self._route(method, path.rstrip("/"), query, data)
+                except _FakeResponse as e:
+                    status, js_obj = e.status, {"message": e.message}
+            if (
+                status == 200
+                and "application/vnd.github.raw" in _requestHeader(header, "accept")
+                and isinstance(js_obj, dict)
+                and js_obj.get("encoding") == "base64"
+            ):
+                body = base64.b64decode(js_obj["content"])
+            elif js_obj is None:
+                body = b""
+            else:
+                body = json.dumps(js_obj).encode("utf-8")
+            if method == "GET" and status == 200:
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                headers["etag"] = etag
+                if etag in _requestHeader(header, "if-none-match"):
+                    status, body = 304, b""
+
+        record.bytes_in = len(body)
+        record.bytes_out = len(data_out)
+        record.total_time = time.perf_counter() - start
+        if sink is not None:
+            sink.write(body)
+            body = b""
+        return status, headers, body
@@ -1,31 +1,242 @@
 #!/usr/bin/env python3
 
 import copy
+import csv
 import os
+import types
 import logging
 import datetime
-import filecmp
+import fnmatch
 import pathlib
 import json
 import shutil
+import tempfile
 import base64
-from io import BytesIO
-import jwt
-import pem
-import pycurl
+import hashlib
+import heapq
+import itertools
 import re
-from git import Repo
-import git
-import validators
+import threading
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .instrumentation import MetricsAggregator, RequestRecord, parseRateLimit
+from .journal import Journal
+from .retry import CircuitBreaker, CircuitOpenError, RequestError, RetryPolicy
+from .tracing import NULL_SPAN, traced
+from .transport import PycurlTransport
+
+# States of a commit status that will not change
+_TERMINAL_STATES = ["success", "failure", "error"]
+
+_ANNOTATION_LEVELS = ["failure", "warning", "notice"]
+# The most annotations the check runs api accepts in a single request
+_MAX_ANNOTATIONS = 50
+
+
+def fileSha256(file_path, chunk_size=1024 * 1024):
+    """Returns the sha256 of a local file, which is read in chunks."""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            sha.update(chunk)
+            chunk = f.read(chunk_size)
+    return sha.hexdigest()
+
+
+def _checkAnnotation(annotation):
+    """
+    Fill in the optional fields of a check run annotation
+
+    end_line defaults to start_line and annotation_level to warning.
+    """
+    annotation = dict(annotation)
+    for key in ["path", "start_line", "message"]:
+        if key not in annotation:
+            raise Exception("Annotation is missing " + key + ": " + str(annotation))
+    annotation.setdefault("end_line", annotation["start_line"])
+    annotation.setdefault("annotation_level", "warning")
+    if annotation["annotation_level"] not in _ANNOTATION_LEVELS:
+        raise Exception(
+            "Unrecognized annotation level specified "
+            + str(annotation["annotation_level"])
+        )
+    return annotation
+
 
 # Checks to ensure a url is valid
 def urlIsValid(candidate_url):
+    import validators
+
     # Regex to check valid URL
     return validators.url(candidate_url)
 
 
+def gitBlobSha(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the git blob sha of a local file
+
+    This is the sha1 of "blob <size>\\0" followed by the file contents, and
+    is the same sha github reports for the file. The file is read in chunks
+    so large files are never held in memory.
+    """
+    sha = hashlib.sha1()
+    sha.update(b"blob %d\0" % os.path.getsize(file_path))
+    with open(file_path, "rb") as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            sha.update(chunk)
+            chunk = f.read(chunk_size)
+    return sha.hexdigest()
+
+
+def defaultCacheDir():
+    """Returns the directory py_cgad uses for local caches."""
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "py_cgad")
+
+
+def defaultConfigDir():
+    """Returns the directory py_cgad stores the app config files in."""
+    config_home = os.environ.get("XDG_CONFIG_HOME")
+    if not config_home:
+        config_home = os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(config_home, "py_cgad")
+
+
+_logger_lock = threading.Lock()
+
+
+def _configureLogger(name, log_file=None):
+    """
+    Returns the logger called name with the py_cgad handlers attached
+
+    Handlers are only attached once per logger and log file, so creating
+    several apps for the same repository does not duplicate log lines. The
+    log file is appended to and only opened when the first record is written.
+    """
+    log = logging.getLogger(name)
+    with _logger_lock:
+        if log.level == logging.NOTSET:
+            log.setLevel(logging.INFO)
+        attached = [getattr(handler, "_py_cgad", None) for handler in log.handlers]
+        if "stream" not in attached:
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.DEBUG)
+            ch._py_cgad = "stream"
+            log.addHandler(ch)
+        if log_file is not None:
+            log_file = os.path.abspath(log_file)
+            if log_file not in attached:
+                fh = logging.FileHandler(
+                    log_file, mode="a", encoding="utf-8", delay=True
+                )
+                fh.setLevel(logging.INFO)
+                fh._py_cgad = log_file
+                log.addHandler(fh)
+    return log
+
+
+class BlobShaCache:
+    """
+    Cache of the git blob shas of local files
+
+    Entries are keyed by the absolute path of the file and are only reused
+    while the size and modification time of the file are unchanged, so
+    unchanged files are not rehashed across runs. The cache is stored as a
+    json file when save is called.
+    """
+
+    def __init__(self, file_path=None):
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        if file_path is not None and os.path.isfile(file_path):
+            try:
+                with open(file_path, "r") as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                # A corrupt cache is simply rebuilt
+                self._entries = {}
+
+    def _lookup(self, key, stat):
+        with self._lock:
+            entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry[0] == stat.st_size
+            and entry[1] == stat.st_mtime_ns
+        ):
+            return entry[2]
+        return None
+
+    def _store(self, key, stat, sha):
+        with self._lock:
+            self._entries[key] = [stat.st_size, stat.st_mtime_ns, sha]
+            self._dirty = True
+
+    def sha(self, file_path):
+        """Returns the git blob sha of file_path, hashing it only if needed."""
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        sha = self._lookup(key, stat)
+        if sha is None:
+            sha = gitBlobSha(key)
+            self._store(key, stat, sha)
+        return sha
+
+    def countMissing(self, file_paths):
+        """Returns how many of file_paths would need to be hashed."""
+        missing = 0
+        for file_path in file_paths:
+            key = os.path.abspath(file_path)
+            if self._lookup(key, os.stat(key)) is None:
+                missing += 1
+        return missing
+
+    def shaMany(self, file_paths, executor=None):
+        """
+        Returns the git blob shas of many files
+
+        Files missing from the cache are hashed using executor.map if an
+        executor is provided, e.g. a process pool for large trees.
+        """
+        keys = [os.path.abspath(file_path) for file_path in file_paths]
+        stats = [os.stat(key) for key in keys]
+        shas = [self._lookup(key, stat) for key, stat in zip(keys, stats)]
+        missing = [index for index, sha in enumerate(shas) if sha is None]
+        if executor is None:
+            hashed = map(gitBlobSha, [keys[index] for index in missing])
+        else:
+            hashed = executor.map(
+                gitBlobSha, [keys[index] for index in missing], chunksize=16
+            )
+        for index, sha in zip(missing, hashed):
+            self._store(keys[index], stats[index], sha)
+            shas[index] = sha
+        return shas
+
+    def save(self):
+        """Write the cache to disk if it has changed, the write is atomic."""
+        if self._file_path is None or not self._dirty:
+            return
+        with self._lock:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(self._file_path)), exist_ok=True
+            )
+            tmp_path = self._file_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self._file_path)
+            self._dirty = False
+
+
 class Node:
-    def __init__(self, dir_name="", rel_path=".", dir_sha=None):
+    def __init__(self, dir_name="", rel_path=".", dir_sha=None, loader=None):
         """
         Creating a Node object
 
@@ -36,7 +247,13 @@ class Node:
 
         root_node = Node()
 
+        If a loader is provided the node is lazy, the loader is a callable
+        that is passed the node and is expected to insert the contents of the
+        directory. It is only called the first time the contents of the node
+        are needed, directories created within a lazy node share its loader.
         """
+        self._loader = loader
+        self._loaded = loader is None
         self._dir = dir_name
         self._dir_sha = dir_sha
         self._type = "dir"
@@ -46,74 +263,86 @@ class Node:
         self._misc = []
         self._misc_sha = {}
         self._rel_path = rel_path + dir_name
+        # Flattened path -> (name, sha) map shared by all nodes of a tree
+        self._content = {}
+        self._content_view = None
+
+    def __getstate__(self):
+        # Mapping proxies cannot be copied or pickled, they are recreated on demand
+        state = self.__dict__.copy()
+        state["_content_view"] = None
+        return state
+
+    def _load(self):
+        """Fetch the contents of a lazy node if they have not been fetched."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            self._loader(self)
+        except Exception:
+            self._loaded = False
+            raise
+
+    def loadAll(self):
+        """Fetch the contents of this node and all lazy nodes below it."""
+        self._load()
+        for node in self._dirs:
+            node.loadAll()
 
-    def __getFilePaths(self, current_path):
-        """Returns the full paths to the files in the current folder."""
-        rel_paths = []
-        for fil in self._files:
-            if current_path.endswith("/"):
-                rel_paths.append(current_path + fil)
-            else:
-                rel_paths.append(current_path + "/" + fil)
-        return rel_paths
-
-    def __getMiscPaths(self, current_path):
-        """Returns the full paths to the misc content in the current folder."""
-        rel_paths = []
-        for mis in self._misc:
-            if current_path.endswith("/"):
-                rel_paths.append(current_path + mis)
-            else:
-                rel_paths.append(current_path + "/" + mis)
-        return rel_paths
+    @property
+    def loaded(self):
+        """Returns False if the node is lazy and its contents have not been fetched."""
+        return self._loaded
 
-    def __getDirPaths(self, current_path):
-        rel_paths = []
+    def __child(self, name):
+        self._load()
         for node in self._dirs:
-            if node.name[0] == "/":
-                if current_path[-1] == "/":
-                    rel_paths.append(current_path + node.name[1:])
-                else:
-                    rel_paths.append(current_path + node.name)
-            elif current_path[-1] == "/":
-                rel_paths.append(current_path + node.name)
-            else:
-                rel_paths.append(current_path + "/" + node.name)
-        return rel_paths
+            if node.name == name:
+                return node
+        return None
 
-    def __exists(self, current_path, path_to_obj):
-        for fil in self.__getFilePaths(current_path):
-            if fil == path_to_obj:
-                return True
-        for mis in self.__getMiscPaths(current_path):
-            if mis == path_to_obj:
-                return True
-        for dir_path in self.__getDirPaths(current_path):
-            if dir_path == path_to_obj:
+    def __parent(self, path):
+        """
+        Walk to the node containing the last component of path
+
+        Only the directories along the path are visited, so for a lazy tree
+        only those directories are fetched. Returns the node and the name
+        of the last component, the node is None if a directory is missing.
+        """
+        components = [comp for comp in path.split("/") if comp not in ["", "."]]
+        if not components:
+            return None, None
+        node = self
+        for comp in components[:-1]:
+            node = node.__child(comp)
+            if node is None:
+                return None, None
+        node._load()
+        return node, components[-1]
+
+    def __exists(self, path_to_obj):
+        node, name = self.__parent(path_to_obj)
+        if node is None:
+            return False
+        if name in node._files_sha or name in node._misc_sha:
+            return True
+        for child in node._dirs:
+            if child.name == name:
                 return True
-        for node in self._dirs:
-            if current_path.endswith("/"):
-                if node.__exists(current_path + node.name, path_to_obj):
-                    return True
-            else:
-                if node.__exists(current_path + "/" + node.name, path_to_obj):
-                    return True
         return False
 
     def __type(self, path):
-        for fil in self._files:
-            if fil == path:
-                return "file"
-        for mis in self._misc:
-            if mis == path:
-                return "misc"
-        for node in self._dirs:
-            if path.count("/") == 0:
-                if node.name == path:
-                    return "dir"
-            else:
-                new_path = path.split("/")[1][0:]
-                return node.__type(new_path)
+        node, name = self.__parent(path)
+        if node is None:
+            return None
+        if name in node._files_sha:
+            return "file"
+        if name in node._misc_sha:
+            return "misc"
+        for child in node._dirs:
+            if child.name == name:
+                return "dir"
         return None
 
     def __insert(self, current_path, content_path, content_type, content_sha):
@@ -123,16 +352,13 @@ class Node:
         if content_path.startswith("./"):
             if content_path.count("/") > 1:
                 # Ignore the first ./ so grab [1]
-                sub_dir = content_path.split("/")[1]
-                new_content_path = content_path.split(sub_dir)[1][1:]
+                sub_dir, new_content_path = content_path[2:].split("/", 1)
         elif content_path.startswith("/"):
             if content_path.count("/") > 1:
                 # Ignore the first / so grab [1]
-                sub_dir = content_path.split("/")[1]
-                new_content_path = content_path.split(sub_dir)[1][1:]
+                sub_dir, new_content_path = content_path[1:].split("/", 1)
         elif content_path.count("/") > 0:
-            sub_dir = content_path.split("/")[0]
-            new_content_path = content_path.split(sub_dir)[1][0:]
+            sub_dir, new_content_path = content_path.split("/", 1)
 
         if sub_dir is not None:
             # Check if the directory has already been created
@@ -160,14 +386,27 @@ class Node:
                     content_name = content_path[1:]
                 else:
                     content_name = content_path
-                self._dirs.append(Node(content_name, self._rel_path + "/", content_sha))
+                node = Node(
+                    content_name, self._rel_path + "/", content_sha, self._loader
+                )
+                node._content = self._content
+                self._dirs.append(node)
+                self._content[node._rel_path] = (content_name, content_sha)
 
             elif content_type == "file":
                 self._files.append(content_path)
                 self._files_sha[content_path] = content_sha
+                self._content[self._rel_path + "/" + content_path] = (
+                    content_path,
+                    content_sha,
+                )
             else:
                 self._misc.append(content_path)
                 self._misc_sha[content_path] = content_sha
+                self._content[self._rel_path + "/" + content_path] = (
+                    content_path,
+                    content_sha,
+                )
 
     def __sha(self, path):
         """
@@ -238,11 +477,27 @@ class Node:
     @property
     def files(self):
         """Returns non miscellaneous content and non folders."""
+        self._load()
         return self._files
 
+    @property
+    def contents(self):
+        """
+        Returns a read-only mapping of every path in the tree to (name, sha)
+
+        The mapping is shared by all the nodes of a tree and is kept up to
+        date as content is inserted, so it is not rebuilt on each call. Paths
+        are relative to the root of the tree e.g. ./bin/common.py. For a lazy
+        tree only the directories that have been fetched are included.
+        """
+        if self._content_view is None:
+            self._content_view = types.MappingProxyType(self._content)
+        return self._content_view
+
     @property
     def miscellaneous(self):
         """Returns miscellaneous content e.g. image files."""
+        self._load()
         return self._misc
 
     @property
@@ -252,6 +507,7 @@ class Node:
 
         This will essentially be the directories.
         """
+        self._load()
         return self._dirs
 
     def exists(self, path_to_obj):
@@ -282,7 +538,7 @@ class Node:
             else:
                 path_to_obj = "./" + path_to_obj
 
-        return self.__exists("./", path_to_obj)
+        return self.__exists(path_to_obj)
 
     def getSha(self, path):
         """
@@ -298,6 +554,7 @@ class Node:
             if len(path) > 1:
                 path = path[1:]
 
+        self._load()
         for fil in self._files:
             if fil == path:
                 return self._files_sha[fil]
@@ -310,7 +567,7 @@ class Node:
         for node in self._dirs:
             # Remove the dir1/ from dir1/dir2
             if path.startswith(node.name + "/"):
-                new_path = path.split("/")[1][0:]
+                new_path = path.split("/", 1)[1]
                 found_sha = node.getSha(new_path)
 
                 if found_sha is not None:
@@ -333,46 +590,132 @@ class Node:
 
     def _buildStr(self, indent=""):
         """Contents in string format indenting with each folder."""
-        content_string = ""
+        return "".join(self._textLines(indent))
+
+    def _textLines(self, indent="", max_depth=None):
+        for depth, _, content_type, _, name, _ in self._walk(max_depth=max_depth):
+            label = "dir " if content_type == "dir" else content_type
+            yield indent + "  " * (depth - 1) + label + " " + name + "\n"
+
+    def _children(self):
+        """Yields (path, type, sha, name, node) for the entries of the directory."""
+        self._load()
         for fil in self._files:
-            content_string += indent + "file " + fil + "\n"
+            yield self._rel_path + "/" + fil, "file", self._files_sha[fil], fil, None
         for mis in self._misc:
-            content_string += indent + "misc " + mis + "\n"
+            yield self._rel_path + "/" + mis, "misc", self._misc_sha[mis], mis, None
         for node in self._dirs:
-            content_string += indent + "dir  " + node.name + "\n"
-            content_string += node._buildStr(indent + "  ")
-        return content_string
+            yield node._rel_path, "dir", node._dir_sha, node.name, node
 
-    def _findRelPaths(self, current_path, obj_name):
-        """Contents in string format indenting with each folder."""
-        rel_paths = []
-        for fil in self.__getFilePaths(current_path):
-            if fil.endswith(obj_name):
-                rel_paths.append(fil)
-        for mis in self.__getMiscPaths(current_path):
-            if mis.endswith(obj_name):
-                rel_paths.append(mis)
-        for dir_path in self.__getDirPaths(current_path):
-            if dir_path.endswith(obj_name):
-                rel_paths.append(dir_path)
+    def _walk(self, order="pre", max_depth=None):
+        """
+        Yields (depth, path, type, sha, name, node) for everything below the node
 
-        for node in self._dirs:
-            potential_paths = node._findRelPaths(
-                current_path + "/" + node.name, obj_name
+        An explicit stack of generators is used so deep trees do not recurse
+        and only the directories being visited are held.
+        """
+        if order not in ["pre", "post"]:
+            error_msg = "Unknown traversal order " + str(order)
+            error_msg += ", allowed orders are pre and post"
+            raise Exception(error_msg)
+        stack = [(None, self._children())]
+        while stack:
+            directory, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if directory is not None and order == "post":
+                    yield directory
+                continue
+            entry = (len(stack),) + child
+            if order == "pre":
+                yield entry
+            node = child[4]
+            if node is not None and (max_depth is None or len(stack) < max_depth):
+                stack.append((entry, node._children()))
+            elif order == "post":
+                yield entry
+
+    def walk(self, order="pre", max_depth=None):
+        """
+        Yields (path, type, sha) for every file, misc and dir below the node
+
+        Paths are relative to the root of the tree as in contents e.g.
+        ./bin/common.py and the type is one of file, misc or dir. With the
+        "pre" order a directory is yielded before its contents, with "post"
+        after them. max_depth limits how far below the node the walk goes,
+        with 1 only the contents of the node itself are yielded.
+
+        Entries are yielded as they are visited, so the tree is never
+        flattened and the memory used only grows with its depth. For a lazy
+        tree directories are fetched as the walk reaches them.
+        """
+        for _, path, content_type, sha, _, _ in self._walk(order, max_depth):
+            yield path, content_type, sha
+
+    def iterPaths(self, order="pre", max_depth=None):
+        """Yields the path of everything below the node, see walk."""
+        for _, path, _, _, _, _ in self._walk(order, max_depth):
+            yield path
+
+    def exportText(self, file_obj, max_depth=None):
+        """
+        Write the tree as indented text to a file object
+
+        The format is that of str(node), lines are written as the tree is
+        walked. Returns the number of entries written.
+        """
+        count = 0
+        for line in self._textLines(max_depth=max_depth):
+            file_obj.write(line)
+            count += 1
+        return count
+
+    def exportJSONLines(self, file_obj, max_depth=None):
+        """
+        Write the tree to a file object as JSON Lines
+
+        Each line is an object with the path, type and sha of an entry.
+        Returns the number of entries written.
+        """
+        count = 0
+        for path, content_type, sha in self.walk(max_depth=max_depth):
+            file_obj.write(
+                json.dumps({"path": path, "type": content_type, "sha": sha}) + "\n"
             )
-            rel_paths += potential_paths
-        return rel_paths
+            count += 1
+        return count
+
+    def exportCSV(self, file_obj, max_depth=None):
+        """
+        Write the tree to a file object as CSV with path, type and sha columns
+
+        file_obj should be opened with newline="". Returns the number of
+        entries written.
+        """
+        writer = csv.writer(file_obj)
+        writer.writerow(["path", "type", "sha"])
+        count = 0
+        for entry in self.walk(max_depth=max_depth):
+            writer.writerow(entry)
+            count += 1
+        return count
 
     @property
     def print(self):
         """Print contents of node and all child nodes."""
+        self._printFolder()
+        for _, _, _, _, _, node in self._walk():
+            if node is not None:
+                node._printFolder()
+
+    def _printFolder(self):
+        self._load()
         print("Contents in folder: " + self._rel_path)
         for fil in self._files:
             print("file " + fil)
         for mis in self._misc:
             print("misc " + mis)
-        for node in self._dirs:
-            node.print
 
     def getRelativePaths(self, obj_name):
         """
@@ -392,7 +735,67 @@ class Node:
 
         ["./bin/common.py", "./common.py"]
         """
-        return self._findRelPaths(".", obj_name)
+        # Paths are returned relative to this node
+        prefix_length = len(self._rel_path)
+        return [
+            "." + path[prefix_length:]
+            for path in self.iterPaths()
+            if path.endswith(obj_name)
+        ]
+
+    def _entries(self):
+        """Returns a dict mapping each name in the directory to (type, sha, node)."""
+        self._load()
+        entries = {}
+        for fil in self._files:
+            entries[fil] = ("file", self._files_sha[fil], None)
+        for mis in self._misc:
+            entries[mis] = ("misc", self._misc_sha[mis], None)
+        for node in self._dirs:
+            entries[node.name] = ("dir", node._dir_sha, node)
+        return entries
+
+    def diff(self, other):
+        """
+        Yields the differences between this tree and other
+
+        Each difference is a (change, path, old_sha, new_sha) tuple, where
+        change is "added", "removed" or "modified" and the path is relative
+        to the root as in contents e.g. ./bin/common.py. The sha of the side
+        an entry is missing from is None.
+
+        Directories with the same sha have the same contents, so they are
+        skipped without being traversed and the cost of a diff grows with the
+        size of the change rather than the size of the tree. For lazy trees
+        only the directories that changed are fetched. A directory that was
+        added or removed is yielded followed by everything in it, and an
+        entry that changed type is yielded as removed and then added.
+        """
+        old_entries = self._entries()
+        new_entries = other._entries()
+        for name in sorted(set(old_entries) | set(new_entries)):
+            path = self._rel_path + "/" + name
+            old_type, old_sha, old_node = old_entries.get(name, (None, None, None))
+            new_type, new_sha, new_node = new_entries.get(name, (None, None, None))
+            if old_type is not None and old_type == new_type:
+                if old_sha is not None and old_sha == new_sha:
+                    continue
+                if old_type == "dir":
+                    # The sha of the directory is unknown or it has changed
+                    yield from old_node.diff(new_node)
+                else:
+                    yield ("modified", path, old_sha, new_sha)
+                continue
+            if old_type is not None:
+                yield ("removed", path, old_sha, None)
+                if old_node is not None:
+                    for sub_path, _, sha in old_node.walk():
+                        yield ("removed", sub_path, sha, None)
+            if new_type is not None:
+                yield ("added", path, None, new_sha)
+                if new_node is not None:
+                    for sub_path, _, sha in new_node.walk():
+                        yield ("added", sub_path, None, sha)
 
 
 class GitHubApp:
@@ -412,6 +815,14 @@ class GitHubApp:
         repo_name,
         location_of_inheriting_class=None,
         verbosity=0,
+        cache_dir=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        base_url="https://api.github.com",
+        transport=None,
+        raw_url=None,
+        log_file=None,
+        config_dir=None,
     ):
         """
         The app is generic and provides a template, to create an app for a specefic repository the
@@ -421,25 +832,55 @@ class GitHubApp:
         * the owner of the repository it controls
         * the name of the repository it controls
         * the location of the github child class, should exist within a repo
+        * the directory used for local caches, defaults to ~/.cache/py_cgad
+        * the retry.RetryPolicy and retry.CircuitBreaker used for requests
+        * the url of the api, e.g. https://github.example.com/api/v3 for
+          GitHub Enterprise, and the transport.Transport used to reach it,
+          which defaults to pycurl
+        * the url raw files are served from, by default it is derived from
+          the api url
+        * a file to append the log to, by default the log is only written to
+          the console
+        * the directory of the config file, defaults to ~/.config/py_cgad
+
+        Construction does not touch the network or write any files, the app
+        authenticates when it makes its first request.
         """
         self._app_id = app_id
         self._name = name
         self._user = user
         self._repo_name = repo_name
         self._verbosity = verbosity
+        self._metrics = MetricsAggregator()
+        self._request_hooks = [self._metrics]
+        self._tracer = None
+        self._wiki_repo = None
+        self._wiki_remote = None
+        self._mirror = None
+        self._mirror_remote_url = None
+        self._cache_dir = cache_dir if cache_dir is not None else defaultCacheDir()
+        self._blob_sha_cache = None
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self._circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+        self._base_url = base_url.rstrip("/")
+        self._raw_url = raw_url.rstrip("/") if raw_url is not None else None
+        self._transport = (
+            transport if transport is not None else PycurlTransport(verbosity)
+        )
 
-        self._log = logging.getLogger(self._repo_name)
-        self._log.setLevel(logging.INFO)
-
-        fh = logging.FileHandler(self._repo_name + ".log", mode="w", encoding="utf-8")
-        fh.setLevel(logging.INFO)
-        self._log.addHandler(fh)
+        self._pem_file = None
+        self._access_header = None
+        # Set while a webhook server keeps the caches up to date
+        self._event_driven = False
+        self._auth_lock = threading.Lock()
 
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        self._log.addHandler(ch)
+        self._log = _configureLogger(self._repo_name, log_file)
 
-        self._config_file_dir = pathlib.Path(__file__).parent.absolute()
+        if config_dir is None:
+            config_dir = defaultConfigDir()
+        self._config_file_dir = pathlib.Path(config_dir)
         self._config_file_name = "githubapp_" + str(self._app_id) + ".config"
         self._config_file_path = pathlib.Path.joinpath(
             self._config_file_dir, self._config_file_name
@@ -449,9 +890,6 @@ class GitHubApp:
         if location_of_inheriting_class is not None:
             if os.path.isfile(location_of_inheriting_class):
                 self._child_class_path = location_of_inheriting_class
-        # Create an empty config file if one does not exist
-        if not pathlib.Path.is_file(self._config_file_path):
-            open(self._config_file_path, "a").close()
 
     @property
     def name(self):
@@ -459,6 +897,60 @@ class GitHubApp:
         return self._name
 
     @property
+    def metrics(self):
+        """
+        Returns the built in metrics aggregator
+
+        Every request made by the app is recorded by the aggregator, the
+        totals can be exported with metrics.toPrometheus() or metrics.toJSON().
+        """
+        return self._metrics
+
+    def addRequestHook(self, hook):
+        """
+        Register a callable that is passed a RequestRecord after each request.
+
+        Hooks are called in the order they were added, an exception raised by
+        a hook is logged and does not interrupt the request.
+        """
+        if not callable(hook):
+            raise Exception("Request hook must be callable: {}".format(hook))
+        self._request_hooks.append(hook)
+
+    def removeRequestHook(self, hook):
+        """Unregister a hook previously added with addRequestHook."""
+        if hook in self._request_hooks:
+            self._request_hooks.remove(hook)
+
+    @property
+    def tracer(self):
+        """Returns the tracer attached to the app or None if tracing is disabled."""
+        return self._tracer
+
+    def setTracer(self, tracer):
+        """
+        Attach a tracing.Tracer to the app, passing None disables tracing.
+
+        While a tracer is attached each public method and internal phase,
+        e.g. the tree walk and each http transfer, is recorded as a span.
+        """
+        self._tracer = tracer
+
+    def _span(self, name, **attributes):
+        """Open a span on the attached tracer, does nothing if tracing is disabled."""
+        if self._tracer is None:
+            return NULL_SPAN
+        return self._tracer.span(name, **attributes)
+
+    def _notifyRequestHooks(self, record):
+        for hook in list(self._request_hooks):
+            try:
+                hook(record)
+            except Exception as e:
+                self._log.warning("Request hook {} failed: {}".format(hook, e))
+
+    @property
+    @traced
     def default_branch(self):
         """Return the default branch for the repository."""
         if self._default_branch is None:
@@ -467,6 +959,7 @@ class GitHubApp:
             self._default_branch = js_obj_list["default_branch"]
         return self._default_branch
 
+    @traced
     def initialize(
         self,
         pem_file,
@@ -492,9 +985,7 @@ class GitHubApp:
         """
         self._ignore = ignore
         self._use_wiki = use_wiki
-        self._repo_url = (
-            "https://api.github.com/repos/" + self._user + "/" + self._repo_name
-        )
+        self._repo_url = self._base_url + "/repos/" + self._user + "/" + self._repo_name
         if isinstance(create_branch, list):
             self._create_branch = create_branch[0]
         else:
@@ -507,23 +998,26 @@ class GitHubApp:
         self._repo_root = Node()
         self._repo_root_initialized = False
         self._repo_root_branch = "None"
+        self._repo_root_lazy = False
+        # Directory listings keyed by branch, only valid for the recorded head
+        self._path_cache = {}
+        # Open pull requests keyed by number, only cached when event driven
+        self._pulls = None
+        # (etag, latest status by context, complete) keyed by commit sha
+        self._status_cache = {}
 
         if path_to_repo is not None:
             # Check that the repo specified is valid
             if os.path.isdir(path_to_repo):
                 # Check if we are overwriting an existing repo stored in the config file
-                with open(self._config_file_path, "r") as file:
-                    line = file.readline()
-                    # Print a message if they are different
-                    if line != path_to_repo:
-                        self._log.info(
-                            "Changing repo path from {} to {}".format(
-                                line, path_to_repo
-                            )
-                        )
-
-                with open(self._config_file_path, "w") as file:
-                    file.write(path_to_repo)
+                line = self._readRepoPath()
+                # Print a message if they are different
+                if line is not None and line != path_to_repo:
+                    self._log.info(
+                        "Changing repo path from {} to {}".format(line, path_to_repo)
+                    )
+                if line != path_to_repo:
+                    self._writeRepoPath(path_to_repo)
 
                 self._repo_path = path_to_repo
             else:
@@ -531,41 +1025,34 @@ class GitHubApp:
                     path_to_repo
                 )
                 self._log.error(error_msg)
-                raise
+                raise Exception(error_msg)
         else:
-            if pathlib.Path.is_file(self._config_file_path):
-
-                with open(self._config_file_path, "r") as file:
-                    line = file.readline()
-                    # Throw an error if the path is not valid
-                    if not os.path.isdir(line):
-                        error_msg = (
-                            "The cached path to your repository is "
-                            "not valid: ({})".format(line)
-                        )
-                        error_msg = (
-                            error_msg
-                            + "\nThe config file is located at: ({})".format(
-                                self._config_file_path
-                            )
-                        )
-                        error_msg = (
-                            error_msg
-                            + "\nConsider initializing the app "
-                            + self._name
-                            + " with the path of "
-                        )
-                        error_msg = error_msg + "repository it will be analyzing."
-                        self._log.error(error_msg)
-                    self._repo_path = line
-            else:
-                # If no config file exists throw an error
+            line = self._readRepoPath()
+            if line is None:
                 error_msg = (
                     "No repository path is known to the " + self._name + ".\n"
                     "Please call --repository-path or -rp with the path the repository to register it.\n"
                 )
                 self._log.error(error_msg)
-                raise
+                raise Exception(error_msg)
+            # Throw an error if the path is not valid
+            elif not os.path.isdir(line):
+                error_msg = (
+                    "The cached path to your repository is "
+                    "not valid: ({})".format(line)
+                )
+                error_msg = error_msg + "\nThe config file is located at: ({})".format(
+                    self._config_file_path
+                )
+                error_msg = (
+                    error_msg
+                    + "\nConsider initializing the app "
+                    + self._name
+                    + " with the path of "
+                )
+                error_msg = error_msg + "repository it will be analyzing."
+                self._log.error(error_msg)
+            self._repo_path = line
 
         self._app_wiki_dir = os.path.normpath(
             self._repo_path + "/../" + self._repo_name + ".wiki"
@@ -576,10 +1063,53 @@ class GitHubApp:
         if isinstance(pem_file, list):
             pem_file = pem_file[0]
 
-        pem_file = self._validatePemFile(pem_file)
-        self._generateJWT(pem_file)
-        self._generateInstallationId()
-        self._generateAccessToken()
+        # Authentication is deferred until the first request is made
+        self._pem_file = self._validatePemFile(pem_file)
+        self._access_header = None
+
+    def _readRepoPath(self):
+        """Returns the repository path stored in the config file or None."""
+        config_file_path = self._config_file_path
+        if not config_file_path.is_file():
+            # Older versions kept the config file in the package directory
+            config_file_path = pathlib.Path.joinpath(
+                pathlib.Path(__file__).parent.absolute(), self._config_file_name
+            )
+            if not config_file_path.is_file():
+                return None
+        with open(config_file_path, "r") as file:
+            line = file.readline()
+        return line if line != "" else None
+
+    def _writeRepoPath(self, path_to_repo):
+        os.makedirs(str(self._config_file_dir), exist_ok=True)
+        with open(self._config_file_path, "w") as file:
+            file.write(path_to_repo)
+
+    @property
+    def _header(self):
+        """
+        Returns the headers that authenticate requests made by the app
+
+        The access token is created the first time the headers are needed.
+        """
+        if self._access_header is None:
+            self._authenticate()
+        return self._access_header
+
+    def _authenticate(self):
+        with self._auth_lock:
+            if self._access_header is not None:
+                return
+            if self._pem_file is None:
+                error_msg = (
+                    "The " + self._name + " app must be initialized with a pem "
+                    "file before it can make requests"
+                )
+                raise Exception(error_msg)
+            self._generateJWT(self._pem_file)
+            self._generateInstallationId()
+            self._generateAccessToken()
 
     def _validatePemFile(self, pem_file):
         """Ensures pem file exists and checks env variable."""
@@ -600,6 +1130,7 @@ class GitHubApp:
         self._log.info("File loc %s" % pem_file)
         return pem_file
 
+    @traced
     def _generateJWT(self, pem_file):
         """
         Generates Json web token
@@ -612,9 +1143,13 @@ class GitHubApp:
         payload = {
             "iat": datetime.datetime.utcnow(),
             "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=60),
-            "iss": self._app_id,
+            # Newer versions of jwt only accept a string issuer
+            "iss": str(self._app_id),
         }
 
+        import jwt
+        import pem
+
         certs = pem.parse_file(pem_file)
         PEM = str(certs[0])
 
@@ -631,39 +1166,94 @@ class GitHubApp:
             # Older versions of jwt return a byte string as opposed to a string
             self._jwt_token = self._jwt_token.decode("utf-8")
 
-    def _PYCURL(self, header, url, option=None, custom_data=None):
-
-        buffer_temp = BytesIO()
-        c = pycurl.Curl()
-        c.setopt(c.URL, url)
-        c.setopt(pycurl.VERBOSE, self._verbosity)
-        c.setopt(c.WRITEDATA, buffer_temp)
-        c.setopt(c.HTTPHEADER, header)
-        if option == "POST":
-            c.setopt(c.POST, 1)
-            c.setopt(c.POSTFIELDS, json.dumps(custom_data))
-            c.setopt(c.POSTFIELDSIZE, len(json.dumps(custom_data)))
-        elif option == "PUT":
-            c.setopt(c.PUT, 1)
-        elif option == "DELETE":
-            c.setopt(c.CUSTOMREQUEST, "DELETE")
-            c.setopt(c.POSTFIELDS, json.dumps(custom_data))
-            c.setopt(c.POSTFIELDSIZE, len(json.dumps(custom_data)))
-
-        if custom_data is not None:
-            buffer_temp2 = BytesIO(json.dumps(custom_data).encode("utf-8"))
-            c.setopt(c.READDATA, buffer_temp2)
-
-        c.perform()
-        code = c.getinfo(c.HTTP_CODE)
-        c.close()
+    def _PYCURL(self, header, url, option=None, custom_data=None, idempotent=None):
+        """Make a request to the github api and return the json response and code"""
+        js_obj, code, _ = self._request(header, url, option, custom_data, idempotent)
+        return js_obj, code
 
-        if int(code) != 200:
-            print("Code is {}".format(code))
-            print(json.dumps(json.loads(buffer_temp.getvalue()), indent=4))
+    def _request(
+        self,
+        header,
+        url,
+        option=None,
+        custom_data=None,
+        idempotent=None,
+        sink=None,
+        source=None,
+    ):
+        """
+        Make a request to the github api
+
+        Returns the json response, the code and the lower case response
+        headers. The json response is None if the body is empty, e.g. for a
+        304 response to a conditional request.
+
+        If a sink is provided, e.g. an open file, the body is streamed to it
+        instead and the json response is None. The sink is rewound and
+        truncated before every attempt. Similarly if a source is provided, a
+        file opened in binary mode, it is streamed as the body of the request
+        and rewound before every attempt. Streamed requests have no total
+        timeout, a large file can take longer than the retry policy allows to
+        transfer, the transport aborts them if they stall instead.
+
+        Failed attempts are retried according to the retry policy, whether
+        the request is idempotent is worked out from the method and data
+        unless it is specified.
+        """
+        record = RequestRecord(option if option is not None else "GET", url)
+        total_timeout = self._retry_policy.total_timeout
+        if sink is not None or source is not None:
+            total_timeout = None
+        if idempotent is None:
+            idempotent = RetryPolicy.isIdempotent(record.method, custom_data)
+
+        def attempt():
+            if sink is not None:
+                sink.seek(0)
+                sink.truncate()
+            if source is not None:
+                source.seek(0)
+            return self._transport.request(
+                record.method,
+                url,
+                header,
+                custom_data,
+                record,
+                self._retry_policy.connect_timeout,
+                total_timeout,
+                sink=sink,
+                source=source,
+            )
+
+        with self._span(
+            "GitHubApp._PYCURL", method=record.method, endpoint=record.endpoint
+        ) as span:
+            try:
+                result, record.retries = self._retry_policy.execute(
+                    attempt, idempotent, self._circuit_breaker
+                )
+            except (RequestError, CircuitOpenError) as e:
+                record.error = str(e)
+                self._notifyRequestHooks(record)
+                raise
+            span.setAttribute("status", result[0])
+        code, response_headers, body = result
+        record.status = code
+        record.rate_limit = parseRateLimit(response_headers)
+        self._notifyRequestHooks(record)
+
+        js_obj = json.loads(body) if body else None
+        if int(code) >= 400:
+            # Only the message is logged, bodies can hold tokens
+            message = js_obj.get("message") if isinstance(js_obj, dict) else None
+            self._log.warning(
+                "%s %s returned code %s: %s"
+                % (record.method, record.endpoint, code, message)
+            )
 
-        return json.loads(buffer_temp.getvalue()), code
+        return js_obj, code, response_headers
 
+    @traced
     def _generateInstallationId(self):
         """
         Generate an installation id
@@ -676,7 +1266,7 @@ class GitHubApp:
             "Accept: " + self._api_version,
         ]
 
-        js_obj, _ = self._PYCURL(header, "https://api.github.com/app/installations")
+        js_obj, _ = self._PYCURL(header, self._base_url + "/app/installations")
 
         if isinstance(js_obj, list):
             js_obj = js_obj[0]
@@ -684,6 +1274,7 @@ class GitHubApp:
         # The installation id will be listed at the end of the url path
         self._install_id = js_obj["html_url"].rsplit("/", 1)[-1]
 
+    @traced
     def _generateAccessToken(self):
         """
         Creates an access token
@@ -698,9 +1289,7 @@ class GitHubApp:
         ]
 
         https_url_access_tokens = (
-            "https://api.github.com/app/installations/"
-            + self._install_id
-            + "/access_tokens"
+            self._base_url + "/app/installations/" + self._install_id + "/access_tokens"
         )
 
         js_obj, _ = self._PYCURL(header, https_url_access_tokens, option="POST")
@@ -710,7 +1299,7 @@ class GitHubApp:
 
         self._access_token = js_obj["token"]
 
-        self._header = [
+        self._access_header = [
             "Authorization: token " + str(self._access_token),
             "Accept: " + self._api_version,
         ]
@@ -725,31 +1314,58 @@ class GitHubApp:
         nodes = current_node.nodes
         for node in nodes:
 
-            js_obj, _ = self._PYCURL(
-                self._header,
-                self._repo_url + "/contents/" + node.path + "?ref=" + branch,
-                custom_data={"branch": branch},
-            )
-
-            if isinstance(js_obj, list):
-                for ob in js_obj:
-                    node.insert(ob["name"], ob["type"], ob["sha"])
-            else:
-                node.insert(js_obj["name"], js_obj["type"], js_obj["sha"])
+            with self._span("GitHubApp._fillTree", path=node.path):
+                self._fetchDirectory(node, branch)
 
             self._fillTree(node, branch)
 
+    def _fetchDirectory(self, node, branch):
+        """
+        Inserts the contents of the remote directory into the node
+
+        Is used both by _fillTree and as the loader of lazy nodes.
+        """
+        if node.path in [".", "./"]:
+            url = self._repo_url + "/contents?ref=" + branch
+        else:
+            rel_path = node.path[2:] if node.path.startswith("./") else node.path
+            url = self._repo_url + "/contents/" + rel_path + "?ref=" + branch
+
+        js_obj, _ = self._PYCURL(self._header, url, custom_data={"branch": branch})
+
+        if isinstance(js_obj, list):
+            for ob in js_obj:
+                node.insert(ob["name"], ob["type"], ob["sha"])
+        else:
+            node.insert(js_obj["name"], js_obj["type"], js_obj["sha"])
+
+    def _lazyDirectoryLoader(self, branch):
+        """Returns a loader that lazy nodes use to fetch directories of branch."""
+
+        def loader(node):
+            with self._span("GitHubApp._fetchDirectory", path=node.path):
+                self._fetchDirectory(node, branch)
+
+        return loader
+
     def _getBranches(self):
         """Internal method for getting a list of the branches that are available on github."""
+        if self._mirror is not None:
+            self._fetchMirror()
+            self._branch_current_commit_sha = self._mirror.heads()
+            self._branches = list(self._branch_current_commit_sha)
+            return
         page_found = True
         page_index = 1
         self._branches = []
         self._branch_current_commit_sha = {}
         while page_found:
             page_found = False
-            js_obj_list, _ = self._PYCURL(
-                self._header, self._repo_url + "/branches?page={}".format(page_index)
-            )
+            with self._span("GitHubApp._getBranches", page=page_index):
+                js_obj_list, _ = self._PYCURL(
+                    self._header,
+                    self._repo_url + "/branches?page={}".format(page_index),
+                )
             page_index = page_index + 1
             for js_obj in js_obj_list:
                 page_found = True
@@ -772,9 +1388,20 @@ class GitHubApp:
                 return self._child_class_path[0 : index + len(self._repo_name)]
         return None
 
+    @traced
     def getBranchMergingWith(self, branch):
-        """Gets the name of the target branch of `branch` which it will merge with."""
-        js_obj_list, _ = self._PYCURL(self._header, self._repo_url + "/pulls")
+        """
+        Gets the name of the target branch of `branch` which it will merge with.
+
+        While a webhook server is attached the open pull requests are cached
+        and kept up to date by pull_request events.
+        """
+        if self._pulls is not None:
+            js_obj_list = list(self._pulls.values())
+        else:
+            js_obj_list, _ = self._PYCURL(self._header, self._repo_url + "/pulls")
+            if self._event_driven:
+                self._pulls = {js_obj["number"]: js_obj for js_obj in js_obj_list}
         self._log.info(
             "Checking if branch is open as a pr and what branch it is targeted to merge with.\n"
         )
@@ -785,8 +1412,63 @@ class GitHubApp:
                 return js_obj.get("base").get("label").split(":", 1)[1]
         return None
 
+    def applyWebhookEvent(self, event, payload):
+        """
+        Update the cached state of the app using a webhook event
+
+        Branch heads and the list of branches are patched from push, create
+        and delete events, the tree and path caches of a pushed branch are
+        invalidated and cached pull requests are patched from pull_request
+        events. Events for other repositories are ignored.
+        """
+        repository = payload.get("repository", {})
+        if repository.get("full_name", self._user + "/" + self._repo_name) != (
+            self._user + "/" + self._repo_name
+        ):
+            return
+        if not hasattr(self, "_branch_current_commit_sha"):
+            # The app has not been initialized, nothing is cached
+            return
+
+        if event == "push" and payload.get("ref", "").startswith("refs/heads/"):
+            branch = payload["ref"][len("refs/heads/") :]
+            if payload.get("deleted"):
+                self._forgetBranch(branch)
+            else:
+                self._rememberBranch(branch, payload["after"])
+            self._path_cache.pop(branch, None)
+            if self._repo_root_branch == branch:
+                self._repo_root_initialized = False
+        elif event in ["create", "delete"] and payload.get("ref_type") == "branch":
+            if event == "delete":
+                self._forgetBranch(payload["ref"])
+            elif payload["ref"] not in self._branch_current_commit_sha:
+                # The head is unknown, it is fetched when it is needed
+                if self._branches:
+                    self._branches.append(payload["ref"])
+        elif event == "status":
+            self._recordStatus(payload["sha"], payload)
+        elif event == "pull_request" and self._pulls is not None:
+            pull = payload["pull_request"]
+            if pull.get("state") == "open":
+                self._pulls[pull["number"]] = pull
+            else:
+                self._pulls.pop(pull["number"], None)
+
+    def _rememberBranch(self, branch, sha):
+        if branch not in self._branch_current_commit_sha and self._branches:
+            self._branches.append(branch)
+        self._branch_current_commit_sha[branch] = sha
+
+    def _forgetBranch(self, branch):
+        if branch in self._branches:
+            self._branches.remove(branch)
+        self._branch_current_commit_sha.pop(branch, None)
+        self._path_cache.pop(branch, None)
+
     # Public Methods
     @property
+    @traced
     def branches(self):
         """
         Gets the branches of the repository
@@ -800,12 +1482,14 @@ class GitHubApp:
 
         return self._branches
 
+    @traced
     def getLatestCommitSha(self, target_branch):
         """Does what it says gets the latest commit sha for the taget_branch."""
         if not self._branches:
             self._getBranches()
         return self._branch_current_commit_sha.get(target_branch)
 
+    @traced
     def branchExist(self, branch):
         """
         Determine if branch exists
@@ -815,6 +1499,7 @@ class GitHubApp:
         """
         return branch in self.branches
 
+    @traced
     def refreshBranchCache(self):
         """
         Method forces an update of the localy stored list of branches.
@@ -825,6 +1510,7 @@ class GitHubApp:
         """
         self._getBranches()
 
+    @traced
     def createBranch(self, branch, branch_to_fork_from=None):
         """
         Creates a git branch
@@ -850,7 +1536,7 @@ class GitHubApp:
             )
             raise Exception(error_msg)
 
-        self._PYCURL(
+        js_obj, code = self._PYCURL(
             self._header,
             self._repo_url + "/git/refs",
             option="POST",
@@ -859,22 +1545,133 @@ class GitHubApp:
                 "sha": self._branch_current_commit_sha[branch_to_fork_from],
             },
         )
+        if int(code) == 201:
+            self._branches.append(branch)
+            self._branch_current_commit_sha[branch] = js_obj["object"]["sha"]
+
+    def _branchHead(self, branch, refresh=False):
+        """
+        Returns the sha of the latest commit on branch or None if it is missing
+
+        The locally cached branch information is used unless refresh is True
+        or the branch is not known locally, in which case the ref is fetched.
+        """
+        if not refresh:
+            sha = self._branch_current_commit_sha.get(branch)
+            if sha is not None:
+                return sha
+        if self._mirror is not None:
+            self._fetchMirror([branch])
+            sha = self._mirror.commitSha(branch)
+            if sha is None:
+                self._forgetBranch(branch)
+            else:
+                self._rememberBranch(branch, sha)
+            return sha
+        js_obj, code = self._PYCURL(
+            self._header, self._repo_url + "/git/ref/heads/" + branch
+        )
+        if int(code) != 200 or not isinstance(js_obj, dict):
+            return None
+        sha = js_obj["object"]["sha"]
+        if branch not in self._branch_current_commit_sha and self._branches:
+            self._branches.append(branch)
+        self._branch_current_commit_sha[branch] = sha
+        return sha
+
+    def _lookupPath(self, path, branch, refresh=False):
+        """
+        Returns the (type, sha) of path on branch or None if it does not exist
+
+        The path is resolved by listing its parent directory, a single request
+        regardless of the size of the repository. Listings are cached until
+        the head commit of the branch changes.
+        """
+        path = "/".join([comp for comp in path.split("/") if comp not in ["", "."]])
+        if path == "":
+            return ("dir", None)
+        head_sha = self._branchHead(branch, refresh)
+        if head_sha is None:
+            error_msg = "branch: " + branch + " does not exist in repository."
+            raise Exception(error_msg)
+
+        cached_head, listings = self._path_cache.get(branch, (None, {}))
+        if cached_head != head_sha:
+            listings = {}
+            self._path_cache[branch] = (head_sha, listings)
+
+        parent, _, name = path.rpartition("/")
+        if parent not in listings:
+            url = self._repo_url + "/contents"
+            if parent != "":
+                url += "/" + parent
+            js_obj, code = self._PYCURL(self._header, url + "?ref=" + head_sha)
+            if int(code) == 200 and isinstance(js_obj, list):
+                listings[parent] = {
+                    obj["name"]: (obj["type"], obj["sha"]) for obj in js_obj
+                }
+            else:
+                # Parent is missing or is not a directory
+                listings[parent] = {}
+        return listings[parent].get(name)
+
+    def _recordContentChange(self, branch, path, js_obj):
+        """
+        Update cached information using the response of a contents api write
+
+        The new head commit is recorded, if it directly follows the cached head
+        the cached directory listings are carried over with the change applied.
+        """
+        commit = js_obj.get("commit") if isinstance(js_obj, dict) else None
+        if not commit:
+            return
+        old_head = self._branch_current_commit_sha.get(branch)
+        self._branch_current_commit_sha[branch] = commit["sha"]
+        if self._repo_root_branch == branch:
+            self._repo_root_initialized = False
+
+        cached_head, listings = self._path_cache.pop(branch, (None, {}))
+        parents = [parent["sha"] for parent in commit.get("parents", [])]
+        if cached_head is None or cached_head != old_head or old_head not in parents:
+            return
+        parent, _, name = path.rpartition("/")
+        if parent in listings:
+            content = js_obj.get("content")
+            if content:
+                listings[parent][name] = (content["type"], content["sha"])
+            else:
+                listings[parent].pop(name, None)
+        self._path_cache[branch] = (commit["sha"], listings)
+
+    @traced
+    def pathExists(self, path, branch=None, refresh=False):
+        """
+        Determine if path exists on branch without fetching the branch tree
+
+        Set refresh to True to fetch the latest head of the branch instead of
+        relying on the locally cached head.
+        """
+        if branch is None:
+            branch = self.default_branch
+        return self._lookupPath(path, branch, refresh) is not None
 
-    def _generateContent(self, head):
-        contents = {}
+    @traced
+    def getPathSha(self, path, branch=None, refresh=False):
+        """
+        Returns the sha of the object at path on branch or None if it is missing
 
-        dir_path = head.relative_path
-        for file_name in head.files:
-            contents[dir_path + "/" + file_name] = [file_name, head.getSha(file_name)]
-        for misc_name in head.miscellaneous:
-            contents[dir_path + "/" + misc_name] = [misc_name, head.getSha(misc_name)]
-        for node in head.nodes:
-            node_content = self._generateContent(node)
-            contents[dir_path + "/" + node.name] = [node.name, node.sha]
-            contents.update(node_content)
-        return contents
+        Only the parent directory of the path is fetched, so this takes one
+        or two requests regardless of the size of the repository.
+        """
+        if branch is None:
+            branch = self.default_branch
+        entry = self._lookupPath(path, branch, refresh)
+        if entry is None:
+            return None
+        return entry[1]
 
-    def refreshBranchTreeCache(self, branch):
+    @traced
+    def refreshBranchTreeCache(self, branch, lazy=False):
         """
         Method forces an update of the localy stored branch contents.
 
@@ -883,98 +1680,365 @@ class GitHubApp:
         is updated. For instance if a file is added remotely. If however, you
         are not worried about remote changes then it is not necessary, and it is
         much faster to used the locally cached contents.
+
+        If lazy is True the directories of the tree are only fetched when
+        they are first traversed. With a mirror, see useMirror, the whole tree
+        is always read locally.
         """
+        if self._mirror is not None:
+            return self._refreshMirrorTree(branch)
+
         # 1. Check if branch exists
         js_obj, _ = self._PYCURL(self._header, self._repo_url + "/branches", "GET")
 
-        # Reset the cache
-        old_content = copy.deepcopy(self._repo_root)
-        self._repo_root = Node()
+        # The new tree is only cached once it is complete, so the cached tree
+        # is left untouched if the branch is missing or a request fails
         for obj in js_obj:
             if obj["name"] == branch:
 
-                # Get the top level directory structure
-                js_obj2, _ = self._PYCURL(
-                    self._header,
-                    self._repo_url + "/contents?ref=" + branch,
-                    custom_data={"branch": branch},
-                )
-
-                for obj2 in js_obj2:
-                    self._repo_root.insert(obj2["name"], obj2["type"], obj2["sha"])
-
-                self._fillTree(self._repo_root, branch)
+                if lazy:
+                    root = Node(loader=self._lazyDirectoryLoader(branch))
+                else:
+                    # Get the top level directory structure
+                    root = Node()
+                    self._fetchDirectory(root, branch)
+                    self._fillTree(root, branch)
 
+                self._repo_root = root
                 self._repo_root_branch = branch
                 self._repo_root_initialized = True
+                self._repo_root_lazy = lazy
                 return self._repo_root
 
-        # Make idempotent revert the changes
-        self._repo_root = old_content
         raise Exception(
             "Branch missing from repository {} cannot refresh branch tree cache".format(
                 branch
             )
         )
 
+    @traced
     def getContents(self, branch=None):
         """
         Returns the contents of a branch
 
-        Returns the contents of a branch as a dictionary, where the key
-        is the content path and the value is a list of the file folder name
-        and the sha of the file/folder etc.
+        Returns the contents of a branch as a read-only mapping, where the key
+        is the content path and the value is a tuple of the file folder name
+        and the sha of the file/folder etc. The mapping is maintained by the
+        cached branch tree so repeated calls do not rebuild it.
         """
         branch_tree = self.getBranchTree(branch)
-        return self._generateContent(branch_tree)
+        return branch_tree.contents
 
-    def remove(self, file_name_path, branch=None, file_sha=None, use_wiki=False):
+    @traced
+    def remove(
+        self, file_name_path, branch=None, file_sha=None, use_wiki=False, journal=None
+    ):
         """
         This method will remove a file from the listed branch.
 
         Provide the file name and path with respect to the repository root.
+        If a journal is provided the removal is recorded in it.
         """
         if branch is None:
             branch = "master"
-        # First check that the file exists in the repository
-        branch_tree = self.getBranchTree(branch)
-        # Only remove if the file actually exists
-        if branch_tree.exists(file_name_path):
-
-            if file_sha is None:
-                # Attempt to get it from the branch tree
-                file_sha = branch_tree.getSha(file_name_path)
-                if file_sha is None:
+        operation = None
+        if journal is not None:
+            operation = journal.begin(
+                "remove", {"branch": branch, "path": file_name_path}
+            )
+            if operation.get("commit") is not None:
+                self._log.info("Removal of (%s) already completed" % file_name_path)
+                operation.complete()
+                return
+        if file_name_path.startswith("/"):
+            file_name_path = file_name_path[1:]
+        elif file_name_path.startswith("./"):
+            file_name_path = file_name_path[2:]
+
+        # The path is first looked up using the cached head of the branch, if
+        # it looks missing or the sha is out of date the head is refreshed
+        for refresh in [False, True]:
+            # First check that the file exists in the repository
+            entry = self._lookupPath(file_name_path, branch, refresh)
+            # Only remove if the file actually exists
+            if entry is None:
+                if refresh:
+                    break
+                continue
+
+            sha = file_sha
+            if sha is None:
+                # Attempt to get it from the parent directory listing
+                sha = entry[1]
+                if sha is None:
                     error_msg = "Unable to remove existing file: "
                     error_msg += "{}, sha is unknown.".format(file_name_path)
                     raise Exception(error_msg)
 
-            if file_name_path.startswith("/"):
-                file_name_path = file_name_path[1:]
-            elif file_name_path.startswith("./"):
-                file_name_path = file_name_path[2:]
-
             message = self._name + " is removing {}".format(file_name_path)
 
-            self._PYCURL(
+            js_obj, code = self._PYCURL(
                 self._header,
                 self._repo_url + "/contents/" + file_name_path,
                 "DELETE",
                 custom_data={
                     "branch": branch,
-                    "sha": file_sha,
+                    "sha": sha,
                     "message": message,
                 },
             )
+            self._recordContentChange(branch, file_name_path, js_obj)
+            if operation is not None and int(code) == 200:
+                operation.record("commit", sha=js_obj["commit"]["sha"])
+            # Only a sha taken from a stale listing is worth retrying
+            if int(code) != 409 or refresh or file_sha is not None:
+                break
+            self._log.warning(
+                "Branch (%s) changed since it was cached, retrying removal of (%s)"
+                % (branch, file_name_path)
+            )
+        if operation is not None:
+            operation.complete()
+
+    def _removeEntries(self, branch, paths, dry_run, journal, operation_name):
+        """Delete the resolved file paths from branch with a single commit."""
+        paths = sorted(paths)
+        if dry_run:
+            for path in paths:
+                self._log.info("Would remove (%s) from branch (%s)" % (path, branch))
+            return paths
+        if not paths:
+            self._log.info("Nothing to remove from branch (%s)" % branch)
+            return paths
+
+        operation = None
+        if journal is not None:
+            operation = journal.begin(
+                operation_name, {"branch": branch, "paths": paths}
+            )
+        tree_entries = [
+            {"path": path, "mode": "100644", "type": "blob", "sha": None}
+            for path in paths
+        ]
+        message = "%s is removing %d files" % (self._name, len(paths))
+        self._log.info(message + " from branch (%s)" % branch)
+        self._commitTreeEntries(branch, tree_entries, message, operation)
+        if operation is not None:
+            operation.complete()
+        return paths
+
+    def _removableFiles(self, branch_tree):
+        """Returns the paths, without the leading ./, of files that can be removed."""
+        return [
+            path[2:]
+            for path, content_type, _ in branch_tree.walk()
+            if content_type != "dir"
+        ]
 
-    def upload(self, file_name, branch=None, use_wiki=False):
+    @traced
+    def removeMany(self, paths, branch=None, dry_run=False, journal=None):
         """
-        This method attempts to upload a file to the specified branch.
+        Remove many paths from a branch with a single commit
 
-        If the file is found to already exist it will be updated. Image
-        files will by default be placed in a figures branch of the main
-        repository, so as to not bloat the repositories commit history.
-        """
+        Paths are resolved against the cached branch tree, a directory
+        removes every file below it and paths that do not exist are skipped
+        with a warning. If dry_run is True nothing is removed.
+
+        Returns the list of file paths that were, or would be, removed.
+        """
+        if branch is None:
+            branch = "master"
+        if isinstance(paths, str):
+            paths = [paths]
+        branch_tree = self.getBranchTree(branch)
+
+        targets = set()
+        for path in paths:
+            path = "/".join([comp for comp in path.split("/") if comp not in ["", "."]])
+            if path == "":
+                error_msg = "Refusing to remove the root of branch: " + branch
+                raise Exception(error_msg)
+            if not branch_tree.exists(path):
+                self._log.warning("Cannot remove (%s), it does not exist" % path)
+                continue
+            targets.add(path)
+
+        to_remove = []
+        for path in self._removableFiles(branch_tree):
+            parent = path
+            while parent:
+                if parent in targets:
+                    to_remove.append(path)
+                    break
+                parent = parent.rpartition("/")[0]
+        return self._removeEntries(branch, to_remove, dry_run, journal, "removeMany")
+
+    @traced
+    def prune(self, pattern, branch=None, dry_run=False, journal=None):
+        """
+        Remove every file on a branch matching a glob pattern in a single commit
+
+        The pattern is matched against the path of each file relative to the
+        root of the repository e.g. "reports/2021-*/*.png". Note that * also
+        matches across directory separators. If dry_run is True nothing is
+        removed.
+
+        Returns the list of file paths that were, or would be, removed.
+        """
+        if branch is None:
+            branch = "master"
+        branch_tree = self.getBranchTree(branch)
+        to_remove = [
+            path
+            for path in self._removableFiles(branch_tree)
+            if fnmatch.fnmatchcase(path, pattern)
+        ]
+        return self._removeEntries(branch, to_remove, dry_run, journal, "prune")
+
+    def _blobCachePath(self, blob_sha):
+        return os.path.join(self._cache_dir, "blobs", blob_sha[:2], blob_sha[2:])
+
+    def _fetchBlob(self, blob_sha):
+        """
+        Returns the path of a blob in the local content addressed cache
+
+        If the blob is not cached its raw content is streamed to a temporary
+        file, which is only moved into the cache once its sha is verified.
+        """
+        cache_path = self._blobCachePath(blob_sha)
+        if os.path.isfile(cache_path):
+            return cache_path
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        header = [line for line in self._header if not line.startswith("Accept:")]
+        header.append("Accept: application/vnd.github.raw")
+
+        fd, temp_path = tempfile.mkstemp(
+            prefix=".download-", dir=os.path.dirname(cache_path)
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                with self._span("GitHubApp._fetchBlob", blob=blob_sha):
+                    _, code, _ = self._request(
+                        header, self._repo_url + "/git/blobs/" + blob_sha, sink=f
+                    )
+            if int(code) != 200:
+                error_msg = "Unable to download blob " + blob_sha
+                error_msg = error_msg + " code " + str(code)
+                raise Exception(error_msg)
+            if gitBlobSha(temp_path) != blob_sha:
+                raise Exception("Downloaded content does not match blob " + blob_sha)
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return cache_path
+
+    def _downloadPlan(self, paths, branch):
+        """Returns the blob sha of each path, looked up in the cached branch tree."""
+        tree = self.getBranchTree(branch, lazy=True)
+        shas = []
+        for path in paths:
+            if tree.type(path) != "file":
+                error_msg = "file: " + path + " does not exist in branch "
+                error_msg = error_msg + branch + " of the repository."
+                raise Exception(error_msg)
+            shas.append(tree.getSha(path))
+        return shas
+
+    def _isDownloaded(self, dest, blob_sha):
+        return os.path.isfile(dest) and self._blobShaCache().sha(dest) == blob_sha
+
+    def _copyBlob(self, blob_sha, dest):
+        dest_dir = os.path.dirname(os.path.abspath(dest))
+        os.makedirs(dest_dir, exist_ok=True)
+        shutil.copyfile(self._blobCachePath(blob_sha), dest)
+        # The content is known so the copy does not need to be hashed again
+        key = os.path.abspath(dest)
+        self._blobShaCache()._store(key, os.stat(key), blob_sha)
+
+    @traced
+    def download(self, path, branch=None, dest=None):
+        """
+        Download a file from a branch
+
+        dest defaults to the name of the file in the current directory, if it
+        is a directory the file is placed in it. See downloadMany for how
+        files are downloaded.
+
+        Returns the path of the downloaded file.
+        """
+        if dest is None:
+            dest = os.path.basename(path)
+        elif os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(path))
+        return self.downloadMany({path: dest}, branch)[path]
+
+    @traced
+    def downloadMany(self, paths, branch=None, dest=".", max_workers=8):
+        """
+        Download many files from a branch
+
+        paths is a list of paths in the repository, which are downloaded to
+        the same relative paths below dest, or a dictionary mapping each path
+        to the local file it should be downloaded to.
+
+        The blob sha of each file is looked up in the cached branch tree, see
+        getBranchTree, so a stale cache downloads the files as they were when
+        it was refreshed. Blobs are streamed to disk through a local cache
+        keyed by their sha, so a blob is never downloaded twice, and files
+        that already hold the content are left untouched. Missing blobs are
+        downloaded in parallel using at most max_workers concurrent requests.
+
+        Returns a dictionary mapping each path to the local file.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        if branch is None:
+            branch = self.default_branch
+        if isinstance(paths, dict):
+            dests = dict(paths)
+        else:
+            dests = {
+                path: os.path.join(
+                    dest, *[comp for comp in path.split("/") if comp not in ["", "."]]
+                )
+                for path in paths
+            }
+        shas = dict(zip(dests, self._downloadPlan(list(dests), branch)))
+
+        changed = [
+            path for path in dests if not self._isDownloaded(dests[path], shas[path])
+        ]
+        missing = sorted(
+            set(
+                shas[path]
+                for path in changed
+                if not os.path.isfile(self._blobCachePath(shas[path]))
+            )
+        )
+        if missing:
+            self._log.info(
+                "Downloading %d blobs from branch (%s)" % (len(missing), branch)
+            )
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(self._fetchBlob, missing))
+        for path in changed:
+            self._copyBlob(shas[path], dests[path])
+        self._saveBlobShaCache()
+        return dests
+
+    @traced
+    def upload(self, file_name, branch=None, use_wiki=False, journal=None):
+        """
+        This method attempts to upload a file to the specified branch.
+
+        If the file is found to already exist it will be updated. Image
+        files will by default be placed in a figures branch of the main
+        repository, so as to not bloat the repositories commit history.
+
+        If a journal is provided the upload is recorded in it, re-running an
+        upload that already completed will not create another commit.
+        """
 
         # Will only be needed if we are creating a branch
         branch_to_fork_from = self.default_branch
@@ -1011,23 +2075,7 @@ class GitHubApp:
                 commit_msg = "Updating file " + file_name
             else:
                 commit_msg = "Adding file " + file_name
-            repo = self.getWikiRepo(branch)
-            destination = (
-                self._app_wiki_dir + "/" + os.path.basename(os.path.normpath(file_name))
-            )
-            if not filecmp.cmp(file_name, destination):
-                shutil.copy(file_name, destination)
-            repo.index.add(
-                [
-                    str(
-                        self._app_wiki_dir
-                        + "/"
-                        + os.path.basename(os.path.normpath(file_name))
-                    )
-                ]
-            )
-            repo.index.commit(commit_msg)
-            repo.git.push("--set-upstream", "origin", repo.head.reference)
+            self.publishWikiFiles([file_name], commit_msg)
             return
 
         if self._create_branch:
@@ -1036,51 +2084,778 @@ class GitHubApp:
             error_msg = "branch: " + branch + " does not exist in repository."
             raise Exception(error_msg)
 
-        contents = self.getContents(branch)
+        with self._span("GitHubApp.upload.hash", file=file_name):
+            local_sha = self._localBlobSha(file_name)
+            self._saveBlobShaCache()
+
+        operation = None
+        if journal is not None:
+            operation = journal.begin(
+                "upload",
+                {
+                    "branch": branch,
+                    "path": os.path.basename(os.path.normpath(file_name)),
+                },
+            )
+            # The file may have changed since an interrupted run
+            if operation.get("commit", "content") == local_sha:
+                self._log.info("Upload of (%s) already completed" % file_name)
+                operation.complete()
+                return
+
+        name = os.path.basename(os.path.normpath(file_name))
+        encoded_file = None
+        # The path is first looked up using the cached head of the branch, if
+        # the branch has moved on since the upload is retried with a fresh head
+        for refresh in [False, True]:
+            remote_sha = self.getPathSha(name, branch, refresh)
+
+            file_found = False
+            if remote_sha is not None:
+                self._log.warning(
+                    "File (%s) already exists in branch:%s" % (name, branch)
+                )
+                file_found = True
 
-        file_found = False
-        if os.path.basename(os.path.normpath(file_name)) in contents:
+                if local_sha == remote_sha:
+                    self._log.info(
+                        "File (%s) is unchanged in branch (%s), skipping upload"
+                        % (name, branch)
+                    )
+                    if operation is not None:
+                        operation.complete()
+                    return
+
+            # 2. convert file into base64 format
+            # b is needed if it is a png or image file/ binary file
+            if encoded_file is None:
+                with self._span("GitHubApp.upload.encode", file=file_name):
+                    with open(file_name, "rb") as f:
+                        encoded_file = base64.b64encode(f.read())
+
+            # 3. upload the file, overwrite if exists already
+            custom_data = {
+                "message": "%s %s file %s"
+                % (self._name, "overwriting" if file_found else "uploading", name),
+                "name": self._name,
+                "branch": branch,
+                "content": encoded_file.decode("ascii"),
+            }
+
+            if file_found:
+                custom_data["sha"] = remote_sha
+
+            self._log.info("Uploading file (%s) to branch (%s)" % (name, branch))
+            https_url_to_file = self._repo_url + "/contents/" + name
+
+            js_obj, code = self._PYCURL(
+                self._header, https_url_to_file, "PUT", custom_data
+            )
+            # 409 the sha is out of date, 422 the sha is missing
+            if int(code) not in [409, 422] or refresh:
+                break
             self._log.warning(
-                "File (%s) already exists in branch:%s"
-                % (os.path.basename(os.path.normpath(file_name)), branch)
+                "Branch (%s) changed since it was cached, retrying upload of (%s)"
+                % (branch, name)
             )
-            file_found = True
 
-        # 2. convert file into base64 format
-        # b is needed if it is a png or image file/ binary file
-        with open(file_name, "rb") as f:
-            data = f.read()
-        encoded_file = base64.b64encode(data)
+        self._recordContentChange(branch, name, js_obj)
+        if operation is not None and int(code) in [200, 201]:
+            operation.record("commit", sha=js_obj["commit"]["sha"], content=local_sha)
+            operation.complete()
+
+    def _createBlob(self, file_name):
+        """Upload the contents of a local file as a git blob and return its sha."""
+        with self._span("GitHubApp._createBlob", file=file_name):
+            with open(file_name, "rb") as f:
+                encoded_file = base64.b64encode(f.read())
+            # Blobs are content addressed so creating one twice is harmless
+            js_obj, code = self._PYCURL(
+                self._header,
+                self._repo_url + "/git/blobs",
+                option="POST",
+                custom_data={
+                    "content": encoded_file.decode("ascii"),
+                    "encoding": "base64",
+                },
+                idempotent=True,
+            )
+        if int(code) != 201:
+            error_msg = "Unable to create blob for file: " + file_name
+            raise Exception(error_msg)
+        return js_obj["sha"]
+
+    def _createBlobs(self, executor, file_names, paths, local_shas, operation=None):
+        """
+        Create blobs for many local files in parallel and return their shas
+
+        Blobs recorded in the journal operation with the expected sha by an
+        earlier run are not created again.
+        """
+
+        def createBlob(index):
+            if operation is not None:
+                if operation.blobs.get(paths[index]) == local_shas[index]:
+                    return local_shas[index]
+            blob_sha = self._createBlob(file_names[index])
+            if operation is not None:
+                operation.recordBlob(paths[index], blob_sha)
+            return blob_sha
+
+        return list(executor.map(createBlob, range(len(file_names))))
+
+    def _createTree(self, base_commit_sha, tree_entries):
+        """
+        Create a tree from the tree of base_commit_sha with entries changed
+
+        Each entry is a dict with the path, mode, type and sha as expected by
+        the git trees api, an entry with a sha of None removes the path.
+        """
+        js_obj, _ = self._PYCURL(
+            self._header, self._repo_url + "/git/commits/" + base_commit_sha
+        )
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/git/trees",
+            option="POST",
+            custom_data={"base_tree": js_obj["tree"]["sha"], "tree": tree_entries},
+            idempotent=True,
+        )
+        if int(code) != 201:
+            raise Exception("Unable to create tree on top of " + base_commit_sha)
+        return js_obj["sha"]
+
+    def _createCommit(self, tree_sha, parent_sha, message):
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/git/commits",
+            option="POST",
+            custom_data={"message": message, "tree": tree_sha, "parents": [parent_sha]},
+        )
+        if int(code) != 201:
+            raise Exception("Unable to create commit for tree " + tree_sha)
+        return js_obj["sha"]
+
+    def _updateBranchRef(self, branch, commit_sha, update_remote=True):
+        """Fast forward branch to commit_sha and update the cached branch state."""
+        if update_remote:
+            js_obj, code = self._PYCURL(
+                self._header,
+                self._repo_url + "/git/refs/heads/" + branch,
+                option="PATCH",
+                custom_data={"sha": commit_sha, "force": False},
+            )
+            if int(code) != 200:
+                error_msg = "Unable to update branch " + branch + " to " + commit_sha
+                raise Exception(error_msg)
+        self._branch_current_commit_sha[branch] = commit_sha
+        self._path_cache.pop(branch, None)
+        if self._repo_root_branch == branch:
+            self._repo_root_initialized = False
+
+    def _commitTreeEntries(self, branch, tree_entries, message, operation=None):
+        """
+        Apply tree_entries to branch as a single commit
 
-        # 3. upload the file, overwrite if exists already
+        Returns the sha of the new commit. If a journal operation is provided
+        each step is recorded, and steps already recorded by an earlier run
+        are reused as long as they were made for the same tree entries and
+        the branch has not moved on in the meantime.
+        """
+        entries_sha = hashlib.sha1(
+            json.dumps(tree_entries, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        def recorded(step, key="sha"):
+            if operation is None or operation.get(step, "entries") != entries_sha:
+                return None
+            return operation.get(step, key)
+
+        if recorded("ref") is not None:
+            return recorded("ref")
+
+        head_sha = self._branchHead(branch, refresh=True)
+        if head_sha is None:
+            error_msg = "branch: " + branch + " does not exist in repository."
+            raise Exception(error_msg)
+
+        commit_sha = recorded("commit")
+        if commit_sha is not None:
+            if head_sha == commit_sha:
+                # The branch was updated but the update was never recorded
+                operation.record("ref", sha=commit_sha, entries=entries_sha)
+                self._updateBranchRef(branch, commit_sha, update_remote=False)
+                return commit_sha
+            if head_sha == recorded("commit", "parent"):
+                self._updateBranchRef(branch, commit_sha)
+                operation.record("ref", sha=commit_sha, entries=entries_sha)
+                return commit_sha
+
+        tree_sha = None
+        if recorded("tree", "base") == head_sha:
+            tree_sha = recorded("tree")
+        if tree_sha is None:
+            tree_sha = self._createTree(head_sha, tree_entries)
+            if operation is not None:
+                operation.record(
+                    "tree", sha=tree_sha, base=head_sha, entries=entries_sha
+                )
+        commit_sha = self._createCommit(tree_sha, head_sha, message)
+        if operation is not None:
+            operation.record(
+                "commit", sha=commit_sha, parent=head_sha, entries=entries_sha
+            )
+        self._updateBranchRef(branch, commit_sha)
+        if operation is not None:
+            operation.record("ref", sha=commit_sha, entries=entries_sha)
+        return commit_sha
+
+    def _webUrl(self):
+        """Returns the url of the github web interface the api belongs to."""
+        split_url = urllib.parse.urlsplit(self._base_url)
+        netloc = split_url.netloc
+        if netloc.startswith("api."):
+            netloc = netloc[len("api.") :]
+        # GitHub Enterprise serves the api from /api/v3 of the same host
+        return split_url.scheme + "://" + netloc
+
+    def _rawUrl(self, ref, path):
+        raw_url = self._raw_url
+        if raw_url is None:
+            if self._webUrl() == "https://github.com":
+                raw_url = "https://raw.githubusercontent.com"
+            else:
+                raw_url = self._webUrl() + "/raw"
+        return (
+            raw_url
+            + "/"
+            + self._user
+            + "/"
+            + self._repo_name
+            + "/"
+            + ref
+            + "/"
+            + urllib.parse.quote(path)
+        )
+
+    def _filesByName(self, file_names, destination):
+        """
+        Returns a dictionary mapping the base name of each file to the file
+
+        Raises an exception if two different files have the same base name,
+        as they would overwrite each other in destination. A file listed more
+        than once is only included once.
+        """
+        files_by_name = {}
+        for file_name in file_names:
+            name = os.path.basename(os.path.normpath(file_name))
+            other = files_by_name.setdefault(name, file_name)
+            if os.path.abspath(other) != os.path.abspath(file_name):
+                error_msg = "Files {} and {} have the same name {} in the {}".format(
+                    other, file_name, name, destination
+                )
+                raise Exception(error_msg)
+        return files_by_name
+
+    @traced
+    def uploadImages(self, file_names, branch=None, max_workers=8, journal=None):
+        """
+        Upload many images to the figures branch in a single commit
+
+        The figures branch is created if needed and allowed, files are hashed
+        and the changed ones uploaded as blobs in parallel, using at most
+        max_workers concurrent requests. All changed images are then committed
+        with a single tree update, unchanged images are skipped.
+
+        If a journal is provided the created blobs and the commit are recorded,
+        so a re-run after a failure does not recreate them.
+
+        Returns a dictionary mapping each file name to the raw url of the
+        image, the urls refer to the resulting commit so they can be embedded
+        immediately. Images are placed at the root of the branch, so an
+        exception is raised if two different files have the same name.
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        files_by_name = self._filesByName(file_names, "branch")
+        if branch is None:
+            branch = self._default_image_branch
+
+        if self._create_branch:
+            self.createBranch(branch, "master")
+        elif not self.branchExist(branch):
+            error_msg = "branch: " + branch + " does not exist in repository."
+            raise Exception(error_msg)
+
+        names = list(files_by_name)
+        file_names = list(files_by_name.values())
+        remote_shas = [self.getPathSha(name, branch) for name in names]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            local_shas = list(executor.map(self._localBlobSha, file_names))
+            self._saveBlobShaCache()
+
+            operation = None
+            if journal is not None:
+                operation = journal.begin(
+                    "uploadImages", {"branch": branch, "paths": names}
+                )
+
+            changed = [
+                index
+                for index in range(len(file_names))
+                if local_shas[index] != remote_shas[index]
+            ]
+
+            blob_shas = self._createBlobs(
+                executor,
+                [file_names[index] for index in changed],
+                [names[index] for index in changed],
+                [local_shas[index] for index in changed],
+                operation,
+            )
+
+        if changed:
+            tree_entries = [
+                {
+                    "path": names[index],
+                    "mode": "100644",
+                    "type": "blob",
+                    "sha": blob_sha,
+                }
+                for index, blob_sha in zip(changed, blob_shas)
+            ]
+            message = "%s uploading %d image files" % (self._name, len(changed))
+            self._log.info(
+                "Uploading %d of %d images to branch (%s)"
+                % (len(changed), len(file_names), branch)
+            )
+            head_sha = self._commitTreeEntries(branch, tree_entries, message, operation)
+        else:
+            self._log.info("All images are unchanged in branch (%s)" % branch)
+            head_sha = self._branchHead(branch)
+        if operation is not None:
+            operation.complete()
+
+        return {
+            file_name: self._rawUrl(head_sha, name)
+            for name, file_name in files_by_name.items()
+        }
+
+    @traced
+    def getRelease(self, tag):
+        """Returns the release with tag or None if there is no such release."""
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/releases/tags/" + urllib.parse.quote(tag, safe=""),
+        )
+        if int(code) != 200:
+            return None
+        return js_obj
+
+    @traced
+    def createRelease(
+        self,
+        tag,
+        name=None,
+        body=None,
+        target_commitish=None,
+        draft=False,
+        prerelease=False,
+    ):
+        """
+        Create a release, the tag is created from target_commitish if needed
+
+        target_commitish defaults to the default branch. Returns the release.
+        """
         custom_data = {
-            "message": "%s %s file %s"
-            % (
-                self._name,
-                "overwriting" if file_found else "uploading",
-                os.path.basename(os.path.normpath(file_name)),
-            ),
-            "name": self._name,
-            "branch": branch,
-            "content": encoded_file.decode("ascii"),
+            "tag_name": tag,
+            "name": name if name is not None else tag,
+            "draft": draft,
+            "prerelease": prerelease,
         }
+        if body is not None:
+            custom_data["body"] = body
+        if target_commitish is not None:
+            custom_data["target_commitish"] = target_commitish
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/releases",
+            option="POST",
+            custom_data=custom_data,
+        )
+        if int(code) != 201:
+            error_msg = "Unable to create release " + tag + " code " + str(code)
+            raise Exception(error_msg)
+        self._log.info("Created release %s" % tag)
+        return js_obj
+
+    def _releaseAssets(self, release):
+        """Returns every asset of a release, the assets embedded in it are capped."""
+        assets = []
+        page = 1
+        while True:
+            js_obj, code = self._PYCURL(
+                self._header,
+                self._repo_url
+                + "/releases/"
+                + str(release["id"])
+                + "/assets?per_page=100&page="
+                + str(page),
+            )
+            if int(code) != 200:
+                error_msg = "Unable to list the assets of release "
+                error_msg = error_msg + release["tag_name"] + " code " + str(code)
+                raise Exception(error_msg)
+            assets.extend(js_obj)
+            if len(js_obj) < 100:
+                return assets
+            page += 1
 
-        if file_found:
-            custom_data["sha"] = contents[os.path.basename(os.path.normpath(file_name))]
+    def _assetIsCurrent(self, asset, file_name):
+        """
+        Check whether an uploaded asset has the same content as a local file
+
+        The sizes are compared first, the sha256 of the file is only computed
+        when the size matches and github reports a digest for the asset.
+        Servers that do not report digests give no way to compare contents
+        without downloading the asset, so an asset of the same size is then
+        only considered current if it was uploaded after the file was last
+        modified.
+        """
+        if asset["size"] != os.path.getsize(file_name):
+            return False
+        digest = asset.get("digest")
+        if digest is not None and digest.startswith("sha256:"):
+            return digest[len("sha256:") :] == fileSha256(file_name)
+        uploaded = datetime.datetime.strptime(
+            asset["updated_at"], "%Y-%m-%dT%H:%M:%SZ"
+        ).replace(tzinfo=datetime.timezone.utc)
+        return uploaded.timestamp() > os.path.getmtime(file_name)
+
+    def _uploadReleaseAsset(self, release, file_name, name, content_type):
+        # upload_url is a uri template, e.g. .../assets{?name,label}
+        url = release["upload_url"].split("{", 1)[0]
+        url = url + "?name=" + urllib.parse.quote(name, safe="")
+        header = list(self._header)
+        header.append("Content-Type: " + content_type)
+        with open(file_name, "rb") as f:
+            with self._span("GitHubApp._uploadReleaseAsset", file=name):
+                js_obj, code, _ = self._request(header, url, "POST", source=f)
+        if int(code) != 201:
+            error_msg = "Unable to upload " + file_name + " to release "
+            error_msg = error_msg + release["tag_name"] + " code " + str(code)
+            raise Exception(error_msg)
+        return js_obj
 
-        self._log.info(
-            "Uploading file (%s) to branch (%s)"
-            % (os.path.basename(os.path.normpath(file_name)), branch)
+    def _renameReleaseAsset(self, asset, name):
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/releases/assets/" + str(asset["id"]),
+            option="PATCH",
+            custom_data={"name": name},
+            idempotent=True,
         )
-        https_url_to_file = (
-            self._repo_url
-            + "/contents/"
-            + os.path.basename(os.path.normpath(file_name))
+        if int(code) != 200:
+            error_msg = "Unable to rename release asset " + asset["name"]
+            error_msg = error_msg + " to " + name + " code " + str(code)
+            raise Exception(error_msg)
+        return js_obj
+
+    def _deleteReleaseAsset(self, asset):
+        _, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/releases/assets/" + str(asset["id"]),
+            option="DELETE",
+            idempotent=True,
         )
+        if int(code) not in [204, 404]:
+            error_msg = "Unable to delete release asset " + asset["name"]
+            error_msg = error_msg + " code " + str(code)
+            raise Exception(error_msg)
+
+    @traced
+    def uploadReleaseAssets(
+        self,
+        tag,
+        file_names,
+        content_type="application/octet-stream",
+        max_workers=4,
+        create_release=True,
+    ):
+        """
+        Publish files as the assets of the release with tag
+
+        Unlike upload, which goes through the contents api, the files are
+        streamed raw to the uploads endpoint, so they are neither base64
+        encoded nor read into memory and can be as large as release assets
+        allow. The release is created if it does not exist and create_release
+        is True. Up to max_workers files are uploaded concurrently.
+
+        An asset with the same name is only replaced if its size or sha256
+        differs from the local file, otherwise the file is skipped. A
+        replacement is first uploaded under a temporary name, so the old
+        asset is only deleted once the new one has been uploaded.
+
+        Returns a dictionary mapping each file name to the download url of
+        its asset. As assets are named after the base name of the file, an
+        exception is raised if two different files have the same name.
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        files_by_name = self._filesByName(file_names, "release")
+        release = self.getRelease(tag)
+        if release is None:
+            if not create_release:
+                raise Exception("release: " + tag + " does not exist in repository.")
+            release = self.createRelease(tag)
+        existing = {asset["name"]: asset for asset in self._releaseAssets(release)}
+
+        def publish(name):
+            file_name = files_by_name[name]
+            asset = existing.get(name)
+            if asset is None:
+                asset = self._uploadReleaseAsset(release, file_name, name, content_type)
+                return asset["browser_download_url"]
+            if self._assetIsCurrent(asset, file_name):
+                self._log.info("Release asset %s is unchanged" % name)
+                return asset["browser_download_url"]
+
+            temp_name = name + ".uploading"
+            if temp_name in existing:
+                # Left behind by an interrupted replacement
+                self._deleteReleaseAsset(existing[temp_name])
+            new_asset = self._uploadReleaseAsset(
+                release, file_name, temp_name, content_type
+            )
+            self._deleteReleaseAsset(asset)
+            try:
+                new_asset = self._renameReleaseAsset(new_asset, name)
+            except Exception:
+                self._log.error(
+                    "Release asset %s was replaced but is left named %s"
+                    % (name, temp_name)
+                )
+                raise
+            return new_asset["browser_download_url"]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            urls = dict(zip(files_by_name, executor.map(publish, files_by_name)))
+        return {
+            file_name: urls[os.path.basename(os.path.normpath(file_name))]
+            for file_name in file_names
+        }
+
+    def _gitTreeFiles(self, tree_sha):
+        """
+        Returns a dictionary mapping each regular file below a tree to (mode, sha)
+
+        The tree is listed recursively with a single request, if github
+        truncates the listing the subtrees are listed one at a time instead.
+        Paths are relative to the tree, symlinks and submodules are left out.
+        """
+        js_obj, code = self._PYCURL(
+            self._header, self._repo_url + "/git/trees/" + tree_sha + "?recursive=1"
+        )
+        if int(code) != 200:
+            raise Exception("Unable to list tree " + tree_sha)
+        if js_obj.get("truncated"):
+            js_obj = {"tree": []}
+            pending = [("", tree_sha)]
+            while pending:
+                prefix, sub_tree_sha = pending.pop()
+                sub_tree, code = self._PYCURL(
+                    self._header, self._repo_url + "/git/trees/" + sub_tree_sha
+                )
+                if int(code) != 200:
+                    raise Exception("Unable to list tree " + sub_tree_sha)
+                for entry in sub_tree["tree"]:
+                    entry["path"] = prefix + entry["path"]
+                    if entry["type"] == "tree":
+                        pending.append((entry["path"] + "/", entry["sha"]))
+                    js_obj["tree"].append(entry)
+        return {
+            entry["path"]: (entry["mode"], entry["sha"])
+            for entry in js_obj["tree"]
+            if entry["type"] == "blob" and entry["mode"] in ["100644", "100755"]
+        }
+
+    def _remoteFiles(self, branch, prefix):
+        """
+        Returns a dictionary mapping each regular file under prefix to (mode, sha)
+
+        The paths are relative to the root of the branch, only the tree of
+        the prefix directory is listed.
+        """
+        head_sha = self._branchHead(branch, refresh=True)
+        if head_sha is None:
+            error_msg = "branch: " + branch + " does not exist in repository."
+            raise Exception(error_msg)
+        if prefix:
+            entry = self._lookupPath(prefix, branch)
+            if entry is None or entry[0] != "dir":
+                return {}
+            tree_sha = entry[1]
+        else:
+            js_obj, _ = self._PYCURL(
+                self._header, self._repo_url + "/git/commits/" + head_sha
+            )
+            tree_sha = js_obj["tree"]["sha"]
+        repo_prefix = prefix + "/" if prefix else ""
+        return {
+            repo_prefix + path: entry
+            for path, entry in self._gitTreeFiles(tree_sha).items()
+        }
 
-        self._PYCURL(self._header, https_url_to_file, "PUT", custom_data)
+    @traced
+    def sync(
+        self,
+        local_dir,
+        branch=None,
+        prefix="",
+        max_workers=8,
+        process_threshold=512,
+        journal=None,
+    ):
+        """
+        Mirror a local directory to a folder of a branch in a single commit
 
-    def getBranchTree(self, branch=None):
+        The files in local_dir are compared by blob sha and mode, i.e.
+        whether they are executable, with the files under prefix on the
+        branch. Only the tree under prefix is fetched, with as few requests
+        as possible. New and changed files are uploaded and files that no
+        longer exist locally are deleted, all in one commit.
+        Using an empty prefix mirrors the directory to the root of the branch,
+        so every file not found locally is removed.
+
+        If there are more than process_threshold files that need to be hashed
+        the hashing is done in a process pool.
+
+        Returns a dictionary with the added, modified and deleted paths.
+        """
+        if branch is None:
+            branch = self.default_branch
+        if self._create_branch:
+            self.createBranch(branch)
+        elif not self.branchExist(branch):
+            error_msg = "branch: " + branch + " does not exist in repository."
+            raise Exception(error_msg)
+        if not os.path.isdir(local_dir):
+            raise Exception("Cannot sync, not a directory: " + local_dir)
+
+        prefix = "/".join([comp for comp in prefix.split("/") if comp not in ["", "."]])
+        repo_prefix = "./" + prefix + "/" if prefix else "./"
+
+        # 1. collect the local files and their paths in the repository
+        file_names = []
+        paths = []
+        modes = []
+        for dir_path, dir_names, dir_files in os.walk(local_dir):
+            dir_names.sort()
+            for dir_file in sorted(dir_files):
+                file_name = os.path.join(dir_path, dir_file)
+                rel_path = os.path.relpath(file_name, local_dir).replace(os.sep, "/")
+                file_names.append(file_name)
+                paths.append(repo_prefix[2:] + rel_path)
+                executable = os.stat(file_name).st_mode & 0o111
+                modes.append("100755" if executable else "100644")
+
+        cache = self._blobShaCache()
+        missing = cache.countMissing(file_names)
+        with self._span("GitHubApp.sync.hash", files=len(file_names), missing=missing):
+            if missing > process_threshold:
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor() as executor:
+                    local_shas = cache.shaMany(file_names, executor)
+            else:
+                local_shas = cache.shaMany(file_names)
+            cache.save()
+
+        # 2. diff against the remote files under the prefix
+        remote = self._remoteFiles(branch, prefix)
+
+        added = []
+        modified = []
+        changed = []
+        for index, path in enumerate(paths):
+            remote_mode, remote_sha = remote.pop(path, (None, None))
+            if remote_sha is None:
+                added.append(path)
+                changed.append(index)
+            elif remote_sha != local_shas[index] or remote_mode != modes[index]:
+                modified.append(path)
+                changed.append(index)
+        deleted = sorted(remote.keys())
+
+        operation = None
+        if journal is not None:
+            operation = journal.begin("sync", {"branch": branch, "prefix": prefix})
+
+        result = {"added": added, "modified": modified, "deleted": deleted}
+        if not changed and not deleted:
+            self._log.info(
+                "Branch (%s) is already in sync with %s" % (branch, local_dir)
+            )
+            if operation is not None:
+                operation.complete()
+            return result
+
+        # 3. upload the changed blobs and commit everything at once
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            blob_shas = self._createBlobs(
+                executor,
+                [file_names[index] for index in changed],
+                [paths[index] for index in changed],
+                [local_shas[index] for index in changed],
+                operation,
+            )
+        tree_entries = [
+            {"path": paths[index], "mode": modes[index], "type": "blob", "sha": sha}
+            for index, sha in zip(changed, blob_shas)
+        ]
+        tree_entries += [
+            {"path": path, "mode": "100644", "type": "blob", "sha": None}
+            for path in deleted
+        ]
+        message = "%s syncing %s: %d added, %d modified, %d deleted" % (
+            self._name,
+            prefix if prefix else "/",
+            len(added),
+            len(modified),
+            len(deleted),
+        )
+        self._log.info(message)
+        self._commitTreeEntries(branch, tree_entries, message, operation)
+        if operation is not None:
+            operation.complete()
+        return result
+
+    def _refreshMirrorTree(self, branch):
+        head_sha = self._branchHead(branch, refresh=True)
+        if head_sha is None:
+            raise Exception(
+                "Branch missing from repository {} cannot refresh branch tree cache".format(
+                    branch
+                )
+            )
+        root = Node()
+        nodes = {"": root}
+        for path, content_type, sha in self._mirror.tree(head_sha):
+            parent, _, name = path.rpartition("/")
+            if content_type not in ["dir", "file"]:
+                content_type = "misc"
+            nodes[parent].insert(name, content_type, sha)
+            if content_type == "dir":
+                nodes[path] = nodes[parent].nodes[-1]
+        self._repo_root = root
+        self._repo_root_branch = branch
+        self._repo_root_initialized = True
+        self._repo_root_lazy = False
+        return self._repo_root
+
+    @traced
+    def getBranchTree(self, branch=None, lazy=False):
         """
         Gets the contents of a branch as a tree
 
@@ -1089,18 +2864,145 @@ class GitHubApp:
 
         The tree object provides some basic functionality such as indicating
         the content type
+
+        If lazy is True directories are only fetched from the remote when they
+        are first traversed, checking a single path then costs one request per
+        directory along the path. A lazily cached tree is fully loaded if it is
+        later requested with lazy set to False.
         """
         if branch is None:
             branch = self.default_branch
         if branch != self._repo_root_branch:
             # It is a different branch that is cached
-            self.refreshBranchTreeCache(branch)
+            self.refreshBranchTreeCache(branch, lazy)
         if self._repo_root_initialized:
+            if self._repo_root_lazy and not lazy:
+                self._repo_root.loadAll()
+                self._repo_root_lazy = False
             return self._repo_root
         else:
-            self.refreshBranchTreeCache(branch)
+            self.refreshBranchTreeCache(branch, lazy)
             return self._repo_root
 
+    @traced
+    def snapshotBranchTree(self, branch=None, file_path=None):
+        """
+        Returns a read-only snapshot of the tree of a branch
+
+        The snapshot is a flat table that worker processes can open without
+        copying, see snapshot.TreeSnapshot. If a file path is provided the
+        snapshot is saved to it and returned memory mapped, so workers can
+        open the same file with TreeSnapshot.open.
+        """
+        from .snapshot import TreeSnapshot
+
+        snapshot = TreeSnapshot.fromNode(self.getBranchTree(branch))
+        if file_path is None:
+            return snapshot
+        snapshot.save(file_path)
+        snapshot.close()
+        return TreeSnapshot.open(file_path)
+
+    @traced
+    def diffBranches(self, base, head):
+        """
+        Yields the differences between the trees of two branches
+
+        See Node.diff for the differences that are yielded. Both trees are
+        fetched lazily, so only the directories that differ are requested.
+        The cached branch tree is replaced with the tree of head.
+        """
+        base_tree = self.refreshBranchTreeCache(base, lazy=True)
+        head_tree = self.refreshBranchTreeCache(head, lazy=True)
+        return base_tree.diff(head_tree)
+
+    def _blobShaCache(self):
+        if self._blob_sha_cache is None:
+            self._blob_sha_cache = BlobShaCache(
+                os.path.join(self._cache_dir, "blob_shas.json")
+            )
+        return self._blob_sha_cache
+
+    def _localBlobSha(self, file_name):
+        """Returns the git blob sha of a local file using the persistent hash cache."""
+        return self._blobShaCache().sha(file_name)
+
+    def openJournal(self, name):
+        """
+        Open the journal called name in the local cache directory
+
+        The journal can be passed to upload, remove and the bulk operations
+        so that they can be resumed if they are interrupted.
+        """
+        return Journal(os.path.join(self._cache_dir, "journals", name + ".jsonl"))
+
+    def _saveBlobShaCache(self):
+        if self._blob_sha_cache is not None:
+            self._blob_sha_cache.save()
+
+    def _wikiRemoteUrl(self):
+        """Returns the url of the wiki repository including the access token."""
+        return self._gitRemoteUrl(self._repo_name + ".wiki")
+
+    def _gitRemoteUrl(self, repo_name):
+        """Returns the url git uses to access repo_name with the access token."""
+        if self._access_header is None:
+            self._authenticate()
+        split_url = urllib.parse.urlsplit(self._webUrl())
+        return (
+            split_url.scheme
+            + "://x-access-token:"
+            + str(self._access_token)
+            + "@"
+            + split_url.netloc
+            + "/"
+            + self._user
+            + "/"
+            + repo_name
+            + ".git"
+        )
+
+    @traced
+    def useMirror(self, path=None, remote_url=None):
+        """
+        Answer reads from a local bare mirror of the repository
+
+        Once enabled the branches, their latest commits and the branch trees,
+        and so getContents, are read from the mirror instead of the api, so
+        they cost no api quota however large the repository is. The mirror
+        is fetched from the remote when this information is refreshed, only
+        the branches needed are fetched and blobs are left out. Writes still
+        go through the api.
+
+        The mirror is kept in the cache directory unless a path is provided.
+        remote_url defaults to the repository on github, accessed with the
+        token of the app, any url git understands can be used instead.
+
+        Returns the mirror, see mirror.GitMirror.
+        """
+        from .mirror import GitMirror
+
+        if path is None:
+            path = os.path.join(
+                self._cache_dir, "mirrors", self._user, self._repo_name + ".git"
+            )
+        self._mirror = GitMirror(path, remote_url)
+        self._mirror_remote_url = remote_url
+        # Information read from the api is replaced with that of the mirror
+        self._branches = []
+        self._branch_current_commit_sha = {}
+        self._repo_root_initialized = False
+        self._repo_root_branch = None
+        return self._mirror
+
+    def _fetchMirror(self, branches=None):
+        if self._mirror_remote_url is None:
+            # The access token may have been renewed
+            self._mirror.setRemoteUrl(self._gitRemoteUrl(self._repo_name))
+        with self._span("GitHubApp._fetchMirror", branches=str(branches)):
+            self._mirror.fetch(branches)
+
+    @traced
     def cloneWikiRepo(self):
         """
         Clone a git repo
@@ -1108,32 +3010,60 @@ class GitHubApp:
         Will clone the wiki repository if it does not exist, if it does
         exist it will update the access permissions by updating the wiki
         remote url. The repository is then returned.
+
+        The clone is shallow and blobless, and the repo object is kept for
+        the lifetime of the app. On later calls the remote head is checked
+        with ls-remote and the fetch and reset are skipped if it is unchanged.
         """
-        wiki_remote = (
-            "https://x-access-token:"
-            + str(self._access_token)
-            + "@github.com/"
-            + self._user
-            + "/"
-            + self._repo_name
-            + ".wiki.git"
-        )
-        if not os.path.isdir(str(self._app_wiki_dir)):
-            repo = Repo.clone_from(wiki_remote, self._app_wiki_dir)
-        else:
-            repo = Repo(self._app_wiki_dir)
-            g = git.cmd.Git(self._app_wiki_dir)
-            self._log.info("Our remote url is %s" % wiki_remote)
-            # git remote show origini
-            self._log.info(g.execute(["git", "remote", "show", "origin"]))
-            g.execute(["git", "remote", "set-url", "origin", wiki_remote])
+        import git
+
+        wiki_remote = self._wikiRemoteUrl()
+        if self._wiki_repo is None:
+            if not os.path.isdir(str(self._app_wiki_dir)):
+                self._log.info("Cloning wiki repository to " + self._app_wiki_dir)
+                self._wiki_repo = git.Repo.clone_from(
+                    wiki_remote,
+                    self._app_wiki_dir,
+                    multi_options=["--depth=1", "--filter=blob:none"],
+                )
+                self._wiki_remote = wiki_remote
+                return self._wiki_repo
+            self._wiki_repo = git.Repo(self._app_wiki_dir)
+
+        repo = self._wiki_repo
+        if self._wiki_remote != wiki_remote:
+            # The access token has changed since the remote url was last set
+            repo.git.remote("set-url", "origin", wiki_remote)
+            self._wiki_remote = wiki_remote
+
+        remote_head = repo.git.ls_remote("origin", "refs/heads/master").split()
+        remote_head = remote_head[0] if remote_head else None
+        try:
+            local_head = repo.git.rev_parse("--verify", "refs/remotes/origin/master")
+        except git.GitCommandError:
+            local_head = None
+
+        if remote_head is not None and remote_head != local_head:
             # Ensure local branches are synchronized with server
-            g.execute(["git", "fetch"])
+            repo.git.fetch(
+                "--depth=1",
+                "--filter=blob:none",
+                "origin",
+                "+refs/heads/master:refs/remotes/origin/master",
+            )
+            local_head = remote_head
+        else:
+            self._log.info("Wiki repository is up to date with the remote")
+
+        if local_head is not None and (
+            not repo.head.is_valid() or repo.head.commit.hexsha != local_head
+        ):
             # Will not overwrite files but will reset the index to match with the remote
-            g.execute(["git", "reset", "--mixed", "origin/master"])
+            repo.git.reset("--mixed", "origin/master")
 
         return repo
 
+    @traced
     def getWikiRepo(self, branch):
         """
         Get the git wiki repo
@@ -1147,8 +3077,91 @@ class GitHubApp:
         repo = self.cloneWikiRepo()
         return repo
 
+    @traced
+    def publishWikiFiles(self, file_names, commit_msg=None, max_attempts=3):
+        """
+        Upload many files to the wiki with a single commit and push
+
+        Files are copied to the root of the wiki repository, files whose
+        content matches what is already in the wiki are skipped. All changed
+        files are staged in a single index operation and committed once. If
+        the push is rejected because the remote has moved on, the files are
+        committed again on top of the new remote head and the push is retried,
+        up to max_attempts pushes in total.
+
+        Returns the names of the files that were changed. As every file is
+        placed at the root of the wiki, an exception is raised if two
+        different files have the same name.
+        """
+        import git
+
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        files_by_name = self._filesByName(file_names, "wiki")
+
+        repo = self.getWikiRepo("master")
+        entries = repo.index.entries
+
+        changed = []
+        added = 0
+        for name, file_name in files_by_name.items():
+            entry = entries.get((name, 0))
+            if entry is not None and entry.hexsha == self._localBlobSha(file_name):
+                self._log.info("Wiki file %s is unchanged, skipping" % name)
+                continue
+            if entry is None:
+                added += 1
+            destination = self._app_wiki_dir + "/" + name
+            shutil.copy(file_name, destination)
+            changed.append(name)
+
+        self._saveBlobShaCache()
+        if not changed:
+            return changed
+
+        if commit_msg is None:
+            commit_msg = "%s adding %d and updating %d wiki files" % (
+                self._name,
+                added,
+                len(changed) - added,
+            )
+        repo.index.add(changed)
+        repo.index.commit(commit_msg)
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with self._span("GitHubApp.publishWikiFiles.push", attempt=attempt):
+                    repo.git.push("--set-upstream", "origin", repo.head.reference)
+                break
+            except git.GitCommandError as e:
+                if attempt == max_attempts:
+                    raise
+                self._log.warning(
+                    "Push to wiki rejected, committing onto remote: %s" % e.stderr
+                )
+                repo.git.fetch(
+                    "--depth=1",
+                    "--filter=blob:none",
+                    "origin",
+                    "+refs/heads/master:refs/remotes/origin/master",
+                )
+                # The worktree is not kept in sync with the remote, so rather
+                # than rebasing it the changed files are staged again on top
+                # of the new remote head
+                repo.git.reset("--mixed", "origin/master")
+                repo.index.add(changed)
+                repo.index.commit(commit_msg)
+        return changed
+
+    @traced
     def postStatus(
-        self, state, commit_sha=None, context=None, description=None, target_url=None
+        self,
+        state,
+        commit_sha=None,
+        context=None,
+        description=None,
+        target_url=None,
+        force=False,
     ):
         """Method for posting the status using the App to a provided commit
         
@@ -1160,10 +3173,18 @@ class GitHubApp:
         :type description: string
         :param target_url: A url to link to when the status is posted
         :type target_url: string
+        :param force: Post the status even if it matches the cached status
+        :type force: bool
         
         By default if no commit is specified then the method will search env variables
         for CI_COMMIT_SHA and TRAVIS_COMMIT, which are the environmental variables defined by travis
         and a gitlabrunner by default.
+
+        If a status has been cached for the context, the cached combined
+        status is first revalidated, with a conditional request when
+        possible. Nothing is posted if the latest status of the context then
+        has the same state, description and target url, so a status changed
+        by someone else in the meantime is still posted.
         """
         if isinstance(state, list):
             state = state[0]
@@ -1207,15 +3228,39 @@ class GitHubApp:
                 error_msg = error_msg + " to post status.\n{}".format(target_url)
                 raise Exception(error_msg)
 
-        self._PYCURL(
+        cached = self._status_cache.get(commit_sha)
+        context_key = context if context is not None else "default"
+        if not force and cached is not None and context_key in cached[1]:
+            statuses, _ = self._fetchCombinedStatus(commit_sha, refresh=True)
+            latest = statuses.get(context_key)
+            if latest is not None and all(
+                latest.get(key) == custom_data_tmp.get(key)
+                for key in ["state", "description", "target_url"]
+            ):
+                self._log.info("Status is unchanged, not posting it again")
+                return
+
+        js_obj, code = self._PYCURL(
             self._header,
             self._repo_url + "/statuses/" + commit_sha,
             option="POST",
             custom_data=custom_data_tmp,
         )
+        if int(code) == 201:
+            self._recordStatus(commit_sha, js_obj)
 
+    @traced
     def getStatuses(self, commit_sha=None):
         """Get status of provided commit or commit has defined in the env vars."""
+        commit_sha = self._statusCommitSha(commit_sha)
+
+        # 1. Check if file exists if so get SHA
+        js_obj, code = self._PYCURL(
+            self._header, self._repo_url + "/commits/" + str(commit_sha) + "/statuses"
+        )
+        return js_obj, code, commit_sha
+
+    def _statusCommitSha(self, commit_sha):
         if commit_sha is None:
             commit_sha = os.getenv("CI_COMMIT_SHA")
         if commit_sha is None:
@@ -1226,15 +3271,95 @@ class GitHubApp:
                 "TRAVIS_COMMIT not defined in environment cannot get status"
             )
             raise Exception(error_msg)
+        return commit_sha
 
-        # 1. Check if file exists if so get SHA
-        js_obj, code = self._PYCURL(
-            self._header, self._repo_url + "/commits/" + str(commit_sha) + "/statuses"
-        )
-        return js_obj, code, commit_sha
+    def _recordStatus(self, commit_sha, status):
+        """
+        Patch the cached combined status of a commit with a new status
+
+        If the combined status has not been fetched the status is cached on
+        its own, the cache is then only used to avoid reposting it.
+        """
+        if not isinstance(status, dict):
+            return
+        _, statuses, complete = self._status_cache.get(commit_sha, (None, {}, False))
+        context = status.get("context", "default")
+        latest = statuses.get(context)
+        if latest is None or latest.get("updated_at", "") <= status.get(
+            "updated_at", ""
+        ):
+            statuses = dict(statuses)
+            statuses[context] = status
+            # The etag no longer describes the cached statuses
+            self._status_cache[commit_sha] = (None, statuses, complete)
+
+    def _fetchCombinedStatus(self, commit_sha, refresh):
+        """
+        Returns the latest status of each context on commit_sha and the code
+
+        The combined status is cached per commit, when refresh is True it is
+        revalidated with a conditional request which does not count against
+        the rate limit if nothing changed.
+        """
+        cached = self._status_cache.get(commit_sha)
+        if cached is not None and cached[2] and not refresh:
+            return cached[1], 200
+        url = self._repo_url + "/commits/" + str(commit_sha) + "/status?per_page=100"
+        header = list(self._header)
+        if cached is not None and cached[0] is not None:
+            header.append("If-None-Match: " + cached[0])
+        js_obj, code, response_headers = self._request(header, url)
+        if int(code) == 304:
+            return cached[1], code
+        if int(code) != 200:
+            return {}, code
+
+        statuses = {}
+        page = 1
+        while True:
+            for status in js_obj["statuses"]:
+                statuses.setdefault(status["context"], status)
+            if len(statuses) >= js_obj["total_count"] or not js_obj["statuses"]:
+                break
+            page += 1
+            js_obj, _ = self._PYCURL(self._header, url + "&page={}".format(page))
+        self._status_cache[commit_sha] = (response_headers.get("etag"), statuses, True)
+        return statuses, code
+
+    @traced
+    def getCombinedStatus(self, commit_sha=None, refresh=True):
+        """
+        Returns the latest status of every context on a commit
+
+        The statuses are returned as a read-only mapping from the context to
+        the latest status posted with it, e.g. statuses["ci/build"]["state"].
+        """
+        commit_sha = self._statusCommitSha(commit_sha)
+        statuses, _ = self._fetchCombinedStatus(commit_sha, refresh)
+        return types.MappingProxyType(statuses)
+
+    @traced
+    def getState(self, commit_sha=None, index=0, context=None, refresh=True):
+        """
+        Get state of the provided commit at the provided index or for a context
+
+        If a context is given the latest state posted with that context is
+        returned using the cached combined status of the commit, set refresh
+        to False to skip revalidating the cache. Otherwise the state at the
+        provided index of the full list of statuses is returned.
+        """
+        if context is not None:
+            commit_sha = self._statusCommitSha(commit_sha)
+            statuses, code = self._fetchCombinedStatus(commit_sha, refresh)
+            if int(code) == 304:
+                # The cached statuses are still current
+                code = 200
+            if context not in statuses:
+                error_msg = "No status with context {} ".format(context)
+                error_msg += "at the provided commit ({})".format(commit_sha)
+                raise Exception(error_msg)
+            return statuses[context]["state"], code, commit_sha
 
-    def getState(self, commit_sha=None, index=0):
-        """Get state of the provided commit at the provided index"""
         json_objs, code, commit_sha = self.getStatuses(commit_sha)
 
         if len(json_objs) <= index:
@@ -1249,6 +3374,303 @@ class GitHubApp:
             if count == index:
                 return json_obj["state"], code, commit_sha
 
+    def _rateLimitInterval(self):
+        """
+        Returns the seconds to leave between requests to stay within the rate limit
+
+        This is the time until the rate limit resets divided by the number of
+        requests that remain, based on the headers of the latest response.
+        """
+        core = self._metrics.rate_limit.get("core", {})
+        if "remaining" not in core or "reset" not in core:
+            return 0.0
+        return max(core["reset"] - time.time(), 0.0) / max(core["remaining"], 1)
+
+    @traced
+    def waitForState(
+        self,
+        commit_sha,
+        context,
+        target_states=None,
+        timeout=600,
+        initial_interval=1.0,
+        max_interval=60.0,
+    ):
+        """
+        Wait until the status posted with context on a commit reaches a target state
+
+        Returns the state, which is not one of target_states if another
+        terminal state was reached or if the wait timed out. See waitForStates.
+        """
+        states = self.waitForStates(
+            [(commit_sha, context)],
+            target_states,
+            timeout,
+            initial_interval,
+            max_interval,
+        )
+        return states[(commit_sha, context)]
+
+    @traced
+    def waitForStates(
+        self,
+        pairs,
+        target_states=None,
+        timeout=600,
+        initial_interval=1.0,
+        max_interval=60.0,
+        backoff=1.5,
+    ):
+        """
+        Wait for the statuses of many (commit sha, context) pairs
+
+        A pair is finished once its latest state is one of target_states or a
+        terminal state, i.e. success, failure or error. target_states defaults
+        to the terminal states.
+
+        Each commit is polled with a single conditional request however many
+        of its contexts are waited on. A commit is polled every
+        initial_interval seconds, the interval grows by the backoff factor up
+        to max_interval while nothing changes and drops back when the statuses
+        of the commit change. Polling also slows down if it would otherwise
+        use up the rate limit before it resets.
+
+        Returns a dictionary mapping each pair to its latest state, pairs that
+        timed out map to the last state seen, or None if no status with their
+        context was found.
+        """
+        if target_states is None:
+            target_states = _TERMINAL_STATES
+        if isinstance(target_states, str):
+            target_states = [target_states]
+        done_states = set(target_states) | set(_TERMINAL_STATES)
+
+        states = {(sha, context): None for sha, context in pairs}
+        pending = {}
+        for sha, context in pairs:
+            pending.setdefault(sha, set()).add(context)
+        intervals = {sha: initial_interval for sha in pending}
+
+        deadline = time.monotonic() + timeout
+        schedule = [(time.monotonic(), sha) for sha in sorted(pending)]
+        while schedule:
+            poll_time, sha = heapq.heappop(schedule)
+            if poll_time > deadline:
+                self._log.warning(
+                    "Timed out waiting for the statuses of %d commits" % len(pending)
+                )
+                break
+            wait = poll_time - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            with self._span("GitHubApp.waitForStates.poll", commit=sha):
+                statuses, code = self._fetchCombinedStatus(sha, refresh=True)
+            for context in list(pending[sha]):
+                status = statuses.get(context)
+                if status is not None:
+                    states[(sha, context)] = status["state"]
+                    if status["state"] in done_states:
+                        pending[sha].discard(context)
+            if not pending[sha]:
+                del pending[sha]
+                continue
+
+            if int(code) == 200:
+                # The statuses changed, more changes are likely to follow
+                intervals[sha] = initial_interval
+            else:
+                intervals[sha] = min(intervals[sha] * backoff, max_interval)
+            interval = max(intervals[sha], self._rateLimitInterval() * len(pending))
+            heapq.heappush(schedule, (time.monotonic() + interval, sha))
+        return states
+
+    @traced
+    def createCheckRun(
+        self,
+        name,
+        commit_sha=None,
+        status="in_progress",
+        details_url=None,
+        external_id=None,
+    ):
+        """
+        Create a check run on a commit
+
+        If no commit is specified the CI_COMMIT_SHA and TRAVIS_COMMIT
+        environment variables are used, as with postStatus. Returns the id of
+        the check run.
+        """
+        commit_sha = self._statusCommitSha(commit_sha)
+        custom_data = {"name": name, "head_sha": commit_sha, "status": status}
+        if details_url is not None:
+            custom_data["details_url"] = details_url
+        if external_id is not None:
+            custom_data["external_id"] = external_id
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/check-runs",
+            option="POST",
+            custom_data=custom_data,
+        )
+        if int(code) != 201:
+            error_msg = "Unable to create check run " + name + " on commit "
+            error_msg = error_msg + commit_sha + " code " + str(code)
+            raise Exception(error_msg)
+        return js_obj["id"]
+
+    @traced
+    def updateCheckRun(
+        self,
+        check_run_id,
+        status=None,
+        conclusion=None,
+        title=None,
+        summary=None,
+        text=None,
+        annotations=None,
+        details_url=None,
+    ):
+        """
+        Update a check run
+
+        Annotations are added to those already on the check run, at most 50
+        can be sent at once and they require a title and summary. Setting a
+        conclusion completes the check run. Returns the updated check run.
+        """
+        custom_data = {}
+        if status is not None:
+            custom_data["status"] = status
+        if conclusion is not None:
+            custom_data["conclusion"] = conclusion
+        if details_url is not None:
+            custom_data["details_url"] = details_url
+        output = {}
+        if title is not None:
+            output["title"] = title
+        if summary is not None:
+            output["summary"] = summary
+        if text is not None:
+            output["text"] = text
+        if annotations:
+            if len(annotations) > _MAX_ANNOTATIONS:
+                error_msg = "At most " + str(_MAX_ANNOTATIONS) + " annotations "
+                error_msg = error_msg + "can be sent at once, use postAnnotations"
+                raise Exception(error_msg)
+            if title is None or summary is None:
+                raise Exception("Annotations must be sent with a title and summary")
+            output["annotations"] = [_checkAnnotation(a) for a in annotations]
+        if output:
+            custom_data["output"] = output
+
+        # Annotations are appended so only updates without them can be retried
+        js_obj, code = self._PYCURL(
+            self._header,
+            self._repo_url + "/check-runs/" + str(check_run_id),
+            option="PATCH",
+            custom_data=custom_data,
+            idempotent=not annotations,
+        )
+        if int(code) != 200:
+            error_msg = "Unable to update check run " + str(check_run_id)
+            error_msg = error_msg + " code " + str(code)
+            raise Exception(error_msg)
+        return js_obj
+
+    @traced
+    def postAnnotations(
+        self, check_run_id, annotations, title, summary=None, max_workers=4
+    ):
+        """
+        Add any number of annotations to a check run
+
+        annotations can be any iterable, e.g. a generator of lint results. It
+        is consumed in batches of 50, the most the api accepts per request,
+        and up to max_workers batches are sent concurrently. Only the batches
+        being sent are held in memory.
+
+        Returns the number of annotations posted at each annotation level.
+        """
+        if summary is None:
+            summary = "Results are being posted."
+        counts = {level: 0 for level in _ANNOTATION_LEVELS}
+        annotations = iter(annotations)
+
+        def postBatch(batch):
+            with self._span("GitHubApp.postAnnotations.batch", size=len(batch)):
+                self.updateCheckRun(
+                    check_run_id, title=title, summary=summary, annotations=batch
+                )
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                batch = [
+                    _checkAnnotation(annotation)
+                    for annotation in itertools.islice(annotations, _MAX_ANNOTATIONS)
+                ]
+                if not batch:
+                    break
+                for annotation in batch:
+                    counts[annotation["annotation_level"]] += 1
+                if len(in_flight) >= max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(postBatch, batch))
+            for future in in_flight:
+                future.result()
+        self._log.info(
+            "Posted %d annotations to check run %s"
+            % (sum(counts.values()), check_run_id)
+        )
+        return counts
+
+    @traced
+    def postCheckRun(
+        self,
+        name,
+        annotations=(),
+        commit_sha=None,
+        conclusion=None,
+        title=None,
+        summary=None,
+        text=None,
+        details_url=None,
+        max_workers=4,
+    ):
+        """
+        Create a check run, stream annotations to it and complete it
+
+        A check run can carry thousands of per line results where statuses
+        only carry a single description, see postAnnotations for how the
+        annotations are sent. title defaults to the name of the check run.
+
+        Once every annotation is posted the check run is completed with a
+        final summary, unless provided the conclusion is failure if any
+        annotation is a failure and success otherwise, and the summary counts
+        the annotations at each level.
+
+        Returns the id of the check run.
+        """
+        if title is None:
+            title = name
+        check_run_id = self.createCheckRun(name, commit_sha, details_url=details_url)
+        counts = self.postAnnotations(
+            check_run_id, annotations, title, max_workers=max_workers
+        )
+        if conclusion is None:
+            conclusion = "failure" if counts["failure"] else "success"
+        if summary is None:
+            summary = ", ".join(
+                "%d %s" % (counts[level], level if counts[level] == 1 else level + "s")
+                for level in _ANNOTATION_LEVELS
+            )
+        self.updateCheckRun(
+            check_run_id, conclusion=conclusion, title=title, summary=summary, text=text
+        )
+        return check_run_id
+
     def printStatus(self):
         js_obj = self.getStatuses()
         print(js_obj)
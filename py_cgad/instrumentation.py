@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import json
+import re
+import threading
+
+# Url components that vary between calls to the same endpoint are replaced so
+# that requests can be grouped together.
+_TEMPLATE_RULES = [
+    (
+        re.compile(r"^(/api/v3|/api/uploads)?/repos/[^/]+/[^/]+"),
+        "/repos/{owner}/{repo}",
+    ),
+    (re.compile(r"^/api/v3/app/"), "/app/"),
+    (re.compile(r"/app/installations/[^/]+"), "/app/installations/{installation_id}"),
+    (re.compile(r"/contents/.*$"), "/contents/{path}"),
+    (re.compile(r"/git/refs/.*$"), "/git/refs/{ref}"),
+    (re.compile(r"/branches/.*$"), "/branches/{branch}"),
+    (re.compile(r"/releases/tags/.*$"), "/releases/tags/{tag}"),
+    (re.compile(r"/[0-9a-f]{40}(?=/|$)"), "/{sha}"),
+    (re.compile(r"/[0-9]+(?=/|$)"), "/{id}"),
+]
+
+_RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit": "limit",
+    "x-ratelimit-remaining": "remaining",
+    "x-ratelimit-used": "used",
+    "x-ratelimit-reset": "reset",
+    "x-ratelimit-resource": "resource",
+}
+
+_PHASES = ["namelookup", "connect", "appconnect", "transfer"]
+
+
+def endpointTemplate(url):
+    """
+    Convert a url into the endpoint template it was generated from
+
+    e.g. https://api.github.com/repos/lanl/Py-CGAD/contents/bin/file.py?ref=main
+    becomes /repos/{owner}/{repo}/contents/{path}
+    """
+    path = re.sub(r"^[a-zA-Z]+://[^/]+", "", url).split("?", 1)[0]
+    if path == "":
+        path = "/"
+    for pattern, replacement in _TEMPLATE_RULES:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def parseRateLimit(headers):
+    """Pull the rate limit information out of a dict of lower case headers."""
+    rate_limit = {}
+    for header, key in _RATE_LIMIT_HEADERS.items():
+        if header in headers:
+            value = headers[header]
+            if key != "resource":
+                try:
+                    value = int(value)
+                except ValueError:
+                    continue
+            rate_limit[key] = value
+    return rate_limit
+
+
+class RequestRecord:
+    """
+    Information collected about a single request to the github api
+
+    Records are created by GitHubApp for every request and passed to each
+    of the registered request hooks once the request has finished.
+    """
+
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+        self.endpoint = endpointTemplate(url)
+        self.status = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.namelookup_time = 0.0
+        self.connect_time = 0.0
+        self.appconnect_time = 0.0
+        self.total_time = 0.0
+        self.rate_limit = {}
+        self.retries = 0
+        self.error = None
+
+    @property
+    def transfer_time(self):
+        """Time spent after the connection was established."""
+        return max(self.total_time - max(self.connect_time, self.appconnect_time), 0.0)
+
+    def toDict(self):
+        return {
+            "method": self.method,
+            "url": self.url,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "namelookup_time": self.namelookup_time,
+            "connect_time": self.connect_time,
+            "appconnect_time": self.appconnect_time,
+            "transfer_time": self.transfer_time,
+            "total_time": self.total_time,
+            "rate_limit": dict(self.rate_limit),
+            "retries": self.retries,
+            "error": self.error,
+        }
+
+
+class MetricsAggregator:
+    """
+    Aggregates request records
+
+    An instance can be registered as a request hook, each record is grouped
+    by method, endpoint template and status. The totals can be exported in
+    the Prometheus text format or as a json summary.
+    """
+
+    def __init__(self, prefix="py_cgad"):
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._rate_limit = {}
+
+    def __call__(self, record):
+        self.record(record)
+
+    def record(self, record):
+        status = "error" if record.status is None else str(record.status)
+        key = (record.method, record.endpoint, status)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {
+                    "count": 0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                    "retries": 0,
+                    "total_time": 0.0,
+                    "namelookup": 0.0,
+                    "connect": 0.0,
+                    "appconnect": 0.0,
+                    "transfer": 0.0,
+                }
+                self._stats[key] = stats
+            stats["count"] += 1
+            stats["bytes_in"] += record.bytes_in
+            stats["bytes_out"] += record.bytes_out
+            stats["retries"] += record.retries
+            stats["total_time"] += record.total_time
+            stats["namelookup"] += record.namelookup_time
+            stats["connect"] += record.connect_time
+            stats["appconnect"] += record.appconnect_time
+            stats["transfer"] += record.transfer_time
+            if record.rate_limit:
+                resource = record.rate_limit.get("resource", "core")
+                self._rate_limit[resource] = dict(record.rate_limit)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._rate_limit = {}
+
+    @property
+    def rate_limit(self):
+        """Returns the most recent rate limit information for each resource."""
+        with self._lock:
+            return {key: dict(value) for key, value in self._rate_limit.items()}
+
+    def summary(self):
+        """Returns the aggregated statistics as a list of dictionaries."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            rate_limit = {key: dict(value) for key, value in self._rate_limit.items()}
+        requests = []
+        for (method, endpoint, status), stats in items:
+            entry = {"method": method, "endpoint": endpoint, "status": status}
+            entry.update(stats)
+            requests.append(entry)
+        return {"requests": requests, "rate_limit": rate_limit}
+
+    def toJSON(self, indent=None):
+        return json.dumps(self.summary(), indent=indent)
+
+    def toPrometheus(self):
+        """Returns the aggregated statistics in the Prometheus text format."""
+        summary = self.summary()
+        p = self._prefix
+        counters = [
+            ("requests_total", "count", "Number of requests made."),
+            ("request_seconds_sum", "total_time", "Total time spent on requests."),
+            ("request_bytes_received_total", "bytes_in", "Bytes received."),
+            ("request_bytes_sent_total", "bytes_out", "Bytes sent."),
+            ("request_retries_total", "retries", "Number of retried requests."),
+        ]
+        lines = []
+        for name, field, help_text in counters:
+            lines.append("# HELP {}_{} {}".format(p, name, help_text))
+            lines.append("# TYPE {}_{} counter".format(p, name))
+            for entry in summary["requests"]:
+                lines.append(
+                    "{}_{}{{{}}} {}".format(p, name, _labels(entry), entry[field])
+                )
+        lines.append(
+            "# HELP {}_request_phase_seconds_sum Time spent in each phase.".format(p)
+        )
+        lines.append("# TYPE {}_request_phase_seconds_sum counter".format(p))
+        for entry in summary["requests"]:
+            for phase in _PHASES:
+                lines.append(
+                    '{}_request_phase_seconds_sum{{{},phase="{}"}} {}'.format(
+                        p, _labels(entry), phase, entry[phase]
+                    )
+                )
+        for field in ["limit", "remaining", "used", "reset"]:
+            lines.append("# TYPE {}_rate_limit_{} gauge".format(p, field))
+            for resource, rate_limit in sorted(summary["rate_limit"].items()):
+                if field in rate_limit:
+                    lines.append(
+                        '{}_rate_limit_{}{{resource="{}"}} {}'.format(
+                            p, field, _escape(resource), rate_limit[field]
+                        )
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(entry):
+    return 'method="{}",endpoint="{}",status="{}"'.format(
+        _escape(entry["method"]), _escape(entry["endpoint"]), _escape(entry["status"])
+    )
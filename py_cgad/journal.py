@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+
+
+def _fsyncDir(dir_path):
+    """Make sure a newly created or renamed file in dir_path is durable."""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JournalOperation:
+    """
+    The recorded progress of a single operation in a journal
+
+    Steps are recorded as they complete, e.g. the sha of each blob that has
+    been created or of the commit that was made, so that a re-run of the same
+    operation can skip them.
+    """
+
+    def __init__(self, journal, op_id, operation, intent, fingerprint=None):
+        self._journal = journal
+        self.op_id = op_id
+        self.operation = operation
+        self.intent = intent
+        self.fingerprint = fingerprint
+        self.blobs = {}
+        self.steps = {}
+        self.completed = False
+
+    def _apply(self, record):
+        event = record["event"]
+        if event == "blob":
+            self.blobs[record["path"]] = record["sha"]
+        elif event == "done":
+            self.completed = True
+        elif event != "begin":
+            self.steps[event] = record
+
+    def get(self, step, key="sha"):
+        """Returns a value recorded for step or None if it has not completed."""
+        record = self.steps.get(step)
+        if record is None:
+            return None
+        return record.get(key)
+
+    def record(self, event, **values):
+        """Durably record that a step has completed."""
+        record = {"event": event, "op_id": self.op_id}
+        record.update(values)
+        self._journal._append(record)
+        self._apply(record)
+
+    def recordBlob(self, path, sha):
+        self.record("blob", path=path, sha=sha)
+
+    def complete(self):
+        """Mark the operation as finished, it will no longer be resumed."""
+        self.record("done")
+        self._journal._compact()
+
+
+class Journal:
+    """
+    Write-ahead journal for upload and remove operations
+
+    The journal is an append only json lines file, each record is flushed
+    and fsynced before the step it describes is considered done. A torn
+    final record, left by a crash in the middle of a write, is discarded
+    when the journal is opened.
+
+    journal = Journal("figures.jsonl")
+    app.uploadImages(images, journal=journal)
+
+    If the job dies part way through, running it again with the same journal
+    resumes the operation, reusing blobs and commits that were already made.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._order = []
+        dir_path = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(dir_path, exist_ok=True)
+        self._load()
+
+    @property
+    def path(self):
+        return self._file_path
+
+    def _load(self):
+        if not os.path.isfile(self._file_path):
+            return
+        valid_size = 0
+        with open(self._file_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    break
+                valid_size += len(line)
+                self._replay(record)
+        if valid_size != os.path.getsize(self._file_path):
+            with open(self._file_path, "r+b") as f:
+                f.truncate(valid_size)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _replay(self, record):
+        if record["event"] == "begin":
+            operation = JournalOperation(
+                self,
+                record["op_id"],
+                record["operation"],
+                record["intent"],
+                record.get("fingerprint"),
+            )
+            self._operations[record["op_id"]] = operation
+            self._order.append(record["op_id"])
+        elif record["op_id"] in self._operations:
+            self._operations[record["op_id"]]._apply(record)
+
+    def _append(self, record):
+        data = (json.dumps(record, sort_keys=True) + "\n").encode("utf-8")
+        with self._lock:
+            created = not os.path.exists(self._file_path)
+            with open(self._file_path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if created:
+                _fsyncDir(os.path.dirname(os.path.abspath(self._file_path)))
+
+    def _compact(self):
+        """Rewrite the journal without the records of completed operations."""
+        with self._lock:
+            pending = [
+                op_id for op_id in self._order if not self._operations[op_id].completed
+            ]
+            if len(pending) == len(self._order):
+                return
+            records = []
+            for op_id in pending:
+                operation = self._operations[op_id]
+                records.append(
+                    {
+                        "event": "begin",
+                        "op_id": op_id,
+                        "operation": operation.operation,
+                        "intent": operation.intent,
+                        "fingerprint": operation.fingerprint,
+                    }
+                )
+                for path, sha in operation.blobs.items():
+                    records.append(
+                        {"event": "blob", "op_id": op_id, "path": path, "sha": sha}
+                    )
+                records.extend(operation.steps.values())
+            tmp_path = self._file_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for record in records:
+                    f.write((json.dumps(record, sort_keys=True) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._file_path)
+            _fsyncDir(os.path.dirname(os.path.abspath(self._file_path)))
+            self._order = pending
+            self._operations = {op_id: self._operations[op_id] for op_id in pending}
+
+    @property
+    def operations(self):
+        """Returns the operations recorded in the journal, oldest first."""
+        return [self._operations[op_id] for op_id in self._order]
+
+    @property
+    def pending(self):
+        """Returns the operations that have not completed."""
+        return [operation for operation in self.operations if not operation.completed]
+
+    def begin(self, operation, intent):
+        """
+        Start or resume an operation
+
+        If an unfinished operation with the same name and intent is found in
+        the journal it is returned so that it can be resumed, otherwise a new
+        operation is recorded. The intent must be json serializable.
+        """
+        fingerprint = hashlib.sha1(
+            json.dumps([operation, intent], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        for existing in self.pending:
+            if existing.fingerprint == fingerprint:
+                return existing
+        record = {
+            "event": "begin",
+            "op_id": uuid.uuid4().hex,
+            "operation": operation,
+            "intent": intent,
+            "fingerprint": fingerprint,
+        }
+        self._append(record)
+        self._replay(record)
+        return self._operations[record["op_id"]]
+
+    def clear(self):
+        """Remove the journal file and forget all operations."""
+        with self._lock:
+            if os.path.exists(self._file_path):
+                os.remove(self._file_path)
+            self._operations = {}
+            self._order = []
+
+
+def defaultJournalDir():
+    from .githubapp import defaultCacheDir
+
+    return os.path.join(defaultCacheDir(), "journals")
+
+
+def _journalPath(name, journal_dir):
+    if os.path.sep in name or name.endswith(".jsonl"):
+        return name
+    return os.path.join(journal_dir, name + ".jsonl")
+
+
+def main(argv=None):
+    """Command line interface used to inspect and clear journals."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m py_cgad.journal",
+        description="Inspect and clear py_cgad upload journals.",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        "-d",
+        default=None,
+        help="Directory containing the journals, defaults to ~/.cache/py_cgad/journals",
+    )
+    sub_parsers = parser.add_subparsers(dest="command")
+    sub_parsers.add_parser("list", help="List journals and pending operations.")
+    show_parser = sub_parsers.add_parser("show", help="Show the records of a journal.")
+    show_parser.add_argument("journal", help="Journal name or path.")
+    clear_parser = sub_parsers.add_parser("clear", help="Delete journals.")
+    clear_parser.add_argument("journal", nargs="*", help="Journal names or paths.")
+    clear_parser.add_argument(
+        "--all", action="store_true", help="Delete every journal in the directory."
+    )
+    args = parser.parse_args(argv)
+
+    journal_dir = args.journal_dir
+    if journal_dir is None:
+        journal_dir = defaultJournalDir()
+
+    if args.command == "list" or args.command is None:
+        if not os.path.isdir(journal_dir):
+            return 0
+        for file_name in sorted(os.listdir(journal_dir)):
+            if not file_name.endswith(".jsonl"):
+                continue
+            journal = Journal(os.path.join(journal_dir, file_name))
+            print(
+                "%s: %d pending" % (file_name[: -len(".jsonl")], len(journal.pending))
+            )
+            for operation in journal.pending:
+                print(
+                    "  %s %s blobs=%d steps=%s"
+                    % (
+                        operation.op_id,
+                        operation.operation,
+                        len(operation.blobs),
+                        ",".join(operation.steps.keys()),
+                    )
+                )
+    elif args.command == "show":
+        path = _journalPath(args.journal, journal_dir)
+        if not os.path.isfile(path):
+            print("No journal found at " + path, file=sys.stderr)
+            return 1
+        journal = Journal(path)
+        for operation in journal.operations:
+            print(
+                json.dumps(
+                    {
+                        "op_id": operation.op_id,
+                        "operation": operation.operation,
+                        "intent": operation.intent,
+                        "blobs": operation.blobs,
+                        "steps": operation.steps,
+                        "completed": operation.completed,
+                    },
+                    indent=2,
+                )
+            )
+    elif args.command == "clear":
+        paths = [_journalPath(name, journal_dir) for name in args.journal]
+        if args.all and os.path.isdir(journal_dir):
+            paths += [
+                os.path.join(journal_dir, file_name)
+                for file_name in os.listdir(journal_dir)
+                if file_name.endswith(".jsonl")
+            ]
+        for path in paths:
+            if os.path.isfile(path):
+                Journal(path).clear()
+                print("Removed " + path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
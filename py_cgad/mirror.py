@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+# Types reported by the contents api for the modes git stores in trees
+_CONTENT_TYPES = {"040000": "dir", "120000": "symlink", "160000": "submodule"}
+
+
+class GitMirror:
+    """
+    A local bare mirror of a remote repository
+
+    Branches are fetched into refs/heads of a bare repository without their
+    blobs, so even the mirror of a large repository is small. Branches,
+    commits and trees are then read with local git commands, which cost no
+    api quota, and file contents are fetched from the remote the first time
+    they are read.
+
+    mirror = GitMirror("/tmp/Py-CGAD.git", "https://github.com/lanl/Py-CGAD.git")
+    mirror.fetch(["main"])
+    mirror.tree("main")
+
+    GitPython is imported when the mirror is first used.
+    """
+
+    def __init__(self, path, remote_url=None, blobless=True):
+        self._path = path
+        self._remote_url = remote_url
+        self._blobless = blobless
+        self._lock = threading.RLock()
+        self._repo = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def _git(self):
+        """Returns the git command wrapper of the mirror, creating it if needed."""
+        import git
+
+        with self._lock:
+            if self._repo is None:
+                self._open(git)
+        return self._repo.git
+
+    def _open(self, git):
+        if os.path.isdir(self._path):
+            self._repo = git.Repo(self._path)
+        else:
+            self._repo = git.Repo.init(self._path, bare=True, mkdir=True)
+            self._repo.git.remote("add", "origin", self._remote_url or "")
+            if self._blobless:
+                # Mark origin as a promisor so missing blobs are fetched on demand
+                config = self._repo.git.config
+                config("core.repositoryformatversion", "1")
+                config("extensions.partialClone", "origin")
+                config("remote.origin.promisor", "true")
+                config("remote.origin.partialclonefilter", "blob:none")
+
+    def setRemoteUrl(self, remote_url):
+        """Change the url of the remote, e.g. when an access token is renewed."""
+        with self._lock:
+            if remote_url != self._remote_url:
+                self._remote_url = remote_url
+                if os.path.isdir(self._path):
+                    self._git().remote("set-url", "origin", remote_url)
+
+    def fetch(self, branches=None):
+        """
+        Update the mirror from the remote
+
+        Only the listed branches are fetched, if branches is None every
+        branch is fetched. Branches deleted on the remote are removed from the
+        mirror. Objects that are already in the mirror are not transferred
+        again.
+        """
+        from git import GitCommandError
+
+        if isinstance(branches, str):
+            branches = [branches]
+        with self._lock:
+            git = self._git()
+            if branches is None:
+                git.fetch(
+                    "--prune", "--no-tags", "origin", "+refs/heads/*:refs/heads/*"
+                )
+                return
+            try:
+                self._fetchBranches(git, branches)
+            except GitCommandError as e:
+                if "couldn't find remote ref" not in str(e):
+                    raise
+                # Fetch the branches one at a time to find those that are gone
+                for branch in branches:
+                    try:
+                        self._fetchBranches(git, [branch])
+                    except GitCommandError as e:
+                        if "couldn't find remote ref" not in str(e):
+                            raise
+                        git.update_ref("-d", "refs/heads/" + branch)
+
+    def _fetchBranches(self, git, branches):
+        if branches:
+            git.fetch(
+                "--no-tags",
+                "origin",
+                *["+refs/heads/%s:refs/heads/%s" % (b, b) for b in branches]
+            )
+
+    def heads(self):
+        """Returns a dictionary mapping each mirrored branch to its commit sha."""
+        output = self._git().for_each_ref(
+            "--format=%(refname) %(objectname)", "refs/heads"
+        )
+        heads = {}
+        for line in output.splitlines():
+            ref, sha = line.rsplit(" ", 1)
+            heads[ref[len("refs/heads/") :]] = sha
+        return heads
+
+    def branches(self):
+        """Returns the names of the mirrored branches."""
+        return list(self.heads())
+
+    def commitSha(self, branch):
+        """Returns the commit sha of a mirrored branch or None if it is not mirrored."""
+        return self.heads().get(branch)
+
+    def tree(self, ref):
+        """
+        Returns every entry of the tree of ref
+
+        Each entry is a (path, type, sha) tuple using the types of the
+        contents api, i.e. dir, file, symlink or submodule. Directories are
+        listed before their contents.
+        """
+        output = self._git().ls_tree("-r", "-t", "-z", "--full-tree", ref)
+        entries = []
+        for record in output.split("\0"):
+            if not record:
+                continue
+            info, path = record.split("\t", 1)
+            mode, _, sha = info.split(" ")
+            entries.append((path, _CONTENT_TYPES.get(mode, "file"), sha))
+        return entries
+
+    def readBlob(self, sha):
+        """Returns the contents of a blob, fetching it from the remote if needed."""
+        return self._git().execute(
+            ["git", "cat-file", "blob", sha], stdout_as_string=False
+        )
+
+    def readFile(self, path, ref):
+        """Returns the contents of the file at path in ref."""
+        return self.readBlob(ref + ":" + path)
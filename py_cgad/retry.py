@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import time
+
+
+class RequestError(Exception):
+    """
+    Raised when a request fails without receiving a response
+
+    sent is False if the request is known not to have reached the server,
+    e.g. the host could not be resolved or the connection was refused, in
+    which case it is safe to retry any request.
+    """
+
+    def __init__(self, message, code=None, sent=True):
+        super().__init__(message)
+        self.code = code
+        self.sent = sent
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while the circuit breaker is open."""
+
+
+class RetryPolicy:
+    """
+    Decides when and how long to wait before a failed request is retried
+
+    Idempotent requests, GET and HEAD requests and PUT or DELETE requests
+    that include the sha of the object being replaced, are retried when a
+    response has one of the retry_statuses or the connection fails. Other
+    requests are only retried if they cannot have been processed, i.e. the
+    connection could not be established or the response was 429.
+
+    The wait before attempt n is a random value between 0 and
+    min(backoff_max, backoff_base * 2 ** (n - 1)), unless the server
+    provides a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        max_attempts=4,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        retry_statuses=(429, 500, 502, 503, 504),
+        connect_timeout=10,
+        total_timeout=600,
+        sleep=time.sleep,
+        rand=random.random,
+    ):
+        if max_attempts < 1:
+            raise Exception("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = set(retry_statuses)
+        self.connect_timeout = connect_timeout
+        self.total_timeout = total_timeout
+        self._sleep = sleep
+        self._rand = rand
+
+    @staticmethod
+    def isIdempotent(method, custom_data=None):
+        if method in ["GET", "HEAD"]:
+            return True
+        if method in ["PUT", "DELETE"]:
+            return isinstance(custom_data, dict) and "sha" in custom_data
+        return False
+
+    def backoff(self, attempt, headers=None):
+        """Returns the number of seconds to wait before the next attempt."""
+        if headers is not None and "retry-after" in headers:
+            try:
+                return min(float(headers["retry-after"]), self.backoff_max)
+            except ValueError:
+                pass
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return self._rand() * ceiling
+
+    def _retryStatus(self, status, idempotent):
+        if status not in self.retry_statuses:
+            return False
+        return idempotent or status == 429
+
+    def execute(self, attempt, idempotent, breaker=None):
+        """
+        Call attempt until it succeeds or the policy gives up
+
+        attempt must return a tuple whose first two values are the http
+        status and a dict of lower case response headers, or raise a
+        RequestError. Returns the result of the last attempt and the number
+        of retries that were made.
+        """
+        retries = 0
+        while True:
+            if breaker is not None:
+                breaker.before()
+            try:
+                result = attempt()
+            except RequestError as e:
+                if breaker is not None:
+                    breaker.recordFailure()
+                if retries + 1 >= self.max_attempts or (e.sent and not idempotent):
+                    raise
+                retries += 1
+                self._sleep(self.backoff(retries))
+                continue
+
+            status, headers = result[0], result[1]
+            if breaker is not None:
+                if status >= 500:
+                    breaker.recordFailure()
+                else:
+                    breaker.recordSuccess()
+            if retries + 1 < self.max_attempts and self._retryStatus(
+                status, idempotent
+            ):
+                retries += 1
+                self._sleep(self.backoff(retries, headers))
+                continue
+            return result, retries
+
+
+class CircuitBreaker:
+    """
+    Fails fast while github is degraded
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests raise a CircuitOpenError without being made. Once reset_timeout
+    seconds have passed a single trial request is let through, if it
+    succeeds the circuit closes again, otherwise it stays open.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at < self.reset_timeout or self._trial:
+                raise CircuitOpenError(
+                    "Circuit breaker is open after %d consecutive failures"
+                    % self._failures
+                )
+            self._trial = True
+
+    def recordSuccess(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def recordFailure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import re
+import struct
+
+_MAGIC = b"PYCGAD01"
+# Magic, number of entries and total size
+_HEADER = struct.Struct("<8sQQ")
+# Offset and length of the path, type, whether there is a sha and the sha
+_RECORD = struct.Struct("<QIBB20s")
+_TYPES = ["file", "misc", "dir"]
+_SHA = re.compile("[0-9a-fA-F]{40}")
+
+
+def _normalize(path):
+    """Returns path as bytes relative to the root, without a ./ or / prefix."""
+    components = [comp for comp in path.split("/") if comp not in ["", "."]]
+    return "/".join(components).encode("utf-8")
+
+
+def _successor(prefix):
+    """Returns the smallest byte string greater than every string starting with prefix."""
+    prefix = prefix.rstrip(b"\xff")
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class TreeSnapshot:
+    """
+    A read-only snapshot of a branch tree stored as a flat sorted table
+
+    The paths, types and shas of every entry of a tree are packed into a
+    single buffer sorted by path, so lookups are binary searches and the
+    contents of a directory are a contiguous range. Nothing is unpacked
+    when a snapshot is opened, so a snapshot in a memory mapped file or in
+    shared memory can be opened by many processes without copying it.
+
+    snapshot = TreeSnapshot.fromNode(app.getBranchTree("main"))
+    snapshot.save("main.snapshot")
+
+    # In each worker process
+    with TreeSnapshot.open("main.snapshot") as snapshot:
+        snapshot.getSha("bin/common.py")
+
+    Paths can be given in any of the forms Node accepts e.g. bin/common.py
+    or ./bin/common.py, and are returned relative to the root as in
+    Node.contents e.g. ./bin/common.py.
+    """
+
+    def __init__(self, buffer):
+        self._closers = []
+        view = memoryview(buffer)
+        magic, self._count, size = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC:
+            view.release()
+            raise Exception("Buffer does not contain a tree snapshot")
+        # Shared memory blocks can be larger than the snapshot
+        self._view = view
+        self._buffer = view[:size]
+        self._paths_start = _HEADER.size + self._count * _RECORD.size
+
+    @staticmethod
+    def pack(entries):
+        """
+        Returns the bytes of a snapshot of (path, type, sha) entries
+
+        The type is one of file, misc or dir, the sha may be None. Only 40
+        character shas fit in a record, anything else is rejected rather
+        than truncated.
+        """
+        records = sorted(
+            (_normalize(path), _TYPES.index(content_type), sha)
+            for path, content_type, sha in entries
+        )
+        paths_size = sum(len(path) for path, _, _ in records)
+        size = _HEADER.size + len(records) * _RECORD.size + paths_size
+        parts = [_HEADER.pack(_MAGIC, len(records), size)]
+        offset = 0
+        for path, type_index, sha in records:
+            if sha is not None and not _SHA.fullmatch(sha):
+                error_msg = "Cannot snapshot %s, " % path.decode("utf-8")
+                error_msg += "sha %s is not 40 hex characters" % sha
+                raise Exception(error_msg)
+            sha_bytes = bytes.fromhex(sha) if sha is not None else b""
+            parts.append(
+                _RECORD.pack(offset, len(path), type_index, sha is not None, sha_bytes)
+            )
+            offset += len(path)
+        parts.extend(path for path, _, _ in records)
+        return b"".join(parts)
+
+    @classmethod
+    def fromNode(cls, node):
+        """Create a snapshot of a Node tree, a lazy tree is fully loaded."""
+        return cls(cls.pack(node.walk()))
+
+    @classmethod
+    def open(cls, file_path):
+        """Open a snapshot saved to a file, the file is memory mapped read-only."""
+        with open(file_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        snapshot = cls(mapped)
+        snapshot._closers.append(mapped.close)
+        return snapshot
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Open a snapshot placed in shared memory with toSharedMemory
+
+        Requires python 3.8 or later.
+        """
+        from multiprocessing import shared_memory
+
+        memory = shared_memory.SharedMemory(name=name)
+        try:
+            # Only the creator should unlink the block when it exits
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(memory._name, "shared_memory")
+        except (ImportError, AttributeError):
+            pass
+        snapshot = cls(memory.buf)
+        snapshot._closers.append(memory.close)
+        return snapshot
+
+    def save(self, file_path):
+        """Write the snapshot to a file, the file is replaced atomically."""
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self._buffer)
+        os.replace(temp_path, file_path)
+
+    def toSharedMemory(self, name=None):
+        """
+        Copy the snapshot into a new block of shared memory
+
+        Returns the SharedMemory, child processes open the snapshot with
+        attach(memory.name). The caller is responsible for calling close and
+        unlink on it once the workers are done. Requires python 3.8 or later.
+        """
+        from multiprocessing import shared_memory
+
+        memory = shared_memory.SharedMemory(
+            name=name, create=True, size=len(self._buffer)
+        )
+        memory.buf[: len(self._buffer)] = self._buffer
+        return memory
+
+    def close(self):
+        """Release the buffer, required for snapshots that were opened or attached."""
+        self._buffer.release()
+        self._view.release()
+        for closer in self._closers:
+            closer()
+        self._closers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, index):
+        return _RECORD.unpack_from(self._buffer, _HEADER.size + index * _RECORD.size)
+
+    def _path(self, index):
+        offset, length, _, _, _ = self._record(index)
+        start = self._paths_start + offset
+        return self._buffer[start : start + length].tobytes()
+
+    def _entry(self, index):
+        offset, length, type_index, has_sha, sha = self._record(index)
+        start = self._paths_start + offset
+        path = self._buffer[start : start + length].tobytes().decode("utf-8")
+        return "./" + path, _TYPES[type_index], sha.hex() if has_sha else None
+
+    def _lowerBound(self, key, low=0):
+        """Returns the index of the first entry whose path is not less than key."""
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._path(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, path):
+        key = _normalize(path)
+        index = self._lowerBound(key)
+        if index < self._count and self._path(index) == key:
+            return index
+        return None
+
+    def exists(self, path):
+        if _normalize(path) == b"":
+            return True
+        return self._find(path) is not None
+
+    def type(self, path):
+        """Returns file, misc or dir, or None if the path does not exist."""
+        if _normalize(path) == b"":
+            return "dir"
+        index = self._find(path)
+        if index is None:
+            return None
+        return self._entry(index)[1]
+
+    def getSha(self, path):
+        """Returns the sha of the path or None if it is missing or has no sha."""
+        index = self._find(path)
+        if index is None:
+            return None
+        return self._entry(index)[2]
+
+    def _range(self, path):
+        """Returns the range of indices of the entries below a directory."""
+        prefix = _normalize(path)
+        if prefix == b"":
+            return 0, self._count, prefix
+        prefix += b"/"
+        start = self._lowerBound(prefix)
+        successor = _successor(prefix)
+        end = self._lowerBound(successor, start) if successor else self._count
+        return start, end, prefix
+
+    def walk(self, path=""):
+        """Yields (path, type, sha) for everything below a directory in path order."""
+        start, end, _ = self._range(path)
+        for index in range(start, end):
+            yield self._entry(index)
+
+    def listDir(self, path=""):
+        """
+        Returns (path, type, sha) for the entries directly in a directory
+
+        The contents of subdirectories are skipped with a binary search, so
+        the cost depends on the number of entries listed rather than on the
+        size of the directory tree.
+        """
+        start, end, prefix = self._range(path)
+        entries = []
+        index = start
+        while index < end:
+            name, slash, _ = self._path(index)[len(prefix) :].partition(b"/")
+            if slash:
+                # Skip everything below the subdirectory, siblings such as
+                # lib-x sort between lib and lib/ so it is not contiguous
+                successor = _successor(prefix + name + b"/")
+                index = self._lowerBound(successor, index + 1)
+            else:
+                entries.append(self._entry(index))
+                index += 1
+        return entries
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import functools
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    """Span returned when tracing is disabled, it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def setAttribute(self, key, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def traced(func):
+    """
+    Decorator used to open a span around a GitHubApp method
+
+    When no tracer has been attached to the app the wrapped method is called
+    directly, so tracing costs a single attribute lookup when disabled.
+    """
+    name = "GitHubApp." + func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        tracer = self._tracer
+        if tracer is None:
+            return func(self, *args, **kwargs)
+        with tracer.span(name):
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class Span:
+    """A timed operation, spans opened while another span is open are nested."""
+
+    def __init__(self, tracer, name, trace_id, parent_id, attributes):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.thread_id = threading.get_ident()
+        self.start_ns = None
+        self.end_ns = None
+        self.error = None
+
+    def setAttribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end_ns = time.time_ns()
+        if exc_value is not None:
+            self.error = str(exc_value)
+        self._tracer._pop(self)
+        return False
+
+    @property
+    def duration_ns(self):
+        return self.end_ns - self.start_ns
+
+
+class Tracer:
+    """
+    Collects spans and hands them to exporters
+
+    Finished spans are held in memory until flush is called, at which point
+    they are passed to each of the exporters and discarded.
+
+    tracer = Tracer([ChromeTraceExporter("upload.trace.json")])
+    app.setTracer(tracer)
+    app.upload("report.md")
+    tracer.flush()
+    """
+
+    def __init__(self, exporters=None):
+        self._exporters = list(exporters) if exporters is not None else []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._finished = []
+
+    def addExporter(self, exporter):
+        self._exporters.append(exporter)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def current(self):
+        """Returns the innermost open span of the calling thread or None."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def span(self, name, parent=None, **attributes):
+        """
+        Create a span, it is started when used as a context manager
+
+        The parent defaults to the innermost open span of the calling thread,
+        pass it explicitly when the work is handed to another thread.
+        """
+        if parent is None:
+            parent = self.current()
+        if parent is None:
+            return Span(self, name, os.urandom(16).hex(), None, attributes)
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self._finished.append(span)
+
+    @property
+    def finished_spans(self):
+        with self._lock:
+            return list(self._finished)
+
+    def flush(self):
+        """Export and discard all finished spans."""
+        with self._lock:
+            spans = self._finished
+            self._finished = []
+        for exporter in self._exporters:
+            exporter.export(spans)
+        return spans
+
+
+class ChromeTraceExporter:
+    """
+    Writes spans to a json file that can be loaded in chrome://tracing or Perfetto
+
+    Spans exported by successive flushes are accumulated, the file is
+    rewritten each time so it always contains a complete trace.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._events = []
+
+    def export(self, spans):
+        pid = os.getpid()
+        for span in spans:
+            args = dict(span.attributes)
+            if span.error is not None:
+                args["error"] = span.error
+            self._events.append(
+                {
+                    "name": span.name,
+                    "cat": "py_cgad",
+                    "ph": "X",
+                    "ts": span.start_ns / 1000.0,
+                    "dur": span.duration_ns / 1000.0,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": args,
+                }
+            )
+        with open(self._file_path, "w") as file:
+            json.dump({"traceEvents": self._events}, file)
+
+
+def _otlpValue(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """
+    Sends spans to an OpenTelemetry collector using OTLP/HTTP with json encoding
+
+    The endpoint defaults to the standard collector traces endpoint on the
+    local host.
+    """
+
+    def __init__(
+        self,
+        endpoint="http://localhost:4318/v1/traces",
+        service_name="py_cgad",
+        headers=None,
+    ):
+        self._endpoint = endpoint
+        self._service_name = service_name
+        self._headers = list(headers) if headers is not None else []
+
+    def payload(self, spans):
+        """Returns the OTLP json document for the provided spans."""
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": _otlpValue(value)}
+                    for key, value in span.attributes.items()
+                ],
+                "status": {"code": 1},
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = span.parent_id
+            if span.error is not None:
+                otlp_span["status"] = {"code": 2, "message": span.error}
+            otlp_spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self._service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "py_cgad"}, "spans": otlp_spans}],
+                }
+            ]
+        }
+
+    def export(self, spans):
+        if not spans:
+            return
+        import pycurl
+
+        data = json.dumps(self.payload(spans))
+        c = pycurl.Curl()
+        c.setopt(c.URL, self._endpoint)
+        c.setopt(c.HTTPHEADER, ["Content-Type: application/json"] + self._headers)
+        c.setopt(c.POSTFIELDS, data)
+        c.setopt(c.WRITEFUNCTION, lambda chunk: None)
+        try:
+            c.perform()
+            code = c.getinfo(c.HTTP_CODE)
+        finally:
+            c.close()
+        if int(code) >= 300:
+            raise Exception(
+                "Unable to export spans to {}, code {}".format(self._endpoint, code)
+            )
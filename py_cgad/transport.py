@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import abc
+import json
+import os
+from io import BytesIO
+
+from .retry import RequestError
+
+
+class Transport(abc.ABC):
+    """
+    Backend used by GitHubApp to make http requests
+
+    A transport makes a single attempt at a request, retries are handled by
+    the app. request must return the status code, a dict of lower case
+    response headers and the body as bytes, and raise a retry.RequestError if
+    no response was received. The timings and sizes of the attempt should be
+    stored in record.
+
+    If a sink is provided the body is written to it as it is received, using
+    its write method, and an empty body is returned. If a source is provided,
+    a file opened in binary mode, the rest of it is streamed as the body of
+    the request instead of custom_data. A timeout of None means no limit.
+    """
+
+    @abc.abstractmethod
+    def request(
+        self,
+        method,
+        url,
+        header,
+        custom_data,
+        record,
+        connect_timeout=None,
+        total_timeout=None,
+        sink=None,
+        source=None,
+    ):
+        pass
+
+
+class PycurlTransport(Transport):
+    """
+    The default transport, requests are made with pycurl
+
+    pycurl is imported when the first request is made. A transfer is aborted
+    if it is slower than low_speed_limit bytes per second for low_speed_time
+    seconds, so requests without a total timeout cannot hang forever.
+    """
+
+    def __init__(self, verbosity=0, low_speed_limit=1024, low_speed_time=60):
+        self._verbosity = verbosity
+        self._low_speed_limit = low_speed_limit
+        self._low_speed_time = low_speed_time
+
+    def request(
+        self,
+        method,
+        url,
+        header,
+        custom_data,
+        record,
+        connect_timeout=None,
+        total_timeout=None,
+        sink=None,
+        source=None,
+    ):
+        import pycurl
+
+        buffer_temp = BytesIO()
+        response_headers = {}
+
+        def recordHeader(header_line):
+            header_line = header_line.decode("iso-8859-1")
+            if ":" in header_line:
+                key, value = header_line.split(":", 1)
+                response_headers[key.strip().lower()] = value.strip()
+
+        c = pycurl.Curl()
+        c.setopt(c.URL, url)
+        c.setopt(pycurl.VERBOSE, self._verbosity)
+        if sink is not None:
+            c.setopt(c.WRITEFUNCTION, sink.write)
+        else:
+            c.setopt(c.WRITEDATA, buffer_temp)
+        c.setopt(c.HEADERFUNCTION, recordHeader)
+        c.setopt(c.HTTPHEADER, header)
+        if connect_timeout is not None:
+            c.setopt(c.CONNECTTIMEOUT, connect_timeout)
+        if total_timeout is not None:
+            c.setopt(c.TIMEOUT, total_timeout)
+        c.setopt(c.LOW_SPEED_LIMIT, self._low_speed_limit)
+        c.setopt(c.LOW_SPEED_TIME, self._low_speed_time)
+        if source is not None:
+            position = source.tell()
+            size = source.seek(0, os.SEEK_END) - position
+            source.seek(position)
+            if method == "POST":
+                c.setopt(c.POST, 1)
+                c.setopt(c.POSTFIELDSIZE_LARGE, size)
+            else:
+                c.setopt(c.UPLOAD, 1)
+                c.setopt(c.CUSTOMREQUEST, method)
+                c.setopt(c.INFILESIZE_LARGE, size)
+            c.setopt(c.READFUNCTION, source.read)
+        elif method == "POST":
+            c.setopt(c.POST, 1)
+            c.setopt(c.POSTFIELDS, json.dumps(custom_data))
+            c.setopt(c.POSTFIELDSIZE, len(json.dumps(custom_data)))
+        elif method == "PUT":
+            c.setopt(c.PUT, 1)
+        elif method == "DELETE":
+            c.setopt(c.CUSTOMREQUEST, "DELETE")
+            c.setopt(c.POSTFIELDS, json.dumps(custom_data))
+            c.setopt(c.POSTFIELDSIZE, len(json.dumps(custom_data)))
+        elif method == "PATCH":
+            c.setopt(c.CUSTOMREQUEST, "PATCH")
+            c.setopt(c.POSTFIELDS, json.dumps(custom_data))
+            c.setopt(c.POSTFIELDSIZE, len(json.dumps(custom_data)))
+
+        if custom_data is not None and source is None:
+            buffer_temp2 = BytesIO(json.dumps(custom_data).encode("utf-8"))
+            c.setopt(c.READDATA, buffer_temp2)
+
+        try:
+            try:
+                c.perform()
+            except pycurl.error as e:
+                # Nothing can have been processed if no connection was made
+                unsent = [
+                    pycurl.E_COULDNT_RESOLVE_PROXY,
+                    pycurl.E_COULDNT_RESOLVE_HOST,
+                    pycurl.E_COULDNT_CONNECT,
+                ]
+                sent = e.args[0] not in unsent and c.getinfo(c.CONNECT_TIME) > 0
+                raise RequestError(str(e), e.args[0], sent)
+            code = int(c.getinfo(c.HTTP_CODE))
+            record.bytes_in = int(c.getinfo(c.SIZE_DOWNLOAD_T))
+            record.bytes_out = int(c.getinfo(c.SIZE_UPLOAD_T))
+            record.namelookup_time = c.getinfo(c.NAMELOOKUP_TIME)
+            record.connect_time = c.getinfo(c.CONNECT_TIME)
+            record.appconnect_time = c.getinfo(c.APPCONNECT_TIME)
+            record.total_time = c.getinfo(c.TOTAL_TIME)
+        finally:
+            c.close()
+        return code, response_headers, buffer_temp.getvalue()
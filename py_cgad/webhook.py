@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import sys
+
+_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+def signPayload(secret, body):
+    """Returns the X-Hub-Signature-256 header value github sends with body."""
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verifySignature(secret, body, headers):
+    """
+    Check the signature of a webhook delivery
+
+    headers must use lower case keys, the sha256 signature is preferred and
+    the legacy sha1 signature is only used if it is the only one provided.
+    """
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+    signature = headers.get("x-hub-signature-256")
+    if signature is not None:
+        expected = "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature, expected)
+    signature = headers.get("x-hub-signature")
+    if signature is not None:
+        expected = "sha1=" + hmac.new(secret, body, hashlib.sha1).hexdigest()
+        return hmac.compare_digest(signature, expected)
+    return False
+
+
+class WebhookEvent:
+    """A webhook delivery that has been accepted by the server."""
+
+    def __init__(self, name, delivery, payload):
+        self.name = name
+        self.delivery = delivery
+        self.payload = payload
+
+    @property
+    def action(self):
+        return self.payload.get("action")
+
+
+class WebhookServer:
+    """
+    Receives github webhooks and dispatches them to handlers
+
+    Deliveries are checked against the shared secret, queued and answered
+    straight away, the events are then processed by a pool of worker tasks.
+    When the queue is full deliveries are rejected with a 503 so github
+    records them as failed and they can be redelivered.
+
+    If an app is provided its caches are updated from each event before the
+    handlers are called, so a bot can rely on the cached branches, pull
+    requests and trees instead of polling for changes.
+
+    server = WebhookServer(app, secret=os.environ["WEBHOOK_SECRET"], port=8080)
+
+    @server.on("pull_request")
+    def pullRequest(event):
+        print(event.action, event.payload["number"])
+
+    server.run()
+
+    Handlers can be plain functions, which are run in a thread, or
+    coroutine functions. Register a handler for "*" to receive every event.
+
+    A secret is required, anyone able to reach the server could otherwise
+    make the app act on forged events. To accept unsigned deliveries anyway,
+    e.g. behind a proxy that checks them, pass allow_unsigned=True.
+    """
+
+    def __init__(
+        self,
+        app=None,
+        secret=None,
+        host="127.0.0.1",
+        port=8080,
+        path="/",
+        max_queue=1000,
+        workers=4,
+        max_body=25 * 1024 * 1024,
+        allow_unsigned=False,
+    ):
+        if secret is None and not allow_unsigned:
+            error_msg = "A webhook secret is required to verify deliveries, "
+            error_msg += "pass allow_unsigned=True to accept unsigned deliveries"
+            raise Exception(error_msg)
+        self._app = app
+        self._secret = secret
+        self._host = host
+        self._port = port
+        self._path = path
+        self._max_queue = max_queue
+        self._workers = workers
+        self._max_body = max_body
+        self._handlers = {}
+        self._server = None
+        self._queue = None
+        self._tasks = []
+        if app is not None:
+            self._log = app._log
+        else:
+            self._log = logging.getLogger(__name__)
+        if secret is None:
+            self._log.warning(
+                "Webhook signatures are not verified, deliveries may be forged"
+            )
+
+    def on(self, event, handler=None):
+        """
+        Register a handler for an event, can be used as a decorator
+
+        The handler is passed a WebhookEvent.
+        """
+        if handler is None:
+
+            def decorator(func):
+                self.on(event, func)
+                return func
+
+            return decorator
+        self._handlers.setdefault(event, []).append(handler)
+        return handler
+
+    @property
+    def port(self):
+        """Returns the port the server is listening on."""
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self._workers)
+        ]
+        self._server = await asyncio.start_server(
+            self._handleConnection, self._host, self._port
+        )
+        if self._app is not None:
+            self._app._event_driven = True
+        self._log.info("Listening for webhooks on %s:%d" % (self._host, self.port))
+
+    async def stop(self):
+        """Stop accepting deliveries and wait for queued events to be processed."""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._app is not None:
+            # Without events the cached pull requests would go stale
+            self._app._event_driven = False
+            self._app._pulls = None
+
+    def run(self):
+        """Run the server until interrupted."""
+
+        async def serve():
+            await self.start()
+            try:
+                await self._server.serve_forever()
+            finally:
+                await self.stop()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def _respond(self, writer, status, message=""):
+        body = json.dumps({"message": message}).encode("utf-8")
+        writer.write(
+            (
+                "HTTP/1.1 %d %s\r\n"
+                "Content-Type: application/json\r\n"
+                "Content-Length: %d\r\n"
+                "Connection: close\r\n\r\n" % (status, _REASONS[status], len(body))
+            ).encode("ascii")
+            + body
+        )
+        await writer.drain()
+
+    async def _handleConnection(self, reader, writer):
+        try:
+            status, message = await self._receive(reader)
+            await self._respond(writer, status, message)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _receive(self, reader):
+        """Read a delivery and queue it, returns the status and message of the response."""
+        request_line = (await reader.readline()).decode("iso-8859-1").split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("iso-8859-1")
+            if line in ["\r\n", "\n", ""]:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if len(request_line) != 3:
+            return 400, "Malformed request"
+        method, target, _ = request_line
+        if target.split("?", 1)[0] != self._path:
+            return 404, "Not Found"
+        if method != "POST":
+            return 405, "Deliveries must be POSTed"
+        if "content-length" not in headers:
+            return 411, "Content-Length is required"
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            length = -1
+        if length < 0:
+            return 400, "Content-Length is not valid"
+        if length > self._max_body:
+            return 413, "Payload is too large"
+        body = await reader.readexactly(length)
+
+        if self._secret is not None and not verifySignature(
+            self._secret, body, headers
+        ):
+            self._log.warning("Rejected webhook with an invalid signature")
+            return 401, "Invalid signature"
+        name = headers.get("x-github-event")
+        if name is None:
+            return 400, "Missing X-GitHub-Event header"
+        if name == "ping":
+            return 200, "pong"
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return 400, "Payload is not valid json"
+
+        event = WebhookEvent(name, headers.get("x-github-delivery"), payload)
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._log.warning("Webhook queue is full, rejecting %s event" % name)
+            return 503, "Queue is full"
+        return 202, "Accepted"
+
+    async def _worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._dispatch(loop, event)
+            except Exception as e:
+                self._log.error(
+                    "Failed to process %s event %s: %s"
+                    % (event.name, event.delivery, e)
+                )
+            finally:
+                self._queue.task_done()
+
+    async def _dispatch(self, loop, event):
+        if self._app is not None:
+            self._app.applyWebhookEvent(event.name, event.payload)
+        handlers = self._handlers.get(event.name, []) + self._handlers.get("*", [])
+        for handler in handlers:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(event)
+            else:
+                await loop.run_in_executor(None, handler, event)
+
+
+def postPayload(url, event, payload, secret=None, delivery=None):
+    """
+    Deliver a payload to a webhook server the way github would
+
+    Used to replay recorded payloads against a local server, returns the
+    status of the response.
+    """
+    import urllib.error
+    import urllib.request
+    import uuid
+
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-GitHub-Delivery": delivery if delivery is not None else str(uuid.uuid4()),
+    }
+    if secret is not None:
+        headers["X-Hub-Signature-256"] = signPayload(secret, body)
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main(argv=None):
+    """Command line interface used to replay recorded payloads."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m py_cgad.webhook",
+        description="Post recorded github webhook payloads to a server.",
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8080/")
+    parser.add_argument("--secret", default=None, help="Secret used to sign payloads.")
+    parser.add_argument("--event", required=True, help="Value of X-GitHub-Event.")
+    parser.add_argument("payloads", nargs="+", help="Json files to post.")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for file_name in args.payloads:
+        with open(file_name, "rb") as f:
+            status = postPayload(args.url, args.event, f.read(), args.secret)
+        print("%s: %d" % (file_name, status))
+        if status >= 300:
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from py_cgad.fakegithub import FakeGitHub
+from py_cgad.githubapp import GitHubApp, Node
+from py_cgad.retry import RetryPolicy
+
+
+@pytest.fixture(scope="session")
+def pem_file(tmp_path_factory):
+    """A private key that can be used to initialize apps against FakeGitHub."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem_path = tmp_path_factory.mktemp("pem") / "app.pem"
+    pem_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+    )
+    return str(pem_path)
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch, pem_file):
+    """Returns a function that creates initialized apps using a FakeGitHub."""
+    monkeypatch.chdir(tmp_path)
+
+    def makeApp(github, base_url="https://api.github.com", create_branch=True):
+        app = GitHubApp(
+            39,
+            "test-app",
+            "lanl",
+            "Py-CGAD",
+            retry_policy=RetryPolicy(sleep=lambda seconds: None),
+            base_url=base_url,
+            transport=github,
+            config_dir=str(tmp_path),
+            cache_dir=str(tmp_path / "cache"),
+        )
+        app.initialize(
+            pem_file, create_branch=create_branch, path_to_repo=str(tmp_path)
+        )
+        return app
+
+    return makeApp
+
+
+@pytest.fixture
+def github():
+    """A FakeGitHub with a lanl/Py-CGAD repository containing a couple of files."""
+    github = FakeGitHub()
+    repo = github.createRepo("lanl", "Py-CGAD")
+    repo.commitFiles({"README.md": "# Py-CGAD", "bin/run.sh": "echo run"})
+    return github
+
+
+@pytest.fixture
+def sample_tree():
+    """A Node tree with files, a misc entry and nested directories."""
+    root = Node()
+    root.insert("README.md", "file", "1" * 40)
+    root.insert("bin", "dir", "2" * 40)
+    root.insert("bin/run.sh", "file", "3" * 40)
+    root.insert("bin/lib", "dir", "4" * 40)
+    root.insert("bin/lib/common.py", "file", "5" * 40)
+    root.insert("logo.png", "misc", "6" * 40)
+    return root
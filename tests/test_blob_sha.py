@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from py_cgad.githubapp import BlobShaCache, gitBlobSha
+
+
+def test_git_blob_sha(tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert gitBlobSha(str(empty)) == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+    hello = tmp_path / "hello.txt"
+    hello.write_bytes(b"hello\n")
+    # Hashing in small chunks gives the same result
+    assert gitBlobSha(str(hello), chunk_size=2) == (
+        "ce013625030ba8dba906f756967f9e9ca394464a"
+    )
+
+
+def test_blob_sha_cache(tmp_path):
+    cache_file = str(tmp_path / "cache" / "blob_shas.json")
+    hello = tmp_path / "hello.txt"
+    hello.write_bytes(b"hello\n")
+
+    cache = BlobShaCache(cache_file)
+    assert cache.sha(str(hello)) == "ce013625030ba8dba906f756967f9e9ca394464a"
+    cache.save()
+    assert os.path.isfile(cache_file)
+
+    # A new cache reuses the stored sha while size and mtime are unchanged
+    stat = os.stat(str(hello))
+    cache = BlobShaCache(cache_file)
+    cache._entries[str(hello)][2] = "0" * 40
+    assert cache.sha(str(hello)) == "0" * 40
+
+    # Changing the file invalidates the entry
+    hello.write_bytes(b"hello world\n")
+    os.utime(str(hello), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert cache.sha(str(hello)) == gitBlobSha(str(hello))
+
+
+def test_blob_sha_cache_many(tmp_path):
+    file_paths = []
+    for index in range(4):
+        file_path = tmp_path / "file{}.txt".format(index)
+        file_path.write_bytes(b"content %d\n" % index)
+        file_paths.append(str(file_path))
+
+    cache = BlobShaCache()
+    expected = [gitBlobSha(file_path) for file_path in file_paths]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert cache.shaMany(file_paths, executor) == expected
+    # Cached entries are reused without an executor
+    assert cache.shaMany(file_paths) == expected
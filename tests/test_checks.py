@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from py_cgad.tracing import Tracer
+
+CHECK_RUN_URL = "/repos/{owner}/{repo}/check-runs/{id}"
+
+
+def lintResults(count, consumed):
+    for index in range(count):
+        consumed.append(index)
+        yield {
+            "path": "bin/run.sh",
+            "start_line": index + 1,
+            "message": "Problem %d" % index,
+            "annotation_level": "failure" if index % 100 == 0 else "warning",
+        }
+
+
+def test_post_check_run(github, make_app):
+    app = make_app(github)
+    tracer = Tracer()
+    app.setTracer(tracer)
+    repo = github.repo("lanl", "Py-CGAD")
+    consumed = []
+    check_run_id = app.postCheckRun(
+        "lint", lintResults(1234, consumed), commit_sha=repo.refs["master"]
+    )
+
+    check_run = repo.check_runs[check_run_id]
+    assert len(check_run["annotations"]) == 1234
+    assert check_run["annotations"][0]["end_line"] == 1
+    assert check_run["status"] == "completed"
+    assert check_run["conclusion"] == "failure"
+    assert check_run["output"]["title"] == "lint"
+    assert check_run["output"]["summary"] == "13 failures, 1221 warnings, 0 notices"
+    # 25 batches of at most 50 and the final update
+    assert github.requests[("PATCH", CHECK_RUN_URL)] == 26
+    names = [span.name for span in tracer.flush()]
+    assert names.count("GitHubApp.updateCheckRun") == 26
+
+
+def test_annotations_are_streamed(github, make_app, monkeypatch):
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    check_run_id = app.createCheckRun("lint", sha)
+
+    # Record how much of the generator had been consumed at each batch
+    consumed = []
+    seen = []
+    active = []
+    overlap = []
+    lock = threading.Lock()
+    update = app.updateCheckRun
+
+    def recordingUpdate(*args, **kwargs):
+        with lock:
+            seen.append(len(consumed))
+            active.append(1)
+            overlap.append(len(active))
+        try:
+            return update(*args, **kwargs)
+        finally:
+            with lock:
+                active.pop()
+
+    monkeypatch.setattr(app, "updateCheckRun", recordingUpdate)
+    monkeypatch.setattr(github, "_latency", 0.01)
+    counts = app.postAnnotations(
+        check_run_id, lintResults(1000, consumed), "lint", max_workers=4
+    )
+    assert counts == {"failure": 10, "warning": 990, "notice": 0}
+    assert len(seen) == 20
+    # The generator is never more than max_workers batches ahead
+    assert all(count <= 50 * (index + 5) for index, count in enumerate(seen))
+    assert max(overlap) > 1
+
+
+def test_annotation_validation(github, make_app):
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    check_run_id = app.createCheckRun("lint", sha)
+    with pytest.raises(Exception, match="missing message"):
+        app.postAnnotations(check_run_id, [{"path": "a", "start_line": 1}], "lint")
+    too_many = [{"path": "a", "start_line": 1, "message": "m"}] * 51
+    with pytest.raises(Exception, match="At most 50"):
+        app.updateCheckRun(check_run_id, title="t", summary="s", annotations=too_many)
+    with pytest.raises(Exception, match="Unable to create check run"):
+        app.createCheckRun("lint", "0" * 40)
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+BLOB_URL = "/repos/{owner}/{repo}/git/blobs/{sha}"
+
+
+def test_download(github, make_app, tmp_path):
+    app = make_app(github)
+    path = app.download("bin/run.sh")
+    assert path == "run.sh"
+    assert (tmp_path / "run.sh").read_bytes() == b"echo run"
+
+    (tmp_path / "out").mkdir()
+    path = app.download("README.md", dest=str(tmp_path / "out"))
+    assert open(path).read() == "# Py-CGAD"
+    assert github.requests[("GET", BLOB_URL)] == 2
+
+    # Cached blobs are copied without a request
+    os.remove(path)
+    app.download("README.md", dest=str(tmp_path / "out"))
+    assert github.requests[("GET", BLOB_URL)] == 2
+
+    with pytest.raises(Exception, match="does not exist"):
+        app.download("bin/missing.sh")
+
+
+def test_download_many(github, make_app, tmp_path):
+    repo = github.repo("lanl", "Py-CGAD")
+    files = {"data/%d.txt" % index: "value %d" % (index % 5) for index in range(20)}
+    files["data/large.bin"] = bytes(range(256)) * 4096
+    repo.commitFiles(files)
+    app = make_app(github)
+
+    result = app.downloadMany(sorted(files), dest="checkout", max_workers=4)
+    assert result["data/3.txt"] == os.path.join("checkout", "data", "3.txt")
+    for path, content in files.items():
+        if isinstance(content, str):
+            content = content.encode()
+        assert (tmp_path / "checkout" / path).read_bytes() == content
+    # Files with the same content share a blob that is downloaded once
+    assert github.requests[("GET", BLOB_URL)] == 6
+
+    # Unchanged files are left alone and changed ones restored from the cache
+    large = tmp_path / "checkout" / "data" / "large.bin"
+    mtime = large.stat().st_mtime_ns
+    (tmp_path / "checkout" / "data" / "0.txt").write_text("edited")
+    app.downloadMany(sorted(files), dest="checkout")
+    assert (tmp_path / "checkout" / "data" / "0.txt").read_text() == "value 0"
+    assert large.stat().st_mtime_ns == mtime
+    assert github.requests[("GET", BLOB_URL)] == 6
+
+
+def test_failed_download_is_retried(github, make_app, tmp_path):
+    app = make_app(github)
+    app.getBranchTree("master")
+    github.failNext(2)
+    app.download("bin/run.sh")
+    assert (tmp_path / "run.sh").read_bytes() == b"echo run"
+    # Nothing partial is left in the cache
+    blob_dir = tmp_path / "cache" / "blobs"
+    assert not [
+        name
+        for _, _, names in os.walk(str(blob_dir))
+        for name in names
+        if name[0] == "."
+    ]
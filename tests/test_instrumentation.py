@@ -0,0 +1,76 @@
+import json
+
+from py_cgad.instrumentation import (
+    MetricsAggregator,
+    RequestRecord,
+    endpointTemplate,
+    parseRateLimit,
+)
+
+
+def test_endpoint_template():
+    assert (
+        endpointTemplate(
+            "https://api.github.com/repos/lanl/Py-CGAD/contents/./bin/file.py?ref=main"
+        )
+        == "/repos/{owner}/{repo}/contents/{path}"
+    )
+    assert (
+        endpointTemplate("https://api.github.com/repos/lanl/Py-CGAD/branches?page=2")
+        == "/repos/{owner}/{repo}/branches"
+    )
+    assert (
+        endpointTemplate(
+            "https://api.github.com/repos/lanl/Py-CGAD/statuses/"
+            "316070e1e044c6f1b3659507bbbc3ad56524816a"
+        )
+        == "/repos/{owner}/{repo}/statuses/{sha}"
+    )
+    assert (
+        endpointTemplate("https://api.github.com/app/installations/1234/access_tokens")
+        == "/app/installations/{installation_id}/access_tokens"
+    )
+
+
+def test_parse_rate_limit():
+    rate_limit = parseRateLimit(
+        {
+            "x-ratelimit-limit": "5000",
+            "x-ratelimit-remaining": "4999",
+            "x-ratelimit-resource": "core",
+            "content-type": "application/json",
+        }
+    )
+    assert rate_limit == {"limit": 5000, "remaining": 4999, "resource": "core"}
+
+
+def test_metrics_aggregator():
+    aggregator = MetricsAggregator()
+    for status in [200, 200, 404]:
+        record = RequestRecord(
+            "GET", "https://api.github.com/repos/lanl/Py-CGAD/contents/a.py"
+        )
+        record.status = status
+        record.bytes_in = 100
+        record.total_time = 0.5
+        record.connect_time = 0.1
+        record.rate_limit = {"remaining": 10, "resource": "core"}
+        aggregator(record)
+
+    summary = json.loads(aggregator.toJSON())
+    assert len(summary["requests"]) == 2
+    ok = [entry for entry in summary["requests"] if entry["status"] == "200"][0]
+    assert ok["count"] == 2
+    assert ok["bytes_in"] == 200
+    assert ok["transfer"] == 0.8
+    assert summary["rate_limit"]["core"]["remaining"] == 10
+
+    text = aggregator.toPrometheus()
+    assert (
+        'py_cgad_requests_total{method="GET",'
+        'endpoint="/repos/{owner}/{repo}/contents/{path}",status="200"} 2'
+    ) in text
+    assert 'py_cgad_rate_limit_remaining{resource="core"} 10' in text
+
+    aggregator.reset()
+    assert aggregator.summary()["requests"] == []
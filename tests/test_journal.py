@@ -0,0 +1,162 @@
+import os
+
+import pytest
+
+from py_cgad.journal import Journal, main
+
+
+def test_resume_operation(tmp_path):
+    journal_path = str(tmp_path / "job.jsonl")
+    journal = Journal(journal_path)
+    intent = {"branch": "figures", "files": [["a.png", "1" * 40]]}
+    operation = journal.begin("uploadImages", intent)
+    operation.recordBlob("a.png", "1" * 40)
+    operation.record("commit", sha="2" * 40, parent="3" * 40)
+
+    # Reopening the journal resumes the unfinished operation
+    journal = Journal(journal_path)
+    resumed = journal.begin("uploadImages", intent)
+    assert resumed.op_id == operation.op_id
+    assert resumed.blobs == {"a.png": "1" * 40}
+    assert resumed.get("commit") == "2" * 40
+    assert resumed.get("commit", "parent") == "3" * 40
+    assert resumed.get("ref") is None
+
+    # A different intent starts a new operation
+    other = journal.begin("uploadImages", {"branch": "figures", "files": []})
+    assert other.op_id != operation.op_id
+    assert len(journal.pending) == 2
+
+    # Completed operations are compacted out of the journal
+    resumed.complete()
+    journal = Journal(journal_path)
+    assert [op.op_id for op in journal.operations] == [other.op_id]
+
+
+def test_torn_record_is_discarded(tmp_path):
+    journal_path = str(tmp_path / "job.jsonl")
+    journal = Journal(journal_path)
+    operation = journal.begin("remove", {"branch": "master", "path": "a.txt"})
+    size = os.path.getsize(journal_path)
+    with open(journal_path, "ab") as f:
+        f.write(b'{"event": "commit", "op_id": "')
+
+    journal = Journal(journal_path)
+    assert os.path.getsize(journal_path) == size
+    resumed = journal.pending[0]
+    assert resumed.op_id == operation.op_id
+    assert resumed.get("commit") is None
+    resumed.record("commit", sha="4" * 40)
+    assert Journal(journal_path).pending[0].get("commit") == "4" * 40
+
+
+def test_cli(tmp_path, capsys):
+    journal_dir = str(tmp_path)
+    journal = Journal(os.path.join(journal_dir, "job.jsonl"))
+    journal.begin("remove", {"branch": "master", "path": "a.txt"})
+
+    assert main(["-d", journal_dir, "list"]) == 0
+    assert "job: 1 pending" in capsys.readouterr().out
+    assert main(["-d", journal_dir, "show", "job"]) == 0
+    assert '"operation": "remove"' in capsys.readouterr().out
+    assert main(["-d", journal_dir, "clear", "job"]) == 0
+    assert not os.path.exists(os.path.join(journal_dir, "job.jsonl"))
+
+
+def interrupt(monkeypatch, app, method):
+    """Make method of app fail as if the process died when it was called."""
+
+    def crash(*args, **kwargs):
+        raise Exception("interrupted")
+
+    monkeypatch.setattr(app, method, crash)
+
+
+def test_upload_images_resumes_after_interruption(
+    github, make_app, tmp_path, monkeypatch
+):
+    repo = github.repo("lanl", "Py-CGAD")
+    images = []
+    for name in ["a.png", "b.png"]:
+        (tmp_path / name).write_bytes(name.encode())
+        images.append(str(tmp_path / name))
+    journal_path = str(tmp_path / "figures.jsonl")
+
+    app = make_app(github)
+    interrupt(monkeypatch, app, "_updateBranchRef")
+    with pytest.raises(Exception, match="interrupted"):
+        app.uploadImages(images, journal=Journal(journal_path))
+    monkeypatch.undo()
+    assert "a.png" not in repo.files("figures")
+    requests = dict(github.requests)
+
+    # A new run reuses the blobs, tree and commit of the interrupted one
+    app = make_app(github)
+    journal = Journal(journal_path)
+    app.uploadImages(images, journal=journal)
+    assert repo.readFile("b.png", "figures") == b"b.png"
+    for endpoint in ["blobs", "trees", "commits"]:
+        key = ("POST", "/repos/{owner}/{repo}/git/" + endpoint)
+        assert github.requests[key] == requests[key]
+    assert journal.pending == []
+
+
+def test_upload_images_after_edit_of_interrupted_run(
+    github, make_app, tmp_path, monkeypatch
+):
+    repo = github.repo("lanl", "Py-CGAD")
+    image = tmp_path / "a.png"
+    image.write_bytes(b"old")
+    journal_path = str(tmp_path / "figures.jsonl")
+
+    app = make_app(github)
+    interrupt(monkeypatch, app, "_updateBranchRef")
+    with pytest.raises(Exception, match="interrupted"):
+        app.uploadImages([str(image)], journal=Journal(journal_path))
+    monkeypatch.undo()
+
+    # The recorded commit is for the old content so it is not reused
+    image.write_bytes(b"new")
+    journal = Journal(journal_path)
+    make_app(github).uploadImages([str(image)], journal=journal)
+    assert repo.readFile("a.png", "figures") == b"new"
+    assert journal.pending == []
+
+
+def test_upload_and_remove_resume_after_interruption(
+    github, make_app, tmp_path, monkeypatch
+):
+    repo = github.repo("lanl", "Py-CGAD")
+    report = tmp_path / "report.md"
+    report.write_text("results")
+    journal_path = str(tmp_path / "report.jsonl")
+
+    # Interrupted after the file was committed but before it was recorded
+    app = make_app(github)
+    interrupt(monkeypatch, app, "_recordContentChange")
+    with pytest.raises(Exception, match="interrupted"):
+        app.upload(str(report), branch="master", journal=Journal(journal_path))
+    monkeypatch.undo()
+    assert repo.readFile("report.md") == b"results"
+
+    # The file is edited before the job is run again
+    report.write_text("new results")
+    journal = Journal(journal_path)
+    make_app(github).upload(str(report), branch="master", journal=journal)
+    assert repo.readFile("report.md") == b"new results"
+    assert journal.pending == []
+
+    app = make_app(github)
+    interrupt(monkeypatch, app, "_recordContentChange")
+    with pytest.raises(Exception, match="interrupted"):
+        app.remove("report.md", branch="master", journal=Journal(journal_path))
+    monkeypatch.undo()
+    deletes = github.requests[("DELETE", "/repos/{owner}/{repo}/contents/{path}")]
+
+    journal = Journal(journal_path)
+    make_app(github).remove("report.md", branch="master", journal=journal)
+    assert repo.readFile("report.md") is None
+    assert github.requests[("DELETE", "/repos/{owner}/{repo}/contents/{path}")] == (
+        deletes
+    )
+    assert journal.pending == []
@@ -0,0 +1,90 @@
+import subprocess
+
+import pytest
+
+from py_cgad.mirror import GitMirror
+
+
+def git(*args, cwd=None):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        + list(args),
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode()
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """A bare repository that serves partial clones, with a work tree to push from."""
+    remote = tmp_path / "remote.git"
+    git("init", "-q", "--bare", str(remote))
+    git("config", "uploadpack.allowFilter", "true", cwd=str(remote))
+    work = tmp_path / "work"
+    git("init", "-q", str(work))
+    (work / "bin").mkdir()
+    (work / "bin" / "run.sh").write_text("echo run")
+    (work / "README.md").write_text("# Py-CGAD")
+    git("add", ".", cwd=str(work))
+    git("commit", "-q", "-m", "Initial commit", cwd=str(work))
+    git("push", "-q", str(remote), "HEAD:refs/heads/master", cwd=str(work))
+    git("push", "-q", str(remote), "HEAD:refs/heads/feature", cwd=str(work))
+    return "file://" + str(remote), work
+
+
+def missingObjects(mirror):
+    output = git("rev-list", "--objects", "--all", "--missing=print", cwd=mirror.path)
+    return [line[1:] for line in output.splitlines() if line.startswith("?")]
+
+
+def test_mirror(remote, tmp_path):
+    url, work = remote
+    mirror = GitMirror(str(tmp_path / "mirror.git"), url)
+    mirror.fetch(["master"])
+    assert mirror.branches() == ["master"]
+    entries = mirror.tree("master")
+    assert [(path, kind) for path, kind, _ in entries] == [
+        ("README.md", "file"),
+        ("bin", "dir"),
+        ("bin/run.sh", "file"),
+    ]
+    # Blobs are only fetched when they are read
+    assert len(missingObjects(mirror)) == 2
+    assert mirror.readFile("bin/run.sh", "master") == b"echo run"
+    assert len(missingObjects(mirror)) == 1
+
+    mirror.fetch()
+    assert sorted(mirror.branches()) == ["feature", "master"]
+    git("push", "-q", url, ":refs/heads/feature", cwd=str(work))
+    mirror.fetch(["feature", "master"])
+    assert mirror.branches() == ["master"]
+
+
+def test_app_reads_from_mirror(remote, tmp_path, github, make_app):
+    url, work = remote
+    app = make_app(github)
+    app.useMirror(remote_url=url)
+
+    assert sorted(app.branches) == ["feature", "master"]
+    head = git("rev-parse", "HEAD", cwd=str(work)).strip()
+    assert app.getLatestCommitSha("master") == head
+    tree = app.getBranchTree("master")
+    assert tree.type("bin") == "dir"
+    assert (
+        tree.getSha("bin/run.sh")
+        == git("rev-parse", "HEAD:bin/run.sh", cwd=str(work)).strip()
+    )
+    assert "./bin/run.sh" in app.getContents("master")
+    assert sum(github.requests.values()) == 0
+
+    # Refreshing fetches the new commits of the branch
+    (work / "bin" / "test.sh").write_text("echo test")
+    git("add", ".", cwd=str(work))
+    git("commit", "-q", "-m", "Add test", cwd=str(work))
+    git("push", "-q", url, "HEAD:refs/heads/master", cwd=str(work))
+    tree = app.refreshBranchTreeCache("master")
+    assert tree.type("bin/test.sh") == "file"
+    with pytest.raises(Exception, match="Branch missing"):
+        app.refreshBranchTreeCache("missing")
+    assert sum(github.requests.values()) == 0
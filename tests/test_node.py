@@ -1,3 +1,8 @@
+import copy
+import csv
+import io
+import json
+
 from py_cgad.githubapp import Node
 
 
@@ -125,3 +130,235 @@ def test_add_file_to_dir():
     assert (
         root_node.getSha("./src/test.py") == "316070e1e044c6f1b3659507bbbc3ad56524816a"
     )
+
+
+def lazy_tree_loader(calls):
+    remote = {
+        ".": [
+            ("docs", "dir", "1111111111111111111111111111111111111111"),
+            ("src", "dir", "2222222222222222222222222222222222222222"),
+            ("README.md", "file", "3333333333333333333333333333333333333333"),
+        ],
+        "./docs": [
+            ("figures", "dir", "4444444444444444444444444444444444444444"),
+        ],
+        "./docs/figures": [
+            ("plot.png", "file", "5555555555555555555555555555555555555555"),
+        ],
+        "./src": [
+            ("main.py", "file", "6666666666666666666666666666666666666666"),
+        ],
+    }
+
+    def loader(node):
+        calls.append(node.path)
+        for name, content_type, sha in remote[node.path]:
+            node.insert(name, content_type, sha)
+
+    return loader
+
+
+def test_lazy_node():
+    calls = []
+    root_node = Node(loader=lazy_tree_loader(calls))
+    assert not root_node.loaded
+    assert calls == []
+
+    assert root_node.exists("docs/figures/plot.png")
+    assert calls == [".", "./docs", "./docs/figures"]
+    assert (
+        root_node.getSha("docs/figures/plot.png")
+        == "5555555555555555555555555555555555555555"
+    )
+    assert root_node.type("docs/figures/plot.png") == "file"
+    assert root_node.type("docs/figures") == "dir"
+    assert not root_node.exists("docs/figures/missing.png")
+    # Directories are only fetched once
+    assert calls == [".", "./docs", "./docs/figures"]
+
+    assert not root_node.nodes[1].loaded
+    root_node.loadAll()
+    assert calls == [".", "./docs", "./docs/figures", "./src"]
+    assert root_node.getSha("src/main.py") == "6666666666666666666666666666666666666666"
+
+
+def test_lazy_node_loader_failure():
+    def loader(node):
+        raise Exception("Network unavailable")
+
+    root_node = Node(loader=loader)
+    try:
+        root_node.exists("README.md")
+        assert False
+    except Exception as e:
+        assert str(e) == "Network unavailable"
+    assert not root_node.loaded
+
+
+def test_contents():
+    root_node = Node()
+    root_node.insert("src", "dir", "8888888888888888888888888888888888888888")
+    root_node.insert("README.md", "file", "1111111111111111111111111111111111111111")
+    root_node.insert(
+        "./src/test.py", "file", "316070e1e044c6f1b3659507bbbc3ad56524816a"
+    )
+    contents = root_node.contents
+    assert dict(contents) == {
+        "./src": ("src", "8888888888888888888888888888888888888888"),
+        "./README.md": ("README.md", "1111111111111111111111111111111111111111"),
+        "./src/test.py": ("test.py", "316070e1e044c6f1b3659507bbbc3ad56524816a"),
+    }
+    # The same view is returned and kept up to date on insert
+    assert root_node.contents is contents
+    root_node.insert("src/logo.png", "misc", "2222222222222222222222222222222222222222")
+    assert contents["./src/logo.png"] == (
+        "logo.png",
+        "2222222222222222222222222222222222222222",
+    )
+    try:
+        contents["./new.py"] = ("new.py", None)
+        assert False
+    except TypeError:
+        pass
+
+    # Copies of the tree have their own map
+    copied = copy.deepcopy(root_node)
+    copied.insert("copied.py", "file", "3333333333333333333333333333333333333333")
+    assert "./copied.py" in copied.nodes[0].contents
+    assert "./copied.py" not in contents
+
+
+def test_diff():
+    def tree(entries):
+        root = Node()
+        for path, content_type, sha in entries:
+            root.insert(path, content_type, sha * 40)
+        return root
+
+    old = tree(
+        [
+            ("bin", "dir", "1"),
+            ("bin/run.sh", "file", "2"),
+            ("lib", "dir", "3"),
+            ("lib/common.py", "file", "4"),
+            ("lib/util.py", "file", "5"),
+            ("docs", "dir", "6"),
+            ("docs/index.md", "file", "7"),
+            ("logo.png", "misc", "8"),
+        ]
+    )
+    new = tree(
+        [
+            ("bin", "dir", "1"),
+            ("bin/run.sh", "file", "2"),
+            ("lib", "dir", "a"),
+            ("lib/common.py", "file", "b"),
+            ("lib/util.py", "file", "5"),
+            ("lib/new.py", "file", "c"),
+            ("logo.png", "file", "8"),
+        ]
+    )
+    assert list(old.diff(new)) == [
+        ("removed", "./docs", "6" * 40, None),
+        ("removed", "./docs/index.md", "7" * 40, None),
+        ("modified", "./lib/common.py", "4" * 40, "b" * 40),
+        ("added", "./lib/new.py", None, "c" * 40),
+        ("removed", "./logo.png", "8" * 40, None),
+        ("added", "./logo.png", None, "8" * 40),
+    ]
+    assert list(new.diff(copy.deepcopy(new))) == []
+
+
+def test_diff_skips_identical_directories():
+    loaded = []
+
+    def loader(node):
+        loaded.append(node.path)
+
+    old = Node()
+    old.insert("same", "dir", "1" * 40)
+    new = Node()
+    new.insert("same", "dir", "1" * 40)
+    old._dirs[0]._loader = new._dirs[0]._loader = loader
+    old._dirs[0]._loaded = new._dirs[0]._loaded = False
+    assert list(old.diff(new)) == []
+    assert loaded == []
+
+
+def test_walk(sample_tree):
+    root = sample_tree
+    assert list(root.iterPaths()) == [
+        "./README.md",
+        "./logo.png",
+        "./bin",
+        "./bin/run.sh",
+        "./bin/lib",
+        "./bin/lib/common.py",
+    ]
+    assert list(root.iterPaths(order="post")) == [
+        "./README.md",
+        "./logo.png",
+        "./bin/run.sh",
+        "./bin/lib/common.py",
+        "./bin/lib",
+        "./bin",
+    ]
+    assert list(root.walk(max_depth=1)) == [
+        ("./README.md", "file", "1" * 40),
+        ("./logo.png", "misc", "6" * 40),
+        ("./bin", "dir", "2" * 40),
+    ]
+    assert list(root.nodes[0].iterPaths(max_depth=1)) == ["./bin/run.sh", "./bin/lib"]
+    assert root.nodes[0].getRelativePaths("common.py") == ["./lib/common.py"]
+    assert str(root) == (
+        "file README.md\n"
+        "misc logo.png\n"
+        "dir  bin\n"
+        "  file run.sh\n"
+        "  dir  lib\n"
+        "    file common.py\n"
+    )
+
+
+def test_walk_deep_tree():
+    root = Node()
+    node = root
+    for _ in range(5000):
+        node.insert("d", "dir", "7" * 40)
+        node = node.nodes[-1]
+    node.insert("leaf.txt", "file", "8" * 40)
+    paths = list(root.iterPaths(order="post"))
+    assert len(paths) == 5001
+    assert paths[0].endswith("/d/leaf.txt")
+
+
+def test_export(capsys, sample_tree):
+    root = sample_tree
+    text = io.StringIO()
+    assert root.exportText(text) == 6
+    assert text.getvalue() == str(root)
+
+    lines = io.StringIO()
+    assert root.exportJSONLines(lines, max_depth=1) == 3
+    assert [json.loads(line) for line in lines.getvalue().splitlines()][-1] == {
+        "path": "./bin",
+        "type": "dir",
+        "sha": "2" * 40,
+    }
+
+    table = io.StringIO(newline="")
+    assert root.exportCSV(table) == 6
+    rows = list(csv.reader(io.StringIO(table.getvalue())))
+    assert rows[0] == ["path", "type", "sha"]
+    assert rows[-1] == ["./bin/lib/common.py", "file", "5" * 40]
+
+    root.print
+    assert capsys.readouterr().out == (
+        "Contents in folder: .\n"
+        "file README.md\n"
+        "misc logo.png\n"
+        "Contents in folder: ./bin\n"
+        "file run.sh\n"
+        "Contents in folder: ./bin/lib\n"
+        "file common.py\n"
+    )
@@ -0,0 +1,150 @@
+import os
+
+import pytest
+
+from py_cgad.fakegithub import FakeGitHub
+
+UPLOAD_URL = "/repos/{owner}/{repo}/releases/{id}/assets"
+DELETE_URL = "/repos/{owner}/{repo}/releases/assets/{id}"
+
+
+def writeAssets(directory, count, size):
+    names = []
+    for index in range(count):
+        name = os.path.join(str(directory), "asset-%d.whl" % index)
+        with open(name, "wb") as f:
+            f.write(bytes([index]) * size)
+        names.append(name)
+    return names
+
+
+def test_upload_release_assets(github, make_app, tmp_path):
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    names = writeAssets(tmp_path, 5, 300000)
+
+    urls = app.uploadReleaseAssets("v1.0.0", names)
+    assert urls[names[2]] == (
+        "https://github.com/lanl/Py-CGAD/releases/download/v1.0.0/asset-2.whl"
+    )
+    release = repo.releases[0]
+    assert release["tag_name"] == "v1.0.0"
+    # Files are uploaded raw rather than base64 encoded
+    for asset in release["assets"]:
+        with open(os.path.join(str(tmp_path), asset["name"]), "rb") as f:
+            assert asset["content"] == f.read()
+    assert github.requests[("POST", UPLOAD_URL)] == 5
+
+    # Only the changed asset is replaced
+    with open(names[1], "ab") as f:
+        f.write(b"patched")
+    app.uploadReleaseAssets("v1.0.0", names)
+    assert github.requests[("POST", UPLOAD_URL)] == 6
+    assert github.requests[("DELETE", DELETE_URL)] == 1
+    assert len(repo.releases) == 1
+    contents = {asset["name"]: asset["content"] for asset in release["assets"]}
+    assert contents["asset-1.whl"].endswith(b"patched")
+
+
+def test_upload_rejects_assets_with_the_same_name(github, make_app, tmp_path):
+    app = make_app(github)
+    names = []
+    for folder in ["a", "b"]:
+        (tmp_path / folder).mkdir()
+        names += writeAssets(tmp_path / folder, 1, 10)
+    with pytest.raises(Exception, match="same name asset-0.whl in the release"):
+        app.uploadReleaseAssets("v1", names)
+    assert github.requests[("POST", UPLOAD_URL)] == 0
+
+    # The same file listed twice is only uploaded once
+    urls = app.uploadReleaseAssets("v1", [names[0], names[0]])
+    assert list(urls) == [names[0]]
+    assert github.requests[("POST", UPLOAD_URL)] == 1
+
+
+def test_uploads_have_no_total_timeout(github, make_app, tmp_path, monkeypatch):
+    app = make_app(github)
+    timeouts = []
+    request = github.request
+
+    def recordTimeout(method, url, *args, **kwargs):
+        if kwargs.get("source") is not None:
+            timeouts.append(args[4])
+        return request(method, url, *args, **kwargs)
+
+    monkeypatch.setattr(github, "request", recordTimeout)
+    app.uploadReleaseAssets("v1", writeAssets(tmp_path, 1, 10))
+    assert timeouts == [None]
+
+
+def test_release_must_exist(github, make_app, tmp_path):
+    app = make_app(github)
+    names = writeAssets(tmp_path, 1, 10)
+    with pytest.raises(Exception, match="does not exist"):
+        app.uploadReleaseAssets("v2", names, create_release=False)
+    app.createRelease("v2", body="Second release")
+    assert app.getRelease("v2")["body"] == "Second release"
+    assert app.getRelease("v3") is None
+
+
+def test_enterprise_uploads(make_app, tmp_path):
+    github = FakeGitHub(base_url="https://ghe.example.com/api/v3")
+    github.createRepo("lanl", "Py-CGAD")
+    app = make_app(github, base_url="https://ghe.example.com/api/v3/")
+    names = writeAssets(tmp_path, 1, 10)
+    urls = app.uploadReleaseAssets("v1", names)
+    assert urls[names[0]].startswith("https://ghe.example.com/lanl/Py-CGAD/")
+    assert github.requests[("POST", UPLOAD_URL)] == 1
+
+
+def test_failed_replacement_keeps_the_old_asset(
+    github, make_app, tmp_path, monkeypatch
+):
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    names = writeAssets(tmp_path, 1, 10)
+    app.uploadReleaseAssets("v1", names)
+    with open(names[0], "ab") as f:
+        f.write(b"patched")
+
+    # The upload fails part way, leaving an incomplete asset behind
+    upload = app._uploadReleaseAsset
+
+    def failingUpload(release, file_name, name, content_type):
+        upload(release, file_name, name, content_type)
+        raise Exception("Unable to upload " + file_name)
+
+    monkeypatch.setattr(app, "_uploadReleaseAsset", failingUpload)
+    with pytest.raises(Exception, match="Unable to upload"):
+        app.uploadReleaseAssets("v1", names)
+    monkeypatch.undo()
+    assert [asset["name"] for asset in repo.releases[0]["assets"]] == [
+        "asset-0.whl",
+        "asset-0.whl.uploading",
+    ]
+    assert repo.releases[0]["assets"][0]["content"] == bytes([0]) * 10
+    assert github.requests[("DELETE", DELETE_URL)] == 0
+
+    app.uploadReleaseAssets("v1", names)
+    assets = repo.releases[0]["assets"]
+    assert [asset["name"] for asset in assets] == ["asset-0.whl"]
+    assert assets[0]["content"].endswith(b"patched")
+
+
+def test_assets_without_digests(github, make_app, tmp_path):
+    github.asset_digests = False
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    names = writeAssets(tmp_path, 2, 10)
+    # Files last modified before the upload are considered current
+    for name in names:
+        os.utime(name, (0, 0))
+    app.uploadReleaseAssets("v1", names)
+
+    # A change of the same size is detected from the modification time
+    with open(names[1], "r+b") as f:
+        f.write(b"changed")
+    app.uploadReleaseAssets("v1", names)
+    assert github.requests[("POST", UPLOAD_URL)] == 3
+    contents = {asset["name"]: asset["content"] for asset in repo.releases[0]["assets"]}
+    assert contents["asset-1.whl"].startswith(b"changed")
@@ -0,0 +1,188 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from py_cgad.githubapp import GitHubApp
+from py_cgad.retry import CircuitBreaker, CircuitOpenError, RequestError, RetryPolicy
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first server.failures requests with server.failure_status."""
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self.server.requests.append(self.command)
+        if len(self.server.requests) <= self.server.failures:
+            status = self.server.failure_status
+        else:
+            status = 200
+        body = json.dumps({"attempt": len(self.server.requests)}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    server = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.requests = []
+    server.failures = 2
+    server.failure_status = 502
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return GitHubApp(
+        38,
+        "test-app",
+        "user",
+        "retry-repo",
+        retry_policy=RetryPolicy(sleep=lambda seconds: None, connect_timeout=2),
+        circuit_breaker=CircuitBreaker(failure_threshold=3),
+        config_dir=str(tmp_path),
+    )
+
+
+def test_policy_retries_idempotent_statuses():
+    waits = []
+    policy = RetryPolicy(max_attempts=3, sleep=waits.append, rand=lambda: 1.0)
+    statuses = iter([503, 502, 200])
+    result, retries = policy.execute(lambda: (next(statuses), {}), True)
+    assert result[0] == 200
+    assert retries == 2
+    assert waits == [0.5, 1.0]
+
+    statuses = iter([503, 503, 503, 200])
+    result, retries = policy.execute(lambda: (next(statuses), {}), True)
+    assert result[0] == 503
+    assert retries == 2
+
+
+def test_policy_non_idempotent():
+    waits = []
+    policy = RetryPolicy(sleep=waits.append)
+    statuses = iter([502, 200])
+    result, retries = policy.execute(lambda: (next(statuses), {}), False)
+    assert result[0] == 502
+    assert retries == 0
+
+    # Rate limited requests were not processed and honor Retry-After
+    statuses = iter([429, 200])
+    result, retries = policy.execute(
+        lambda: (next(statuses), {"retry-after": "3"}), False
+    )
+    assert result[0] == 200
+    assert waits == [3.0]
+
+    def refused():
+        raise RequestError("Connection refused", 7, sent=False)
+
+    def reset():
+        raise RequestError("Connection reset", 56, sent=True)
+
+    with pytest.raises(RequestError):
+        policy.execute(reset, False)
+    calls = []
+
+    def refusedOnce():
+        calls.append(1)
+        if len(calls) == 1:
+            refused()
+        return 200, {}
+
+    assert policy.execute(refusedOnce, False) == ((200, {}), 1)
+
+
+def test_is_idempotent():
+    assert RetryPolicy.isIdempotent("GET")
+    assert RetryPolicy.isIdempotent("PUT", {"content": "", "sha": "abc"})
+    assert not RetryPolicy.isIdempotent("PUT", {"content": ""})
+    assert not RetryPolicy.isIdempotent("POST", {"sha": "abc"})
+
+
+def test_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+    )
+    breaker.recordFailure()
+    assert breaker.state == "closed"
+    breaker.recordFailure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+    now[0] = 10.0
+    assert breaker.state == "half-open"
+    breaker.before()
+    # Only a single trial request is let through
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.recordFailure()
+    assert breaker.state == "open"
+
+    now[0] = 20.0
+    breaker.before()
+    breaker.recordSuccess()
+    assert breaker.state == "closed"
+
+
+def test_pycurl_retries_flaky_get(app, flaky_server):
+    url = "http://127.0.0.1:%d/repos" % flaky_server.server_port
+    js_obj, code = app._PYCURL([], url)
+    assert code == 200
+    assert js_obj == {"attempt": 3}
+    assert flaky_server.requests == ["GET", "GET", "GET"]
+    assert app.metrics.summary()["requests"][0]["retries"] == 2
+
+
+def test_pycurl_does_not_retry_post(app, flaky_server):
+    url = "http://127.0.0.1:%d/repos" % flaky_server.server_port
+    js_obj, code = app._PYCURL([], url, "POST", {"name": "branch"})
+    assert code == 502
+    assert flaky_server.requests == ["POST"]
+
+    # Requests known to be safe to repeat can opt in
+    js_obj, code = app._PYCURL([], url, "POST", {"name": "branch"}, idempotent=True)
+    assert code == 200
+    assert flaky_server.requests == ["POST", "POST", "POST"]
+
+
+def test_pycurl_circuit_opens(app, flaky_server):
+    flaky_server.failures = 100
+    url = "http://127.0.0.1:%d/repos" % flaky_server.server_port
+    # The circuit opens after the third failure, before the last retry
+    with pytest.raises(CircuitOpenError):
+        app._PYCURL([], url)
+    assert len(flaky_server.requests) == 3
+    with pytest.raises(CircuitOpenError):
+        app._PYCURL([], url)
+    assert len(flaky_server.requests) == 3
+    assert app.metrics.summary()["requests"][0]["status"] == "error"
+
+
+def test_pycurl_logs_errors_without_printing(app, flaky_server, capsys, caplog):
+    flaky_server.failures = 1
+    url = "http://127.0.0.1:%d/repos" % flaky_server.server_port
+    js_obj, code = app._PYCURL([], url, "POST", {"name": "branch"})
+    assert code == 502
+    assert "POST /repos returned code 502" in caplog.text
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,84 @@
+import multiprocessing
+
+import pytest
+
+from py_cgad.snapshot import TreeSnapshot
+
+
+def lookup(args):
+    file_path, path = args
+    with TreeSnapshot.open(file_path) as snapshot:
+        return snapshot.getSha(path)
+
+
+def test_snapshot(sample_tree):
+    root = sample_tree
+    # Sorts between bin and bin/ so the children of bin are not contiguous
+    root.insert("bin-x", "file", "7" * 40)
+    snapshot = TreeSnapshot.fromNode(root)
+    assert len(snapshot) == 7
+    assert snapshot.exists("./bin/lib/common.py")
+    assert snapshot.exists("")
+    assert not snapshot.exists("bin/missing.py")
+    assert snapshot.type("bin/lib") == "dir"
+    assert snapshot.type("logo.png") == "misc"
+    assert snapshot.getSha("/bin/run.sh") == "3" * 40
+    assert snapshot.getSha("bin/missing.py") is None
+
+    assert [entry[0] for entry in snapshot.listDir()] == [
+        "./README.md",
+        "./bin",
+        "./bin-x",
+        "./logo.png",
+    ]
+    assert snapshot.listDir("bin") == [
+        ("./bin/lib", "dir", "4" * 40),
+        ("./bin/run.sh", "file", "3" * 40),
+    ]
+    assert [entry[0] for entry in snapshot.walk("bin")] == [
+        "./bin/lib",
+        "./bin/lib/common.py",
+        "./bin/run.sh",
+    ]
+    assert sorted(snapshot.walk()) == sorted(root.walk())
+
+
+def test_snapshot_rejects_long_shas():
+    with pytest.raises(Exception, match="not 40 hex characters"):
+        TreeSnapshot.pack([("README.md", "file", "1" * 64)])
+    with pytest.raises(Exception, match="not 40 hex characters"):
+        TreeSnapshot.pack([("README.md", "file", "z" * 40)])
+
+
+def test_snapshot_file_shared_with_workers(tmp_path, sample_tree):
+    file_path = str(tmp_path / "tree.snapshot")
+    TreeSnapshot.fromNode(sample_tree).save(file_path)
+    with multiprocessing.Pool(2) as pool:
+        shas = pool.map(
+            lookup, [(file_path, "bin/lib/common.py"), (file_path, "README.md")]
+        )
+    assert shas == ["5" * 40, "1" * 40]
+
+
+def test_snapshot_in_shared_memory(sample_tree):
+    pytest.importorskip("multiprocessing.shared_memory")
+    memory = TreeSnapshot.fromNode(sample_tree).toSharedMemory()
+    try:
+        with TreeSnapshot.attach(memory.name) as snapshot:
+            assert snapshot.getSha("bin/run.sh") == "3" * 40
+            assert len(snapshot.listDir("bin")) == 2
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def test_refresh_keeps_tree_on_failure(github, make_app, tmp_path):
+    app = make_app(github)
+    tree = app.getBranchTree("master")
+    with pytest.raises(Exception, match="Branch missing"):
+        app.refreshBranchTreeCache("missing")
+    assert app.getBranchTree("master") is tree
+
+    snapshot = app.snapshotBranchTree("master", str(tmp_path / "master.snapshot"))
+    assert snapshot.getSha("bin/run.sh") == tree.getSha("bin/run.sh")
+    snapshot.close()
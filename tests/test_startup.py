@@ -0,0 +1,83 @@
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from py_cgad.fakegithub import FakeGitHub
+from py_cgad.githubapp import GitHubApp
+
+HEAVY_MODULES = ["git", "jwt", "pem", "pycurl", "validators"]
+
+
+def test_import_is_lazy():
+    code = (
+        "import sys, py_cgad.githubapp\n"
+        "print(' '.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.stdout.decode().strip() == ""
+
+
+def test_construction_has_no_side_effects(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config_dir = tmp_path / "config"
+    apps = [
+        GitHubApp(40, "test-app", "lanl", "startup-repo", config_dir=str(config_dir))
+        for _ in range(3)
+    ]
+    assert os.listdir(str(tmp_path)) == []
+    # Handlers are only attached once however many apps are created
+    log = logging.getLogger("startup-repo")
+    assert len(log.handlers) == 1
+    assert apps[0]._log is log
+
+    log_file = tmp_path / "startup.log"
+    GitHubApp(40, "test-app", "lanl", "startup-repo", log_file=str(log_file))
+    GitHubApp(40, "test-app", "lanl", "startup-repo", log_file=str(log_file))
+    assert len(log.handlers) == 2
+    assert not log_file.exists()
+    log.info("first record")
+    assert log_file.read_text() == "first record\n"
+
+
+def test_authentication_is_deferred(tmp_path, monkeypatch, pem_file):
+    monkeypatch.chdir(tmp_path)
+    github = FakeGitHub()
+    github.createRepo("lanl", "startup-repo")
+    app = GitHubApp(
+        40,
+        "test-app",
+        "lanl",
+        "startup-repo",
+        transport=github,
+        config_dir=str(tmp_path / "config"),
+    )
+    app.initialize(pem_file, path_to_repo=str(tmp_path))
+    assert sum(github.requests.values()) == 0
+    assert (tmp_path / "config" / "githubapp_40.config").read_text() == str(tmp_path)
+
+    assert app.default_branch == "master"
+    assert github.requests[("GET", "/app/installations")] == 1
+    assert app.branches == ["master"]
+    assert github.requests[("GET", "/app/installations")] == 1
+
+    # The stored repository path is used when none is provided
+    app.initialize(pem_file)
+    assert app._repo_path == str(tmp_path)
+
+
+def test_initialize_requires_a_repository_path(tmp_path, pem_file):
+    app = GitHubApp(
+        40, "test-app", "lanl", "startup-repo", config_dir=str(tmp_path / "config")
+    )
+    with pytest.raises(Exception, match="No repository path is known"):
+        app.initialize(pem_file)
+    with pytest.raises(Exception, match="repository path is not valid"):
+        app.initialize(pem_file, path_to_repo=str(tmp_path / "missing"))
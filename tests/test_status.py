@@ -0,0 +1,164 @@
+from py_cgad import githubapp
+
+STATUS_URL = "/repos/{owner}/{repo}/commits/{sha}/status"
+POST_URL = "/repos/{owner}/{repo}/statuses/{sha}"
+
+
+def test_state_by_context(github, make_app):
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    app.postStatus("pending", sha, context="ci/build")
+    app.postStatus("success", sha, context="ci/build")
+    app.postStatus("failure", sha, context="ci/lint")
+
+    state, code, _ = app.getState(sha, context="ci/build")
+    assert (state, code) == ("success", 200)
+    # Revalidated with a 304, which is reported as a 200
+    assert app.getState(sha, context="ci/lint")[:2] == ("failure", 200)
+    # The second ci/build status was revalidated before it was posted
+    assert github.requests[("GET", STATUS_URL)] == 3
+    assert app.getState(sha, context="ci/lint", refresh=False)[0] == "failure"
+    assert github.requests[("GET", STATUS_URL)] == 3
+
+    statuses = app.getCombinedStatus(sha)
+    assert sorted(statuses) == ["ci/build", "ci/lint"]
+    # The index based lookup still walks every status
+    assert app.getState(sha, index=2)[0] == "pending"
+
+
+def test_unchanged_status_is_not_posted(github, make_app):
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    app.postStatus("pending", sha, context="ci", description="Building")
+    app.postStatus("pending", sha, context="ci", description="Building")
+    assert github.requests[("POST", POST_URL)] == 1
+    app.postStatus("pending", sha, context="ci", description="Testing")
+    app.postStatus("pending", sha, context="ci", description="Testing", force=True)
+    assert github.requests[("POST", POST_URL)] == 3
+
+
+def test_status_changed_by_others_is_posted(github, make_app):
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    sha = repo.refs["master"]
+    app.postStatus("success", sha, context="ci")
+    app.getCombinedStatus(sha)
+    # Someone else changes the status of the context
+    repo._postStatus(sha, {"state": "failure", "context": "ci"})
+
+    app.postStatus("success", sha, context="ci")
+    assert github.requests[("POST", POST_URL)] == 2
+    assert app.getState(sha, context="ci")[0] == "success"
+
+
+def test_many_contexts_and_status_events(github, make_app):
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    sha = repo.refs["master"]
+    for index in range(150):
+        repo._postStatus(sha, {"state": "success", "context": "job/%d" % index})
+    assert len(app.getCombinedStatus(sha)) == 150
+
+    app.applyWebhookEvent(
+        "status",
+        {
+            "sha": sha,
+            "state": "failure",
+            "context": "job/7",
+            "updated_at": "2030-01-01T00:00:00Z",
+            "repository": {"full_name": "lanl/Py-CGAD"},
+        },
+    )
+    requests = sum(github.requests.values())
+    assert app.getState(sha, context="job/7", refresh=False)[0] == "failure"
+    assert sum(github.requests.values()) == requests
+
+
+class FakeClock:
+    """Stands in for the time module, sleeping runs the events that are due."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.events = []
+
+    def at(self, when, event):
+        self.events.append((when, event))
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1e9 + self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        for when, event in list(self.events):
+            if when <= self.now:
+                self.events.remove((when, event))
+                event()
+
+
+def test_wait_for_states(github, make_app, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(githubapp, "time", clock)
+    app = make_app(github)
+    repo = github.repo("lanl", "Py-CGAD")
+    first = repo.refs["master"]
+    second = repo.commitFiles({"b.txt": "b"}, "master", "Second")
+    repo._postStatus(first, {"state": "pending", "context": "ci/build"})
+    clock.at(
+        20, lambda: repo._postStatus(first, {"state": "success", "context": "ci/build"})
+    )
+    clock.at(
+        45, lambda: repo._postStatus(first, {"state": "error", "context": "ci/lint"})
+    )
+    clock.at(
+        30,
+        lambda: repo._postStatus(second, {"state": "failure", "context": "ci/build"}),
+    )
+
+    states = app.waitForStates(
+        [(first, "ci/build"), (first, "ci/lint"), (second, "ci/build")],
+        target_states="success",
+        timeout=300,
+    )
+    assert states == {
+        (first, "ci/build"): "success",
+        (first, "ci/lint"): "error",
+        (second, "ci/build"): "failure",
+    }
+    assert clock.now < 60
+    # Polling slows down while nothing changes
+    assert max(clock.sleeps) > 1.0
+    # Both contexts on the first commit share a single poll
+    assert github.requests[("GET", STATUS_URL)] < 30
+
+
+def test_wait_for_state_times_out(github, make_app, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(githubapp, "time", clock)
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    app.postStatus("pending", sha, context="ci")
+
+    assert app.waitForState(sha, "ci", timeout=120, max_interval=10.0) == "pending"
+    assert app.waitForState(sha, "other", timeout=5) is None
+    assert clock.now <= 130
+    assert max(clock.sleeps) <= 10.0
+
+
+def test_wait_honors_rate_limit(github, make_app, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(githubapp, "time", clock)
+    app = make_app(github)
+    sha = github.repo("lanl", "Py-CGAD").refs["master"]
+    app.postStatus("pending", sha, context="ci")
+    # 10 requests left for the next 100 seconds
+    github.rate_limit = github._used + 10
+    github.rate_limit_reset = clock.time() + 100
+    app.getState(sha, context="ci")
+
+    app.waitForState(sha, "ci", timeout=60)
+    assert min(clock.sleeps) >= 9.0
@@ -0,0 +1,82 @@
+import json
+
+from py_cgad.tracing import (
+    NULL_SPAN,
+    ChromeTraceExporter,
+    OTLPExporter,
+    Tracer,
+    traced,
+)
+
+
+class TracedObject:
+    def __init__(self, tracer=None):
+        self._tracer = tracer
+
+    @traced
+    def outer(self):
+        return self.inner()
+
+    @traced
+    def inner(self):
+        return 42
+
+
+def test_traced_disabled():
+    obj = TracedObject()
+    assert obj.outer() == 42
+    with NULL_SPAN as span:
+        span.setAttribute("ignored", True)
+
+
+def test_nested_spans(tmp_path):
+    trace_file = tmp_path / "trace.json"
+    tracer = Tracer([ChromeTraceExporter(str(trace_file))])
+    obj = TracedObject(tracer)
+    assert obj.outer() == 42
+
+    spans = tracer.flush()
+    assert len(spans) == 2
+    inner, outer = spans
+    assert inner.name == "GitHubApp.inner"
+    assert outer.name == "GitHubApp.outer"
+    assert inner.parent_id == outer.span_id
+    assert inner.trace_id == outer.trace_id
+    assert outer.parent_id is None
+    assert tracer.finished_spans == []
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert [event["name"] for event in events] == ["GitHubApp.inner", "GitHubApp.outer"]
+    assert all(event["ph"] == "X" for event in events)
+
+
+def test_span_error_and_otlp_payload():
+    tracer = Tracer()
+    try:
+        with tracer.span("failing", path="./bin"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    spans = tracer.flush()
+    assert spans[0].error == "boom"
+
+    payload = OTLPExporter().payload(spans)
+    otlp_span = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert otlp_span["name"] == "failing"
+    assert otlp_span["status"]["code"] == 2
+    assert otlp_span["attributes"] == [
+        {"key": "path", "value": {"stringValue": "./bin"}}
+    ]
+    assert "parentSpanId" not in otlp_span
+
+
+def test_public_app_methods_are_traced(github, make_app):
+    app = make_app(github)
+    tracer = Tracer()
+    app.setTracer(tracer)
+    app.getBranchTree("master")
+
+    spans = {span.name: span for span in tracer.flush()}
+    tree_span = spans["GitHubApp.getBranchTree"]
+    assert tree_span.parent_id is None
+    assert spans["GitHubApp.refreshBranchTreeCache"].parent_id == tree_span.span_id
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from py_cgad.fakegithub import FakeGitHub
+from py_cgad.githubapp import GitHubApp
+from py_cgad.webhook import WebhookServer, postPayload, signPayload, verifySignature
+
+PAYLOAD_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "webhooks"
+)
+
+
+def loadPayload(name):
+    with open(os.path.join(PAYLOAD_DIR, name + ".json"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, pem_file):
+    monkeypatch.chdir(tmp_path)
+    github = FakeGitHub()
+    github.createRepo("lanl", "Py-CGAD").commitFiles({"README.md": "# Py-CGAD"})
+    app = GitHubApp(
+        41, "test-app", "lanl", "Py-CGAD", transport=github, config_dir=str(tmp_path)
+    )
+    app.initialize(pem_file, path_to_repo=str(tmp_path))
+    return app
+
+
+def test_verify_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    headers = {"x-hub-signature-256": signPayload("secret", body)}
+    assert verifySignature("secret", body, headers)
+    assert not verifySignature("other", body, headers)
+    assert not verifySignature("secret", body + b" ", headers)
+    assert not verifySignature("secret", body, {})
+
+
+def test_events_patch_caches(app):
+    github = app._transport
+    events = []
+
+    async def scenario():
+        server = WebhookServer(app, secret="secret", port=0, workers=2)
+        server.on("*", lambda event: events.append((event.name, event.action)))
+        await server.start()
+        url = "http://127.0.0.1:%d/" % server.port
+        loop = asyncio.get_event_loop()
+
+        def post(event, name, secret="secret"):
+            return loop.run_in_executor(
+                None, postPayload, url, event, loadPayload(name), secret
+            )
+
+        assert app.branches == ["master"]
+        assert app.getBranchMergingWith("feature") is None
+        app.getBranchTree("master")
+        requests = sum(github.requests.values())
+
+        assert await post("push", "push", secret="wrong") == 401
+        assert await post("push", "push") == 202
+        assert await post("pull_request", "pull_request_opened") == 202
+        await server._queue.join()
+
+        assert app.branches == ["master", "feature"]
+        assert app.getLatestCommitSha("feature") == (
+            "6113728f27ae82c7b1a177c8d03f9e96e0adf246"
+        )
+        assert app.getBranchMergingWith("feature") == "master"
+        # Both answers come from the patched caches
+        assert sum(github.requests.values()) == requests
+
+        assert await post("pull_request", "pull_request_closed") == 202
+        await server.stop()
+        assert app.getBranchMergingWith("feature") is None
+
+    asyncio.run(scenario())
+    assert sorted(events) == [
+        ("pull_request", "closed"),
+        ("pull_request", "opened"),
+        ("push", None),
+    ]
+
+
+def test_full_queue_is_rejected():
+    received = []
+
+    async def scenario():
+        server = WebhookServer(port=0, max_queue=1, workers=0, allow_unsigned=True)
+        await server.start()
+        url = "http://127.0.0.1:%d/" % server.port
+        loop = asyncio.get_event_loop()
+        body = json.dumps({"zen": "Design for failure."})
+        for _ in range(2):
+            received.append(
+                await loop.run_in_executor(None, postPayload, url, "status", body)
+            )
+        received.append(
+            await loop.run_in_executor(None, postPayload, url + "other", "status", body)
+        )
+        server._server.close()
+
+    asyncio.run(scenario())
+    assert received == [202, 503, 404]
+
+
+def test_secret_is_required():
+    with pytest.raises(Exception, match="secret is required"):
+        WebhookServer(port=0)
+
+
+def test_malformed_content_length_is_rejected():
+    async def scenario():
+        server = WebhookServer(secret="secret", port=0)
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(
+            b"POST / HTTP/1.1\r\nContent-Length: ten\r\nX-GitHub-Event: ping\r\n\r\n"
+        )
+        response = await reader.read()
+        writer.close()
+        await server.stop()
+        return response
+
+    response = asyncio.run(scenario())
+    assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"Content-Length is not valid" in response
@@ -0,0 +1,181 @@
+import git
+import pytest
+
+
+def commitToRemote(remote, tmp_path, files, message):
+    """Commit files to the master branch of remote from a separate clone."""
+    work = tmp_path / "other"
+    if work.exists():
+        repo = git.Repo(str(work))
+        repo.git.pull("-q", "origin", "master")
+    else:
+        repo = git.Repo.clone_from(remote, str(work))
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "other")
+        config.set_value("user", "email", "other@example.com")
+    for name, content in files.items():
+        (work / name).write_text(content)
+    repo.index.add(list(files))
+    repo.index.commit(message)
+    repo.git.push("-q", "origin", "HEAD:refs/heads/master")
+    return repo.head.commit.hexsha
+
+
+@pytest.fixture
+def wiki(tmp_path, github, make_app):
+    """An app whose wiki remote is a local bare repository."""
+    remote_path = tmp_path / "Py-CGAD.wiki.git"
+    remote = git.Repo.init(str(remote_path), bare=True)
+    remote.git.config("uploadpack.allowFilter", "true")
+    remote_url = "file://" + str(remote_path)
+    commitToRemote(remote_url, tmp_path, {"Home.md": "# Home"}, "Initial commit")
+
+    app = make_app(github)
+    app._app_wiki_dir = str(tmp_path / "Py-CGAD.wiki")
+    app._wikiRemoteUrl = lambda: remote_url
+    return app, remote_url
+
+
+def countFetches(monkeypatch, repo):
+    """Wrap the fetch command of repo and return the list of calls to it."""
+    calls = []
+
+    def fetch(git_cmd, *args, **kwargs):
+        if git_cmd.working_dir == repo.working_dir:
+            calls.append(args)
+        return git_cmd._call_process("fetch", *args, **kwargs)
+
+    monkeypatch.setattr(git.Git, "fetch", fetch, raising=False)
+    return calls
+
+
+def test_clone_is_shallow_and_skips_unchanged_remote(wiki, tmp_path, monkeypatch):
+    app, remote_url = wiki
+    repo = app.cloneWikiRepo()
+    assert repo.git.rev_parse("--is-shallow-repository") == "true"
+    assert (tmp_path / "Py-CGAD.wiki" / "Home.md").read_text() == "# Home"
+
+    fetches = countFetches(monkeypatch, repo)
+    assert app.cloneWikiRepo() is repo
+    assert fetches == []
+
+    head = commitToRemote(remote_url, tmp_path, {"Page.md": "page"}, "Add page")
+    app.cloneWikiRepo()
+    assert len(fetches) == 1
+    assert repo.head.commit.hexsha == head
+
+
+def test_clone_updates_remote_when_token_changes(wiki, tmp_path):
+    app, remote_url = wiki
+    repo = app.cloneWikiRepo()
+    # The same repository reached through a different url, as with a new token
+    new_url = remote_url[len("file://") :]
+    app._wikiRemoteUrl = lambda: new_url
+    app.cloneWikiRepo()
+    assert repo.git.remote("get-url", "origin") == new_url
+
+
+def test_publish_files_in_one_commit(wiki, tmp_path):
+    app, remote_url = wiki
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "Home.md").write_text("# Home")
+    (docs / "Results.md").write_text("results")
+    (docs / "Plots.md").write_text("plots")
+    files = [str(docs / name) for name in ["Home.md", "Results.md", "Plots.md"]]
+
+    assert app.publishWikiFiles(files) == ["Results.md", "Plots.md"]
+    remote = git.Repo(remote_url[len("file://") :])
+    assert remote.head.commit.message == "test-app adding 2 and updating 0 wiki files"
+    assert remote.head.commit.tree["Results.md"].data_stream.read() == b"results"
+
+    # Unchanged files are not committed again
+    head = remote.head.commit.hexsha
+    assert app.publishWikiFiles(files) == []
+    assert remote.head.commit.hexsha == head
+
+
+def test_publish_rejects_files_with_the_same_name(wiki, tmp_path):
+    app, _ = wiki
+    for folder in ["a", "b"]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "Page.md").write_text(folder)
+    with pytest.raises(Exception, match="same name Page.md in the wiki"):
+        app.publishWikiFiles(
+            [str(tmp_path / "a" / "Page.md"), str(tmp_path / "b" / "Page.md")]
+        )
+    # The same file listed twice is only published once
+    page = str(tmp_path / "a" / "Page.md")
+    assert app.publishWikiFiles([page, page]) == ["Page.md"]
+
+
+def concurrentCommit(monkeypatch, app, remote_url, tmp_path, count):
+    """Make the remote move on before each of the next count wiki pushes."""
+    pages = iter(range(count))
+
+    def push(git_cmd, *args, **kwargs):
+        if git_cmd.working_dir == app._app_wiki_dir:
+            page = next(pages, None)
+            if page is not None:
+                commitToRemote(
+                    remote_url, tmp_path, {"Other%d.md" % page: "other"}, "Other"
+                )
+        return git_cmd._call_process("push", *args, **kwargs)
+
+    monkeypatch.setattr(git.Git, "push", push, raising=False)
+
+
+def test_publish_rebases_when_the_remote_moves(wiki, tmp_path, monkeypatch):
+    app, remote_url = wiki
+    concurrentCommit(monkeypatch, app, remote_url, tmp_path, 1)
+    page = tmp_path / "Page.md"
+    page.write_text("page")
+
+    assert app.publishWikiFiles([str(page)]) == ["Page.md"]
+    remote = git.Repo(remote_url[len("file://") :])
+    assert sorted(blob.name for blob in remote.head.commit.tree.blobs) == [
+        "Home.md",
+        "Other0.md",
+        "Page.md",
+    ]
+
+
+def test_publish_retries_after_the_remote_edits_a_page(wiki, tmp_path, monkeypatch):
+    app, remote_url = wiki
+    app.cloneWikiRepo()
+    commitToRemote(remote_url, tmp_path, {"Home.md": "# New home"}, "Edit home")
+    concurrentCommit(monkeypatch, app, remote_url, tmp_path, 1)
+    page = tmp_path / "Page.md"
+    page.write_text("page")
+
+    assert app.publishWikiFiles([str(page)]) == ["Page.md"]
+    remote = git.Repo(remote_url[len("file://") :])
+    tree = remote.head.commit.tree
+    assert sorted(blob.name for blob in tree.blobs) == [
+        "Home.md",
+        "Other0.md",
+        "Page.md",
+    ]
+    # The stale copy of the edited page in the worktree is not committed
+    assert tree["Home.md"].data_stream.read() == b"# New home"
+
+
+def test_publish_gives_up_after_max_attempts(wiki, tmp_path, monkeypatch):
+    app, remote_url = wiki
+    concurrentCommit(monkeypatch, app, remote_url, tmp_path, 2)
+    page = tmp_path / "Page.md"
+    page.write_text("page")
+
+    with pytest.raises(git.GitCommandError):
+        app.publishWikiFiles([str(page)], max_attempts=2)
+    remote = git.Repo(remote_url[len("file://") :])
+    assert "Page.md" not in remote.head.commit.tree
+
+
+def test_publish_without_hashing_files(wiki, tmp_path):
+    app, _ = wiki
+    # Nothing to compare against, so the blob sha cache is never created
+    assert app.publishWikiFiles([]) == []
+    page = tmp_path / "New.md"
+    page.write_text("new")
+    assert app.publishWikiFiles([str(page)]) == ["New.md"]